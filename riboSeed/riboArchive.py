@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""
+Pack the per-cluster mapping and assembly directories of a finished
+riboSeed iteration into a single zip archive, so a run leaves a handful
+of files behind instead of thousands.  Each archive has a manifest.json
+listing, for every directory packed, its cluster, iteration, and kind
+(mapping or assembly), and the files it held (paths are relative to the
+riboSeed output directory).  Zip keeps a central index, so single files
+can be read or extracted without unpacking the rest.
+
+Files that later stages still need (the first seed, the latest contigs)
+are archived too, but also left where they are.
+
+USAGE:
+ $ riboArchive.py list riboSeed_out/intermediates/iteration_1.zip
+ $ riboArchive.py extract riboSeed_out/intermediates/iteration_1.zip \
+     --cluster 3 -o ./cluster_3_iteration_1
+"""
+
+import argparse
+import sys
+import os
+import json
+import zipfile
+import traceback
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+MANIFEST = "manifest.json"
+# already compressed; deflating them again just costs time
+STORED_EXTENSIONS = [".bam", ".bai", ".gz", ".zip", ".mmi"]
+
+# --------------------------- methods --------------------------- #
+
+
+def get_args():  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="List or extract the intermediate files archived by " +
+        "riboSeed's --archive_intermediates",
+        add_help=False)  # to allow for custom help
+    parser.add_argument("command", choices=["list", "extract"],
+                        help="list the archived directories and files, " +
+                        "or extract them")
+    parser.add_argument("archive", help="an iteration's archive")
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("-c", "--cluster", dest='cluster', action="store",
+                          help="only this cluster; default: %(default)s",
+                          type=int, default=None)
+    optional.add_argument("-k", "--kind", dest='kind', action="store",
+                          choices=["mapping", "assembly"],
+                          help="only mapping or assembly directories; " +
+                          "default: %(default)s",
+                          type=str, default=None)
+    optional.add_argument("-o", "--output", dest='output', action="store",
+                          help="directory to extract to; " +
+                          "default: %(default)s",
+                          type=str, default=os.getcwd())
+    optional.add_argument("-h", "--help",
+                          action="help", default=argparse.SUPPRESS,
+                          help="Displays this help message")
+    args = parser.parse_args()
+    return args
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def archive_directories(archive_path, root, dirs, keep=(), logger=None):
+    """ pack dirs, a list of (cluster index, iteration, kind, path) tuples,
+    into a zip at archive_path, with paths relative to root, and then
+    delete them, except for any files in keep.  The archive is written
+    under a temporary name and only renamed once it is complete, so
+    nothing is deleted unless it was archived.
+    returns the manifest
+    """
+    assert logger is not None, "must use logging"
+    keep = set([os.path.abspath(x) for x in keep if x is not None])
+    manifest = {"root": os.path.abspath(root), "directories": []}
+    tmp_path = archive_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zf:
+        for index, iteration, kind, path in dirs:
+            entry = {"cluster": index, "iteration": iteration, "kind": kind,
+                     "path": os.path.relpath(path, root), "files": []}
+            for dirpath, dirnames, files in os.walk(path):
+                for f in sorted(files):
+                    full = os.path.join(dirpath, f)
+                    arcname = os.path.relpath(full, root)
+                    compress = zipfile.ZIP_STORED if \
+                        os.path.splitext(f)[1] in STORED_EXTENSIONS else \
+                        zipfile.ZIP_DEFLATED
+                    zf.write(full, arcname, compress_type=compress)
+                    entry["files"].append(arcname)
+            manifest["directories"].append(entry)
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=1))
+    os.replace(tmp_path, archive_path)
+    nfiles = sum([len(x["files"]) for x in manifest["directories"]])
+    logger.info("archived %i files from %i directories to %s", nfiles,
+                len(dirs), archive_path)
+    for index, iteration, kind, path in dirs:
+        remove_except(path, keep)
+    return manifest
+
+
+def remove_except(path, keep):
+    """ delete a directory tree, but leave the files in keep (and the
+    directories holding them)
+    """
+    for dirpath, dirnames, files in os.walk(path, topdown=False):
+        for f in files:
+            full = os.path.abspath(os.path.join(dirpath, f))
+            if full not in keep:
+                os.unlink(full)
+        for d in dirnames:
+            full = os.path.join(dirpath, d)
+            if os.path.islink(full):
+                os.unlink(full)
+            elif os.path.isdir(full) and len(os.listdir(full)) == 0:
+                os.rmdir(full)
+    if os.path.isdir(path) and len(os.listdir(path)) == 0:
+        os.rmdir(path)
+
+
+class IntermediateArchive(object):
+    """ read access to an archive made by archive_directories
+    """
+    def __init__(self, path):
+        self.path = path
+        self.zf = zipfile.ZipFile(path, "r")
+        self.manifest = json.loads(self.zf.read(MANIFEST).decode("utf-8"))
+
+    def directories(self, cluster=None, kind=None):
+        return [x for x in self.manifest["directories"] if
+                (cluster is None or x["cluster"] == cluster) and
+                (kind is None or x["kind"] == kind)]
+
+    def files(self, cluster=None, kind=None):
+        return [f for x in self.directories(cluster=cluster, kind=kind)
+                for f in x["files"]]
+
+    def open(self, name):
+        """ a binary file object for one archived file, given its path
+        relative to the riboSeed output directory
+        """
+        return self.zf.open(name, "r")
+
+    def extract(self, outdir, cluster=None, kind=None):
+        """ extract (some of) the archived files below outdir, keeping
+        their paths; returns the extracted paths
+        """
+        return [self.zf.extract(f, outdir) for
+                f in self.files(cluster=cluster, kind=kind)]
+
+    def close(self):
+        self.zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    try:
+        with IntermediateArchive(args.archive) as archive:
+            if args.command == "list":
+                for entry in archive.directories(cluster=args.cluster,
+                                                 kind=args.kind):
+                    print("\t".join([str(entry["cluster"]),
+                                     str(entry["iteration"]), entry["kind"],
+                                     entry["path"],
+                                     str(len(entry["files"]))]))
+                    for f in entry["files"]:
+                        print("\t" + f)
+            else:
+                extracted = archive.extract(
+                    os.path.abspath(os.path.expanduser(args.output)),
+                    cluster=args.cluster, kind=args.kind)
+                print("extracted %i files" % len(extracted))
+    except Exception as e:
+        sys.stderr.write(last_exception())
+        sys.exit(1)
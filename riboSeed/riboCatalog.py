@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""
+A SQLite catalog of riboSeed runs.  Cataloguing is opt-in: a riboSeed
+run given --catalog (or run with RIBOSEED_CATALOG set) adds a row to the
+runs table, and a row to the records table for each thing it measures
+along the way: the mapping of each iteration, the flanking depths,
+subassembly and evaluation of each cluster, and the final assemblies.
+The final assembly statistics (and QUAST comparison, if run) go in the
+assembly_stats table.  The run_records view joins records to their run,
+so questions spanning many runs are a single query.
+
+records columns (empty where they dont apply to a stage):
+  run_id, iteration, cluster, stage, label, elapsed (s), returncode,
+  peak_rss_gb, map_percent, depth_5, depth_3, seed_len, ref_len,
+  contig_len
+
+For the evaluation stage, returncode is the code from
+evaluate_spades_success (0 is good).
+
+A run that exits before it finishes (an error, or sys.exit) is marked
+"failed" rather than left "running".
+
+riboCatalog.py reads the catalog at ~/.riboSeed/run_catalog.sqlite unless
+the RIBOSEED_CATALOG environment variable or --catalog points elsewhere.
+
+USAGE:
+ $ riboCatalog.py runs
+ $ riboCatalog.py stages
+ $ riboCatalog.py iterations -s my_sample
+ $ riboCatalog.py sql "SELECT sample, AVG(elapsed) FROM run_records \
+     WHERE stage = 'subassembly' GROUP BY sample"
+"""
+
+import argparse
+import atexit
+import sys
+import os
+import time
+import uuid
+import sqlite3
+import traceback
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+DEFAULT_CATALOG = os.path.join("~", ".riboSeed", "run_catalog.sqlite")
+
+RECORD_FIELDS = ["run_id", "iteration", "cluster", "stage", "label",
+                 "elapsed", "returncode", "peak_rss_gb", "map_percent",
+                 "depth_5", "depth_3", "seed_len", "ref_len", "contig_len"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY, sample TEXT, reference TEXT,
+    output_root TEXT, version TEXT, command TEXT,
+    started REAL, finished REAL, status TEXT);
+CREATE TABLE IF NOT EXISTS records (
+    run_id TEXT, iteration INTEGER, cluster INTEGER, stage TEXT,
+    label TEXT, elapsed REAL, returncode INTEGER, peak_rss_gb REAL,
+    map_percent REAL, depth_5 REAL, depth_3 REAL, seed_len INTEGER,
+    ref_len INTEGER, contig_len INTEGER);
+CREATE TABLE IF NOT EXISTS assembly_stats (
+    run_id TEXT, assembly TEXT, field TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS records_run ON records (run_id);
+CREATE INDEX IF NOT EXISTS records_stage ON records (stage);
+CREATE VIEW IF NOT EXISTS run_records AS
+    SELECT runs.sample, runs.reference, records.*
+    FROM records JOIN runs USING (run_id);
+"""
+
+# canned queries for the CLI; ? is the sample, or NULL for all samples
+QUERIES = {
+    "runs": """
+        SELECT run_id, sample, reference, status,
+               datetime(started, 'unixepoch') AS started,
+               ROUND((finished - started) / 60.0, 2) AS minutes
+        FROM runs WHERE (?1 IS NULL OR sample = ?1) ORDER BY started""",
+    "stages": """
+        SELECT stage, COUNT(*) AS n,
+               SUM(returncode != 0) AS nonzero_codes,
+               ROUND(AVG(elapsed), 2) AS mean_elapsed,
+               ROUND(MAX(elapsed), 2) AS max_elapsed,
+               ROUND(MAX(peak_rss_gb), 2) AS max_peak_rss_gb
+        FROM run_records WHERE (?1 IS NULL OR sample = ?1)
+        GROUP BY stage ORDER BY stage""",
+    "iterations": """
+        SELECT sample, iteration, COUNT(DISTINCT run_id) AS runs,
+               COUNT(*) AS clusters,
+               SUM(returncode = 0) AS kept,
+               ROUND(AVG(contig_len - ref_len), 1) AS mean_growth,
+               ROUND(AVG(contig_len - seed_len), 1) AS mean_total_growth
+        FROM run_records
+        WHERE stage = 'evaluation' AND (?1 IS NULL OR sample = ?1)
+        GROUP BY sample, iteration ORDER BY sample, iteration"""}
+
+# --------------------------- methods --------------------------- #
+
+
+def get_args():  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Query the catalog of riboSeed runs",
+        add_help=False)  # to allow for custom help
+    parser.add_argument("query",
+                        choices=sorted(QUERIES.keys()) + ["sql"],
+                        help="runs: list runs; stages: time, memory, and " +
+                        "failures by stage; iterations: clusters kept " +
+                        "and contig growth by sample and iteration; " +
+                        "sql: run the SQL statement given as the " +
+                        "next argument")
+    parser.add_argument("statement", nargs="?", default=None,
+                        help="SQL statement, for the sql query")
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("-d", "--catalog", dest='catalog',
+                          action="store",
+                          help="catalog database; default: " +
+                          "$RIBOSEED_CATALOG or " + DEFAULT_CATALOG,
+                          type=str, default=None)
+    optional.add_argument("-s", "--sample", dest='sample', action="store",
+                          help="only report runs with this experiment " +
+                          "name; default: %(default)s",
+                          type=str, default=None)
+    optional.add_argument("-h", "--help",
+                          action="help", default=argparse.SUPPRESS,
+                          help="Displays this help message")
+    args = parser.parse_args()
+    return args
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def default_catalog_path():
+    return os.path.expanduser(os.environ.get("RIBOSEED_CATALOG",
+                                             DEFAULT_CATALOG))
+
+
+def requested_catalog_path(path=None):
+    """ the catalog a riboSeed run should write to: path if given, else
+    $RIBOSEED_CATALOG, else None (dont catalog the run)
+    """
+    if path is None:
+        path = os.environ.get("RIBOSEED_CATALOG") or None
+    if path is None:
+        return None
+    return os.path.expanduser(path)
+
+
+def connect_catalog(path):
+    """ open (creating if needed) a catalog database.  Several runs may
+    write at once, so wait a while for locks rather than failing
+    """
+    dirname = os.path.dirname(path)
+    if dirname != "":
+        os.makedirs(dirname, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class RunCatalog(object):
+    """ collects the records for one run, writing them out with flush().
+    When disabled, nothing is recorded and no database is opened.
+    Failing to write is not an error; the run just goes uncatalogued.
+    Once started, a run that exits without finish_run is marked failed
+    """
+    def __init__(self, path=None, enabled=True, logger=None):
+        self.path = path if path is not None else default_catalog_path()
+        self.enabled = enabled
+        self.logger = logger
+        self.run_id = uuid.uuid4().hex
+        self.pending = []
+        self.pending_stats = []
+        self.finished = False
+
+    def _write(self, func):
+        if not self.enabled:
+            return
+        try:
+            conn = connect_catalog(self.path)
+            try:
+                with conn:
+                    func(conn)
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error):
+            if self.logger:
+                self.logger.warning("could not write to the run catalog %s",
+                                    self.path)
+                self.logger.debug(last_exception())
+            # dont keep trying every iteration
+            self.enabled = False
+
+    def start_run(self, sample, reference, output_root, version, command):
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+            (self.run_id, sample, reference, output_root, version,
+             command, time.time(), "running")))
+        if self.enabled:
+            atexit.register(self.finish_run, status="failed")
+
+    def record(self, stage, iteration=None, cluster=None, **values):
+        """ add a row to the records table (on the next flush);
+        values are any of the other RECORD_FIELDS
+        """
+        if not self.enabled:
+            return
+        for k in values:
+            assert k in RECORD_FIELDS[4:], "unknown catalog field: %s" % k
+        values.update({"run_id": self.run_id, "iteration": iteration,
+                       "cluster": cluster, "stage": stage})
+        self.pending.append(tuple([values.get(x) for x in RECORD_FIELDS]))
+
+    def record_depths(self, iteration, depths):
+        """ depths are (cluster index, 5' depth, 3' depth) tuples, as
+        passed to ClusterRegistry.record_depths
+        """
+        for index, depth5, depth3 in depths:
+            self.record("depth", iteration=iteration, cluster=int(index),
+                        depth_5=float(depth5), depth_3=float(depth3))
+
+    def record_watched(self, stage, results, iteration=None, clusters=None,
+                       labels=None):
+        """ results are dicts from subprocess_run_list_watched, one for
+        each of clusters (indexes) or labels
+        """
+        if clusters is None:
+            clusters = [None for x in results]
+        if labels is None:
+            labels = [None for x in results]
+        for res, index, label in zip(results, clusters, labels):
+            self.record(stage, iteration=iteration, cluster=index,
+                        label=label, elapsed=res["elapsed"],
+                        returncode=res["returncode"],
+                        peak_rss_gb=res["peak_rss"] / 1e9)
+
+    def record_assembly_stats(self, assembly, stats):
+        """ stats is a list of (field, value) tuples, as from
+        riboStats.assembly_stats
+        """
+        if not self.enabled:
+            return
+        self.pending_stats.extend([(self.run_id, assembly, field, str(value))
+                                   for field, value in stats])
+
+    def flush(self):
+        """ write the rows recorded so far
+        """
+        if len(self.pending) == 0 and len(self.pending_stats) == 0:
+            return
+
+        def write(conn):
+            conn.executemany(
+                "INSERT INTO records VALUES (%s)" %
+                ", ".join(["?"] * len(RECORD_FIELDS)), self.pending)
+            conn.executemany("INSERT INTO assembly_stats VALUES " +
+                             "(?, ?, ?, ?)", self.pending_stats)
+        self._write(write)
+        self.pending = []
+        self.pending_stats = []
+
+    def finish_run(self, status="done"):
+        """ only the first call counts, so the status set on the way out
+        isnt overwritten by the atexit fallback
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self.flush()
+        self._write(lambda conn: conn.execute(
+            "UPDATE runs SET finished = ?, status = ? WHERE run_id = ?",
+            (time.time(), status, self.run_id)))
+
+
+def query_catalog(path, statement, params=()):
+    """ returns (column names, rows) for a query of the catalog
+    """
+    conn = connect_catalog(path)
+    try:
+        cursor = conn.execute(statement, params)
+        return ([x[0] for x in cursor.description or []],
+                cursor.fetchall())
+    finally:
+        conn.close()
+
+
+def format_table(columns, rows):
+    """ tab-separated lines, with a header
+    """
+    return ["\t".join(columns)] + \
+        ["\t".join(["" if x is None else str(x) for x in row])
+         for row in rows]
+
+
+if __name__ == "__main__":
+    args = get_args()
+    path = os.path.expanduser(args.catalog) if args.catalog is not None \
+        else default_catalog_path()
+    if not os.path.exists(path):
+        sys.stderr.write("no run catalog found at %s\n" % path)
+        sys.exit(1)
+    if args.query == "sql":
+        if args.statement is None:
+            sys.stderr.write("the sql query needs a statement\n")
+            sys.exit(1)
+        statement, params = args.statement, ()
+    else:
+        statement, params = QUERIES[args.query], (args.sample,)
+    try:
+        columns, rows = query_catalog(path, statement, params)
+    except sqlite3.Error as e:
+        sys.stderr.write("Error querying the catalog: %s\n" % e)
+        sys.exit(1)
+    print("\n".join(format_table(columns, rows)))
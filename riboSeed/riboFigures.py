@@ -0,0 +1,176 @@
+#-*- coding: utf-8 -*-
+
+"""
+Figures for riboSeed, drawn in a separate low-priority process so that
+plotting never holds up mapping or assembly.  The main process reduces
+its data to a compact, picklable summary (histogram counts, a thinned
+sorted curve) and hands it to the FigureService; the worker renders it
+whenever it gets the chance.  matplotlib is only ever imported in the
+worker, so a run without figures never loads it.
+
+This is used by riboSeed.py and is not meant to be run on its own.
+"""
+
+import sys
+import os
+import traceback
+import multiprocessing
+
+import numpy as np
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+# --------------------------- methods --------------------------- #
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def summarize_score_counts(counts, bins=50, npoints=2000):
+    """ given a dict of {alignment score: number of reads}, return what
+    render_as_scores needs: the histogram of the scores, and the scores
+    sorted from highest to lowest, thinned to at most npoints points
+    """
+    scores = np.array(sorted(counts.keys()), dtype=float)
+    weights = np.array([counts[x] for x in sorted(counts.keys())],
+                       dtype=float)
+    if len(scores) == 0:
+        return {"n": 0}
+    hist, edges = np.histogram(scores, bins=bins, weights=weights)
+    # the sorted curve is a step function of the counts; sample it evenly
+    n = int(weights.sum())
+    index = np.linspace(0, n - 1, min(n, npoints)).astype(np.int64)
+    ends = np.cumsum(weights[::-1])
+    sorted_scores = scores[::-1][np.searchsorted(ends, index, side="right")]
+    return {"n": n,
+            "hist_counts": hist.tolist(),
+            "hist_edges": edges.tolist(),
+            "sorted_index": index.tolist(),
+            "sorted_scores": sorted_scores.tolist()}
+
+
+def render_as_scores(summary, score_min, basename):
+    """ the alignment score histogram and sorted scores, as png and pdf
+    """
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    if summary["n"] == 0:
+        return
+    n = summary["n"]
+    edges = np.array(summary["hist_edges"])
+    fig, (plt1, plt2) = plt.subplots(1, 2, sharex=False)
+    plt1.hist(edges[:-1], bins=edges, weights=summary["hist_counts"],
+              color='b', alpha=0.9, label='Binned')
+    plt1.hist(edges[:-1], bins=edges, weights=summary["hist_counts"],
+              cumulative=True, color='r', alpha=0.5,
+              label='Cumulative')
+    plt1.set_title('Read Alignment Score Histogram')
+    plt1.set_xlabel('Alignemnt Score')
+    plt1.set_ylabel('Abundance')
+    plt1.plot([score_min, score_min], [0, n * 1.1],
+              color='green', linewidth=5, alpha=0.6)
+    plt1.axis([0, edges[-1], 0, n * 1.1])
+    plt1.legend()
+    plt.tight_layout()
+    plt1.grid(True)
+    plt2.grid(True)
+    plt2.scatter(y=summary["sorted_scores"], x=summary["sorted_index"])
+    plt2.plot([0, n * 1.1], [score_min, score_min],
+              color='green', linewidth=5, alpha=0.6)
+    plt2.axis([0, n * 1.1, 0, edges[-1] * 1.1])
+    plt2.set_title('Read Alignment Score, Sorted')
+    plt2.set_ylabel('Alignment Score')
+    plt2.set_xlabel('Index of Sorted Read')
+    fig.set_size_inches(12, 7.5)
+    fig.savefig(str(basename + '.png'), dpi=(200))
+    fig.savefig(str(basename + '.pdf'), dpi=(200))
+    plt.close(fig)
+
+
+RENDERERS = {"as_scores": render_as_scores}
+
+
+def figure_worker(queue, niceness=19):
+    """ render figure jobs from the queue until a None arrives.  A figure
+    that fails is reported and skipped; if matplotlib cant be loaded, the
+    remaining jobs are drained and dropped
+    """
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):  # not on windows
+        pass
+    try:
+        import matplotlib as mpl
+        mpl.use('Agg')
+        import matplotlib.pyplot
+        can_plot = True
+    except Exception as e:  # most likely an ImportError
+        sys.stderr.write(
+            "looks like you have some issue with matplotlib. " +
+            "Classic matplotlib, amirite? Plotting is disabled\n")
+        can_plot = False
+    while True:
+        job = queue.get()
+        if job is None:
+            break
+        if not can_plot:
+            continue
+        kind, kwargs = job
+        try:
+            RENDERERS[kind](**kwargs)
+        except Exception as e:
+            sys.stderr.write("Error drawing %s figure:\n%s" %
+                             (kind, last_exception()))
+
+
+class FigureService(object):
+    """ start a background process to draw figures; submit() returns
+    immediately.  When disabled, submit() does nothing and no process
+    is started.
+    """
+    def __init__(self, enabled=True, logger=None):
+        self.enabled = enabled
+        self.logger = logger
+        self.submitted = 0
+        self.queue = None
+        self.process = None
+        if self.enabled:
+            self.queue = multiprocessing.Queue()
+            self.process = multiprocessing.Process(
+                target=figure_worker, args=(self.queue,), daemon=True)
+            self.process.start()
+
+    def submit(self, kind, **kwargs):
+        """ queue a figure; kwargs are passed to the renderer for kind
+        """
+        if not self.enabled:
+            return
+        assert kind in RENDERERS, "unknown figure type: %s" % kind
+        if self.logger:
+            self.logger.debug("queueing %s figure", kind)
+        self.queue.put((kind, kwargs))
+        self.submitted = self.submitted + 1
+
+    def close(self, timeout=None):
+        """ wait (up to timeout seconds) for the queued figures to be
+        drawn, then stop the worker
+        """
+        if not self.enabled or self.process is None:
+            return
+        self.queue.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            if self.logger:
+                self.logger.warning("figures not finished after %ss; " +
+                                    "giving up on them", timeout)
+            self.process.terminate()
+            self.queue.cancel_join_thread()
+        self.process = None
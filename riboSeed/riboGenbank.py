@@ -0,0 +1,685 @@
+#-*- coding: utf-8 -*-
+
+"""
+A parsed-once cache of a GenBank file, so riboSeed, riboSnag, and
+riboSelect dont each run Biopython's (slow) GenBank parser over the same
+file again and again.  The first time a file is seen it is parsed once
+and converted into a directory, named for the SHA-256 of the file's
+contents, holding:
+  genome.fasta      the sequences, wrapped at 60, as SeqIO writes them
+  genome.fasta.fai  samtools-style index of genome.fasta
+  features.tsv      one line per feature: record id, index of the feature
+                    in its record, type, start (0-based), end, strand,
+                    locus_tag, and product
+  meta.json         the cache format version, and record ids, names,
+                    descriptions, and lengths; written last, so a cache
+                    without it is known to be incomplete.  Caches of
+                    another version are rebuilt
+
+Sequences are read from the memory-mapped genome.fasta, so only the
+slices asked for are ever turned into strings.  Clusters hold a
+GenomeView of their record rather than a copy of it; views of the same
+file share its one memory map, and a padded view (for circular genomes)
+wraps around the origin instead of building a padded copy.
+
+Seeds, contigs, and the like are small fastas that riboSeed writes and
+then reads back; SequenceMetadataCache keeps the id, length and MD5 of
+each one's first record, recorded as it is written, so they neednt be
+parsed again to be measured.
+
+By default a cache only lasts for the run that made it: it lives in
+<output dir>/genbank_cache (or a temporary directory, removed on exit).
+Set the RIBOSEED_GENBANK_CACHE environment variable to a directory to
+share caches between runs; nothing is ever evicted from it, so it can be
+cleared out at any time.
+"""
+
+import sys
+import os
+import re
+import atexit
+import json
+import mmap
+import shutil
+import hashlib
+import tempfile
+import traceback
+import pysam
+
+from bisect import bisect_left
+from collections import namedtuple
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+# bump whenever the layout of a cache changes, so old ones are rebuilt
+CACHE_VERSION = 1
+# the temporary cache dir of each process, made when first needed
+RUN_CACHE_DIR = {}
+FASTA_WIDTH = 60
+
+SequenceMetadata = namedtuple("SequenceMetadata",
+                              ["id", "length", "checksum"])
+GenbankFeature = namedtuple("GenbankFeature",
+                            ["record_id", "index", "type", "start", "end",
+                             "strand", "locus_tag", "product"])
+# how riboSelect splits product annotations into words ("16S", "rRNA")
+PRODUCT_SPLIT = re.compile("|".join(map(re.escape, [",", " ", "-", "_"])))
+
+# --------------------------- methods --------------------------- #
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def default_cache_dir(output_root=None):
+    """ $RIBOSEED_GENBANK_CACHE if set (shared between runs), otherwise
+    genbank_cache in output_root, or without one, a temporary directory
+    removed when this process exits
+    """
+    shared = os.environ.get("RIBOSEED_GENBANK_CACHE")
+    if shared:
+        return os.path.expanduser(shared)
+    if output_root:
+        return os.path.join(output_root, "genbank_cache")
+    if RUN_CACHE_DIR.get(os.getpid()) is None:
+        RUN_CACHE_DIR[os.getpid()] = tempfile.mkdtemp(
+            prefix="riboSeed_genbank_")
+        atexit.register(shutil.rmtree, RUN_CACHE_DIR[os.getpid()],
+                        ignore_errors=True)
+    return RUN_CACHE_DIR[os.getpid()]
+
+
+def genbank_hash(path, blocksize=2 ** 20):
+    """ SHA-256 of a file's contents
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as inf:
+        for block in iter(lambda: inf.read(blocksize), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def fasta_title(record):
+    """ the header line SeqIO's fasta writer would use for record
+    """
+    description = record.description.replace("\n", " ")
+    if description and description.split(None, 1)[0] == record.id:
+        return description
+    elif description:
+        return "%s %s" % (record.id, description)
+    return record.id
+
+
+def clean_field(value):
+    """ qualifiers as a single tsv field; empty for missing
+    """
+    if value is None:
+        return ""
+    return " ".join(str(value).split())
+
+
+def write_wrapped(outf, seq, width=FASTA_WIDTH):
+    """ write seq as fasta lines of width bases
+    """
+    for i in range(0, len(seq), width):
+        outf.write(seq[i: i + width] + "\n")
+
+
+def build_genbank_cache(gb_path, outdir, logger=None):
+    """ parse gb_path (the only time it gets parsed) into a cache in outdir
+    """
+    if logger:
+        logger.info("parsing %s into the GenBank cache", gb_path)
+    os.makedirs(outdir, exist_ok=True)
+    records = []
+    with open(gb_path, "r") as inf, \
+            open(os.path.join(outdir, "genome.fasta"), "w") as fasta, \
+            open(os.path.join(outdir, "genome.fasta.fai"), "w") as fai, \
+            open(os.path.join(outdir, "features.tsv"), "w") as feats:
+        for rec in SeqIO.parse(inf, "genbank"):
+            seq = str(rec.seq)
+            fasta.write(">%s\n" % fasta_title(rec))
+            offset = fasta.tell()
+            write_wrapped(fasta, seq)
+            fai.write("%s\t%i\t%i\t%i\t%i\n" % (
+                rec.id, len(seq), offset, FASTA_WIDTH, FASTA_WIDTH + 1))
+            for idx, feat in enumerate(rec.features):
+                if feat.location is None:
+                    continue
+                locus_tag = feat.qualifiers.get("locus_tag", [None])[0]
+                product = feat.qualifiers.get("product", [None])[0]
+                feats.write("\t".join([
+                    rec.id, str(idx), feat.type,
+                    str(int(feat.location.start)),
+                    str(int(feat.location.end)),
+                    "" if feat.strand is None else str(feat.strand),
+                    clean_field(locus_tag), clean_field(product)]) + "\n")
+            records.append({"id": rec.id, "name": rec.name,
+                            "description": rec.description,
+                            "length": len(seq)})
+    with open(os.path.join(outdir, "meta.json"), "w") as outf:
+        json.dump({"version": CACHE_VERSION,
+                   "source": os.path.abspath(gb_path),
+                   "records": records}, outf, indent=1)
+    return GenbankCache(outdir)
+
+
+def cache_version(outdir):
+    """ the format version of the cache in outdir (0 for caches from
+    before versions were recorded), or None if there is no complete
+    cache there
+    """
+    try:
+        with open(os.path.join(outdir, "meta.json"), "r") as inf:
+            return json.load(inf).get("version", 0)
+    except (IOError, ValueError):
+        return None
+
+
+def open_genbank_cache(gb_path, cache_dir=None, logger=None):
+    """ the cache for gb_path, building it if this content hasnt been seen
+    before (or was cached by another version).  Caches are built under a
+    temporary name and then renamed, so runs sharing a cache directory
+    never see a half-written one.  If the cache directory cant be written
+    to, the cache is built in a temporary directory instead, and lasts
+    only as long as this run.  See default_cache_dir for where caches go
+    without a cache_dir
+    """
+    if not os.path.isfile(gb_path):
+        raise FileNotFoundError("GenBank file %s not found!" % gb_path)
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    digest = genbank_hash(gb_path)
+    outdir = os.path.join(cache_dir, digest)
+    version = cache_version(outdir)
+    if version == CACHE_VERSION:
+        if logger:
+            logger.debug("using cached GenBank %s for %s", outdir, gb_path)
+        return GenbankCache(outdir)
+    if version is not None and logger:
+        logger.info("GenBank cache %s is from another version; rebuilding",
+                    outdir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(prefix=digest + ".", dir=cache_dir)
+    except OSError:
+        if logger:
+            logger.warning("could not write to the GenBank cache %s; " +
+                           "caching for this run only", cache_dir)
+            logger.debug(last_exception())
+        return build_genbank_cache(
+            gb_path, tempfile.mkdtemp(prefix="riboSeed_genbank_"),
+            logger=logger)
+    build_genbank_cache(gb_path, tmpdir, logger=logger).close()
+    if version is not None:
+        # move the old cache aside; open caches keep their files
+        stale = tempfile.mkdtemp(prefix=digest + ".stale.", dir=cache_dir)
+        try:
+            os.rename(outdir, os.path.join(stale, digest))
+        except OSError:
+            pass
+        shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.rename(tmpdir, outdir)
+    except OSError:
+        # another run finished the same cache first
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return GenbankCache(outdir)
+
+
+class GenbankCache(object):
+    """ read access to a cache made by build_genbank_cache
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fasta = os.path.join(path, "genome.fasta")
+        with open(os.path.join(path, "meta.json"), "r") as inf:
+            self.meta = json.load(inf)
+        self.records = self.meta["records"]
+        self.ids = [x["id"] for x in self.records]
+        self.count = len(self.records)
+        self.genome = IndexedFasta(self.fasta)
+        self._features = None
+        self._by_record = None
+        self._feature_indexes = {}
+        self._seq_records = {}
+
+    def length(self, record_id):
+        return self.genome.length(record_id)
+
+    def _entry(self, record_id):
+        return self.genome.entry(record_id)
+
+    def seq(self, record_id, start=0, end=None):
+        """ sequence of record_id from start to end (0-based, end
+        exclusive, like a slice) as a string
+        """
+        return self.genome.seq(record_id, start, end)
+
+    def genome_view(self, record_id):
+        """ a GenomeView of record_id, sharing this cache's memory map,
+        and carrying its FeatureIndex
+        """
+        view = self.genome.view(record_id)
+        view.feature_index = self.feature_index(record_id)
+        return view
+
+    @property
+    def features(self):
+        """ every feature as a GenbankFeature, in file order
+        """
+        if self._features is None:
+            self._features = []
+            self._by_record = {x: [] for x in self.ids}
+            with open(os.path.join(self.path, "features.tsv"), "r") as inf:
+                for line in inf:
+                    rec, idx, ftype, start, end, strand, lt, prod = \
+                        line.rstrip("\n").split("\t")
+                    self._features.append(GenbankFeature(
+                        record_id=rec, index=int(idx), type=ftype,
+                        start=int(start), end=int(end),
+                        strand=None if strand == "" else int(strand),
+                        locus_tag=lt if lt != "" else None,
+                        product=prod if prod != "" else None))
+                    self._by_record[rec].append(self._features[-1])
+        return self._features
+
+    def record_features(self, record_id, feature=None):
+        """ features of record_id, optionally only those whose type is in
+        feature
+        """
+        self._entry(record_id)
+        if self._by_record is None:
+            self.features
+        return [x for x in self._by_record[record_id] if
+                feature is None or x.type in feature]
+
+    def feature_index(self, record_id):
+        """ the FeatureIndex of record_id, built the first time it is asked
+        for
+        """
+        if record_id not in self._feature_indexes:
+            self._feature_indexes[record_id] = FeatureIndex(
+                self.record_features(record_id))
+        return self._feature_indexes[record_id]
+
+    def seq_record(self, record_id):
+        """ a SeqRecord (with features, but only their locus_tag and
+        product qualifiers) for record_id.  Made once per record and then
+        shared, so callers must not modify it
+        """
+        if record_id not in self._seq_records:
+            self._entry(record_id)
+            meta = self.records[self.ids.index(record_id)]
+            features = []
+            for feat in self.record_features(record_id):
+                qualifiers = {}
+                if feat.locus_tag is not None:
+                    qualifiers["locus_tag"] = [feat.locus_tag]
+                if feat.product is not None:
+                    qualifiers["product"] = [feat.product]
+                features.append(SeqFeature(
+                    FeatureLocation(feat.start, feat.end, strand=feat.strand),
+                    type=feat.type, qualifiers=qualifiers))
+            self._seq_records[record_id] = SeqRecord(
+                Seq(self.seq(record_id)), id=record_id, name=meta["name"],
+                description=meta["description"], features=features)
+        return self._seq_records[record_id]
+
+    def iter_seq_records(self):
+        for record_id in self.ids:
+            yield self.seq_record(record_id)
+
+    def write_fasta(self, outpath):
+        """ write the genome as (multi)fasta, with its .fai; returns the
+        number of records
+        """
+        shutil.copyfile(self.fasta, outpath)
+        shutil.copyfile(self.fasta + ".fai", outpath + ".fai")
+        return self.count
+
+    def write_padded_fasta(self, outpath, pad, chunk=FASTA_WIDTH * 10000):
+        """ write each record with its last pad bases added to the start,
+        and its first pad bases to the end, as is done for circular
+        genomes, with a .fai; returns the number of records.  Records are
+        streamed from the indexed genome a chunk at a time, so whole
+        (padded) sequences are never held in memory
+        """
+        with open(outpath, "w") as outf, \
+                open(outpath + ".fai", "w") as fai:
+            for record_id in self.ids:
+                view = self.genome.view(record_id).padded(pad)
+                outf.write(">%s\n" % record_id)
+                offset = outf.tell()
+                for start in range(0, len(view), chunk):
+                    write_wrapped(outf, view[start: start + chunk])
+                fai.write("%s\t%i\t%i\t%i\t%i\n" % (
+                    record_id, len(view), offset, FASTA_WIDTH,
+                    FASTA_WIDTH + 1))
+        return self.count
+
+    def close(self):
+        self.genome.close()
+
+
+class IndexedFasta(object):
+    """ a (multi)fasta with a samtools-style .fai (made with pysam.faidx if
+    there isnt one), memory-mapped the first time a sequence is read.
+    Every view of the file shares the one map
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isfile(path + ".fai"):
+            pysam.faidx(path)
+        self.index = {}
+        self.names = []
+        with open(path + ".fai", "r") as inf:
+            for line in inf:
+                name, length, offset, bases, width = line.split("\t")[:5]
+                self.index[name] = (int(length), int(offset), int(bases),
+                                    int(width))
+                self.names.append(name)
+        self._fh = None
+        self._map = None
+
+    def entry(self, name):
+        try:
+            return self.index[name]
+        except KeyError:
+            raise ValueError("no record found matching record id %s!" %
+                             name)
+
+    def length(self, name):
+        return self.entry(name)[0]
+
+    def _buffer(self):
+        if self._map is None:
+            self._fh = open(self.path, "rb")
+            self._map = mmap.mmap(self._fh.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        return self._map
+
+    def seq(self, name, start=0, end=None):
+        """ sequence of name from start to end (0-based, end exclusive,
+        like a slice) as a string
+        """
+        length, offset, bases, width = self.entry(name)
+        start, end, step = slice(start, end).indices(length)
+        if end <= start:
+            return ""
+
+        def byte(pos):
+            return offset + (pos // bases) * width + pos % bases
+        raw = self._buffer()[byte(start): byte(end - 1) + 1]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode("ascii")
+
+    def view(self, name=None, pad=0):
+        """ a GenomeView of name (by default, the first sequence)
+        """
+        if name is None:
+            name = self.names[0]
+        self.entry(name)
+        return GenomeView(self, name, pad=pad)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._fh.close()
+            self._map, self._fh = None, None
+
+    def __getstate__(self):
+        # maps and file handles cant be pickled; they are reopened as needed
+        state = self.__dict__.copy()
+        state.update({"_fh": None, "_map": None})
+        return state
+
+
+class GenomeView(object):
+    """ one sequence of an IndexedFasta, standing in for the SeqRecord a
+    cluster used to hold a copy of: it has an id, a len, and slices to
+    strings, and view.seq is the view itself, so view.seq[a:b] works too.
+    A view padded by pad has the last pad bases of the sequence before
+    its start and the first pad bases after its end, as if the sequence
+    were circular, but nothing is copied; slices wrap around the origin.
+    Views from a GenbankCache carry the record's FeatureIndex (whose
+    coordinates are those of the unpadded sequence)
+    """
+    def __init__(self, fasta, name, pad=0, feature_index=None):
+        self.fasta = fasta
+        self.id = name
+        self.pad = pad
+        self.seq_length = fasta.length(name)
+        self.feature_index = feature_index
+
+    @property
+    def seq(self):
+        return self
+
+    def padded(self, pad):
+        """ a view of the same sequence with pad more bases on each end
+        """
+        return GenomeView(self.fasta, self.id, pad=self.pad + pad,
+                          feature_index=self.feature_index)
+
+    def __len__(self):
+        return self.seq_length + 2 * self.pad
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("GenomeView slices cant have a step")
+        else:
+            if key < 0:
+                key = key + len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("GenomeView index out of range")
+            start, end = key, key + 1
+        if self.pad == 0:
+            return self.fasta.seq(self.id, start, end)
+        chunks = []
+        pos = (start - self.pad) % self.seq_length
+        remaining = end - start
+        while remaining > 0:
+            n = min(remaining, self.seq_length - pos)
+            chunks.append(self.fasta.seq(self.id, pos, pos + n))
+            remaining = remaining - n
+            pos = 0
+        return "".join(chunks)
+
+    def __str__(self):
+        return self[:]
+
+    def __repr__(self):
+        return "GenomeView(%s, %s, length=%i, pad=%i)" % (
+            self.fasta.path, self.id, self.seq_length, self.pad)
+
+
+def seq_record_features(record):
+    """ a Biopython SeqRecord's features as GenbankFeatures, for building a
+    FeatureIndex without a cache
+    """
+    return [GenbankFeature(
+        record_id=record.id, index=idx, type=feat.type,
+        start=int(feat.location.start), end=int(feat.location.end),
+        strand=feat.strand,
+        locus_tag=feat.qualifiers.get("locus_tag", [None])[0],
+        product=feat.qualifiers.get("product", [None])[0])
+        for idx, feat in enumerate(record.features)
+        if feat.location is not None]
+
+
+class FeatureIndex(object):
+    """ the features of one record, indexed by locus_tag, by type, and by
+    position.  Positions are 0-based and end-exclusive, as in the cache.
+
+    The positional index is the features sorted by start, with the
+    running maximum of their ends, so a window query bisects to the last
+    feature starting before the window ends and walks back only until no
+    earlier feature can still reach the window
+    """
+    def __init__(self, features):
+        self.features = features
+        self.by_locus_tag = {}
+        self.by_type_locus_tag = {}
+        self.by_type = {}
+        self.untagged = []
+        for feat in features:
+            self.by_type.setdefault(feat.type, []).append(feat)
+            if feat.locus_tag is None:
+                self.untagged.append(feat)
+            else:
+                # like a scan of the features, the last one wins
+                self.by_locus_tag[feat.locus_tag] = feat
+                self.by_type_locus_tag[(feat.type, feat.locus_tag)] = feat
+        self._tokens = {}
+        self.sorted = sorted(features, key=lambda x: (x.start, x.end))
+        self.starts = [x.start for x in self.sorted]
+        self.max_ends = []
+        for feat in self.sorted:
+            self.max_ends.append(max(feat.end, self.max_ends[-1]) if
+                                 self.max_ends else feat.end)
+
+    def tokens(self, feat):
+        """ the words of a feature's product annotation, split once
+        """
+        if feat.index not in self._tokens:
+            self._tokens[feat.index] = [] if feat.product is None else \
+                PRODUCT_SPLIT.split(feat.product)
+        return self._tokens[feat.index]
+
+    def locus_feature(self, locus_tag, feature=None):
+        """ the feature with a locus_tag, or None.  If feature is given
+        (tested with "in", as for of_type), only features of those types
+        are looked at, so a gene sharing its tag with an rRNA doesnt hide
+        it; like a scan of those features, the last one wins
+        """
+        if feature is None:
+            return self.by_locus_tag.get(locus_tag)
+        hits = [self.by_type_locus_tag[(k, locus_tag)] for k in
+                self.by_type.keys() if k in feature and
+                (k, locus_tag) in self.by_type_locus_tag]
+        if len(hits) == 0:
+            return None
+        return max(hits, key=lambda x: x.index)
+
+    def locus(self, locus_tag, feature=None):
+        """ (start, end, strand, type, product tokens) for a locus_tag
+        (of a type in feature, if given), or None
+        """
+        feat = self.locus_feature(locus_tag, feature=feature)
+        if feat is None:
+            return None
+        return (feat.start, feat.end, feat.strand, feat.type,
+                self.tokens(feat))
+
+    def of_type(self, feature):
+        """ features whose type is in feature (a string or list, tested
+        with "in" as riboSelect and riboSnag always have), in record order
+        """
+        return sorted([f for k, v in self.by_type.items() if k in feature
+                       for f in v], key=lambda x: x.index)
+
+    def overlapping(self, start, end, feature=None):
+        """ features overlapping the window [start, end), optionally only
+        those whose type is in feature, in order of start
+        """
+        hits = []
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_ends[i] > start:
+            feat = self.sorted[i]
+            if feat.end > start and (feature is None or feat.type in feature):
+                hits.append(feat)
+            i = i - 1
+        return hits[::-1]
+
+
+def first_fasta_record_metadata(path):
+    """ SequenceMetadata of the first record of a fasta, read line by line
+    """
+    md5 = hashlib.md5()
+    record_id, length = None, 0
+    with open(path, "r") as inf:
+        for line in inf:
+            if line.startswith(">"):
+                if record_id is not None:
+                    break
+                fields = line[1:].split(None, 1)
+                record_id = fields[0] if len(fields) != 0 else ""
+                continue
+            if record_id is None:
+                if line.strip() == "":
+                    continue
+                raise ValueError("%s is not a valid fasta!" % path)
+            seq = line.strip()
+            md5.update(seq.encode("utf-8"))
+            length = length + len(seq)
+    if record_id is None:
+        raise ValueError("no records in %s" % path)
+    return SequenceMetadata(id=record_id, length=length,
+                            checksum=md5.hexdigest())
+
+
+def sequence_metadata(record_id, seq):
+    """ SequenceMetadata of a sequence about to be written as record_id
+    """
+    return SequenceMetadata(
+        id=record_id, length=len(seq),
+        checksum=hashlib.md5(str(seq).encode("utf-8")).hexdigest())
+
+
+class SequenceMetadataCache(object):
+    """ the SequenceMetadata of the first record of fasta files, keyed by
+    path and checked against the file's mtime and size, so a file that has
+    been rewritten since is read again rather than trusted.  Fill it with
+    record() as files are written; get() only parses files it hasnt seen
+    """
+    def __init__(self):
+        self.entries = {}
+        self.parsed = 0
+
+    def _stamp(self, path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def record(self, path, metadata):
+        """ call once path has been written (and closed)
+        """
+        self.entries[os.path.abspath(path)] = (self._stamp(path), metadata)
+        return metadata
+
+    def get(self, path):
+        stamp = self._stamp(path)
+        hit = self.entries.get(os.path.abspath(path))
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+        self.parsed = self.parsed + 1
+        return self.record(path, first_fasta_record_metadata(path))
+
+    def length(self, path):
+        return self.get(path).length
+
+    def copy(self, src, dest):
+        """ shutil.copyfile, carrying src's metadata over to dest
+        """
+        metadata = self.get(src)
+        shutil.copyfile(src, dest)
+        return self.record(dest, metadata)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# one per riboSeed run (ie, per process)
+seq_metadata = SequenceMetadataCache()
@@ -0,0 +1,148 @@
+#-*- coding: utf-8 -*-
+
+"""
+Mapper backends for riboSeed.  Each backend knows how to index a
+reference, how to build a command that maps one library and writes
+sam/bam to stdout, and what its alignment scores mean, so that riboSeed
+can pick the score threshold and hand the (sorted) output to the same
+merge-and-filter step whichever mapper made it.
+
+ - bwa: bwa mem; filtered afterwards on the AS tag
+ - smalt: filters by score itself (-m), and uses the insert size
+   distribution estimated from the master library
+ - minimap2: minimap2 -ax sr; filtered afterwards on the AS tag.  Its
+   short read preset scores a match as 2, so thresholds are doubled
+
+This is used by riboSeed.py and is not meant to be run on its own.
+"""
+
+import sys
+import os
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+# --------------------------- classes --------------------------- #
+
+
+class MapperBackend(object):
+    """ base class: subclasses set name and fill in index_cmd and
+    map_cmd.  add_args are extra arguments for the mapping command; if
+    None, the backend's default_args are used
+    """
+    name = None
+    default_args = ""
+    # score of a single matching base, to put thresholds on the same scale
+    match_score = 1
+    # if False, the mapper applies the threshold itself, and the mapped
+    # reads are not filtered again
+    filter_after_mapping = True
+
+    def __init__(self, exe, add_args=None):
+        self.exe = exe
+        self.add_args = add_args if add_args is not None else \
+            self.default_args
+
+    def index_cmd(self, ref_fasta):
+        raise NotImplementedError
+
+    def map_cmd(self, ref_fasta, fastqs, cores, score_min=None,
+                insert_dist=None):
+        """ a command mapping fastqs (one or two files; two are treated as
+        a pair) to the indexed ref_fasta, writing sam/bam to stdout
+        """
+        raise NotImplementedError
+
+    def score_minimum(self, readlen, iteration=0, score_min=None):
+        """ the minimum alignment score for reads to be kept. score_min, if
+        given, is used as is; otherwise, half the read length (but at
+        least 50), scaled by the score of a match
+        """
+        if score_min is not None:
+            return score_min
+        return max(int(round(float(readlen) / 2.0)), 50) * self.match_score
+
+    def filter_score(self, score_min):
+        """ the threshold for the filtering step after mapping, or None if
+        the mapper already applied it
+        """
+        return score_min if self.filter_after_mapping else None
+
+
+class BwaBackend(MapperBackend):
+    name = "bwa"
+    default_args = "-L 0,0 -U 0 -a"
+
+    def index_cmd(self, ref_fasta):
+        return "{0} index {1}".format(self.exe, ref_fasta)
+
+    def map_cmd(self, ref_fasta, fastqs, cores, score_min=None,
+                insert_dist=None):
+        return '{0} mem -t {1} {2} -k 15 {3} {4}'.format(
+            self.exe, cores, self.add_args, ref_fasta, " ".join(fastqs))
+
+
+class SmaltBackend(MapperBackend):
+    """ SMALT has no --mapper_args; its scoring is set with scoring, and
+    the index with k and step
+    """
+    name = "smalt"
+    filter_after_mapping = False
+
+    def __init__(self, exe, add_args=None,
+                 scoring="match=1,subst=-4,gapopen=-4,gapext=-3",
+                 k=5, step=3):
+        super(SmaltBackend, self).__init__(exe=exe, add_args=add_args)
+        self.scoring = scoring
+        self.k = k
+        self.step = step
+
+    def index_cmd(self, ref_fasta):
+        return "{0} index -k {1} -s {2} {3} {3}".format(
+            self.exe, self.k, self.step, ref_fasta)
+
+    def map_cmd(self, ref_fasta, fastqs, cores, score_min=None,
+                insert_dist=None):
+        assert score_min is not None, "SMALT needs a score minimum"
+        return str("{0} map {1}-S {2} -m {3} -n {4} -g {5} -f bam " +
+                   "{6} {7}").format(self.exe,
+                                     "-l pe " if len(fastqs) == 2 else "",
+                                     self.scoring, score_min, cores,
+                                     insert_dist, ref_fasta,
+                                     " ".join(fastqs))
+
+    def score_minimum(self, readlen, iteration=0, score_min=None):
+        """ unless given, this gets more stringent with each iteration
+        """
+        if score_min is not None:
+            return score_min
+        scaling_factor = 1.0 - (1.0 / (2.0 + float(iteration)))
+        return int(readlen * scaling_factor)
+
+
+class Minimap2Backend(MapperBackend):
+    """ minimap2's short read preset.  The index is written next to the
+    reference as <ref_fasta>.mmi
+    """
+    name = "minimap2"
+    match_score = 2
+
+    def index_cmd(self, ref_fasta):
+        return "{0} -x sr -d {1}.mmi {1}".format(self.exe, ref_fasta)
+
+    def map_cmd(self, ref_fasta, fastqs, cores, score_min=None,
+                insert_dist=None):
+        return " ".join([x for x in [
+            self.exe, "-ax sr -t {0}".format(cores), self.add_args,
+            ref_fasta + ".mmi"] + fastqs if x != ""])
+
+
+BACKENDS = {x.name: x for x in [BwaBackend, SmaltBackend, Minimap2Backend]}
+
+
+def get_mapper_backend(method, exe, **kwargs):
+    """ the backend for method (one of BACKENDS), using exe
+    """
+    if method not in BACKENDS:
+        raise ValueError("Mapping method not found!")
+    return BACKENDS[method](exe=exe, **kwargs)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""
+Convert FASTQ libraries once into a compact, memory-mappable read store,
+so the passes riboSeed makes over the reads itself (read lengths, pairing
+checks, subsampling) dont have to parse text FASTQ again.
+
+A store is a directory holding:
+  seq.bin      bases, 2 bits each (A=0, C=1, G=2, T=3), 4 to a byte
+  n_pos.npy    positions (in bases, across the store) of the N's
+  qual.bin     qualities, binned to 8 Illumina-style levels, 1 byte each
+  offsets.npy  start of each read, in bases, plus the total at the end
+  names.txt    read names, one per line
+  meta.json    libraries (and their read index ranges), the size and
+               mtime of each source FASTQ, so stale stores are rebuilt,
+               and the store's key (see read_store_key)
+
+Stores can be shared between runs: open_shared_read_store keeps them in
+subdirectories of one directory, named for a hash of the read files, so
+any run on the same reads (wherever they now live) reuses the store.
+
+Only the subsets that external tools need are written back out as FASTQ.
+
+USAGE:
+ $ riboReadStore.py -o ~/read_stores -F reads_1.fq -R reads_2.fq
+"""
+
+import argparse
+import sys
+import time
+import gzip
+import json
+import os
+import hashlib
+import shutil
+import tempfile
+import traceback
+
+import numpy as np
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+from pyutilsnrw.utils3_5 import set_up_logging
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+BASE_CODES = np.zeros(256, dtype=np.uint8)
+for _nt, _code in zip("ACGTacgt", [0, 1, 2, 3, 0, 1, 2, 3]):
+    BASE_CODES[ord(_nt)] = _code
+IS_BASE = np.zeros(256, dtype=bool)
+IS_BASE[[ord(x) for x in "ACGTacgt"]] = True
+# phred score -> binned phred score
+QUAL_BINS = np.zeros(256, dtype=np.uint8)
+for _low, _high, _value in [(2, 10, 6), (10, 20, 15), (20, 25, 22),
+                            (25, 30, 27), (30, 35, 33), (35, 40, 37),
+                            (40, 256, 40)]:
+    QUAL_BINS[_low: _high] = _value
+
+# --------------------------- methods --------------------------- #
+
+
+def get_args():  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Pack FASTQ libraries into a riboSeed read store",
+        add_help=False)  # to allow for custom help
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument("-o", "--output", dest='output',
+                               action="store",
+                               help="directory of read stores (as " +
+                               "given to riboSeed's --read_store); the " +
+                               "store is made in a subdirectory named " +
+                               "for the reads", type=str,
+                               required=True)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("-F", "--fastq1", dest='fastq1', action="store",
+                          help="forward fastq reads, can be compressed",
+                          type=str, default=None)
+    optional.add_argument("-R", "--fastq2", dest='fastq2', action="store",
+                          help="reverse fastq reads, can be compressed",
+                          type=str, default=None)
+    optional.add_argument("-S1", "--fastq_single1", dest='fastqS1',
+                          action="store",
+                          help="single fastq reads", type=str, default=None)
+    optional.add_argument("-v", "--verbosity", dest='verbosity',
+                          action="store",
+                          default=2, type=int, choices=[1, 2, 3, 4, 5],
+                          help="Logger writes debug to file in output dir; " +
+                          "this sets verbosity level sent to stderr. " +
+                          " 1 = debug(), 2 = info(), 3 = warning(), " +
+                          "4 = error() and 5 = critical(); " +
+                          "default: %(default)s")
+    optional.add_argument("-h", "--help",
+                          action="help", default=argparse.SUPPRESS,
+                          help="Displays this help message")
+    args = parser.parse_args()
+    return args
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def open_fastq(path):
+    """ open plain or gzipped fastq as bytes
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_fastq_chunks(path, chunk_reads=100000):
+    """ yield lists of (name, seq, qual) byte strings from a fastq
+    """
+    chunk = []
+    with open_fastq(path) as inf:
+        while True:
+            header = inf.readline()
+            if not header:
+                break
+            seq = inf.readline().rstrip()
+            inf.readline()
+            qual = inf.readline().rstrip()
+            if len(seq) != len(qual):
+                raise ValueError("sequence and quality lengths differ " +
+                                 "for read %s in %s" %
+                                 (header.strip().decode(), path))
+            chunk.append((header[1:].split()[0], seq, qual))
+            if len(chunk) == chunk_reads:
+                yield chunk
+                chunk = []
+    if len(chunk) != 0:
+        yield chunk
+
+
+def pack_bases(codes):
+    """ pack an array of 2-bit codes (length a multiple of 4) into bytes
+    """
+    return (codes[0::4] << 6) | (codes[1::4] << 4) | \
+        (codes[2::4] << 2) | codes[3::4]
+
+
+def unpack_bases(packed):
+    """ inverse of pack_bases
+    """
+    out = np.empty(len(packed) * 4, dtype=np.uint8)
+    out[0::4] = packed >> 6
+    out[1::4] = (packed >> 4) & 3
+    out[2::4] = (packed >> 2) & 3
+    out[3::4] = packed & 3
+    return out
+
+
+def source_stamp(path):
+    """ what we check to decide whether a store is stale
+    """
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size,
+            "mtime": stat.st_mtime}
+
+
+def read_store_key(fastqs, sample=2 ** 20):
+    """ SHA-256 of the library names, and the size and first and last
+    sample bytes of each fastq: enough to tell read files apart without
+    reading all of them, which would cost as much as packing them
+    """
+    sha = hashlib.sha256()
+    for lib, path in fastqs:
+        size = os.path.getsize(path)
+        sha.update("{0}\t{1}\n".format(lib, size).encode("utf-8"))
+        with open(path, "rb") as inf:
+            sha.update(inf.read(sample))
+            inf.seek(max(0, size - sample))
+            sha.update(inf.read(sample))
+    return sha.hexdigest()
+
+
+def build_read_store(outdir, fastqs, chunk_reads=100000, key=None,
+                     logger=None):
+    """ pack the fastqs (a list of (library name, path) tuples, such as
+    [("readF", "r1.fq"), ("readR", "r2.fq")]) into a store in outdir
+    """
+    os.makedirs(outdir, exist_ok=True)
+    offsets = [0]
+    n_pos = []
+    libraries = []
+    total = 0
+    nreads = 0
+    carry = np.zeros(0, dtype=np.uint8)
+    with open(os.path.join(outdir, "seq.bin"), "wb") as seqf, \
+            open(os.path.join(outdir, "qual.bin"), "wb") as qualf, \
+            open(os.path.join(outdir, "names.txt"), "wb") as namef:
+        for lib, path in fastqs:
+            if logger:
+                logger.info("packing %s into the read store", path)
+            first = nreads
+            for chunk in iter_fastq_chunks(path, chunk_reads=chunk_reads):
+                seq = np.frombuffer(b"".join([x[1] for x in chunk]),
+                                    dtype=np.uint8)
+                qual = np.frombuffer(b"".join([x[2] for x in chunk]),
+                                     dtype=np.uint8)
+                lens = np.array([len(x[1]) for x in chunk], dtype=np.int64)
+                offsets.extend((total + np.cumsum(lens)).tolist())
+                not_base = np.flatnonzero(~IS_BASE[seq])
+                if len(not_base) != 0:
+                    n_pos.append(not_base + total)
+                # bases that dont fill a whole byte wait for the next chunk
+                codes = np.concatenate((carry, BASE_CODES[seq]))
+                usable = len(codes) - len(codes) % 4
+                seqf.write(pack_bases(codes[:usable]).tobytes())
+                carry = codes[usable:]
+                qualf.write(QUAL_BINS[qual - 33].tobytes())
+                namef.write(b"\n".join([x[0] for x in chunk]) + b"\n")
+                total = total + len(seq)
+                nreads = nreads + len(chunk)
+            libraries.append({"name": lib, "first": first, "last": nreads,
+                              "source": source_stamp(path)})
+        if len(carry) != 0:
+            seqf.write(pack_bases(np.concatenate((
+                carry, np.zeros(4 - len(carry), dtype=np.uint8)))).tobytes())
+    np.save(os.path.join(outdir, "offsets.npy"),
+            np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(outdir, "n_pos.npy"),
+            np.concatenate(n_pos) if len(n_pos) != 0 else
+            np.zeros(0, dtype=np.int64))
+    # written last, so a store without meta.json is known to be incomplete
+    with open(os.path.join(outdir, "meta.json"), "w") as outf:
+        json.dump({"n_reads": nreads, "n_bases": total, "key": key,
+                   "libraries": libraries}, outf, indent=1)
+    return ReadStore(outdir)
+
+
+def store_is_current(outdir, fastqs, key=None):
+    """ True if outdir holds a complete store of exactly these fastqs,
+    unchanged since it was built.  Given a key (see read_store_key), the
+    store must have been built from files with that key, and the same
+    size and mtime, wherever they were (so moved files are fine, but
+    copies that dont keep their mtime are packed again)
+    """
+    try:
+        with open(os.path.join(outdir, "meta.json"), "r") as inf:
+            meta = json.load(inf)
+        wanted = [(lib, source_stamp(path)) for lib, path in fastqs]
+    except (IOError, OSError, ValueError):
+        return False
+    built = [(x["name"], x["source"]) for x in meta["libraries"]]
+    if key is None:
+        return wanted == built
+    return meta.get("key") == key and \
+        [(lib, x["size"], x["mtime"]) for lib, x in wanted] == \
+        [(lib, x["size"], x["mtime"]) for lib, x in built]
+
+
+def open_or_build_read_store(outdir, fastqs, key=None, logger=None):
+    """ reuse the store in outdir if it is current, otherwise (re)build it.
+    Stores are built under a temporary name next to outdir and then
+    renamed, as GenBank caches are, so runs sharing a store never see a
+    half-written one, and a stale store is moved aside rather than
+    overwritten, so runs that have it memory-mapped keep their reads
+    """
+    if store_is_current(outdir, fastqs, key=key):
+        if logger:
+            logger.info("using existing read store %s", outdir)
+        return ReadStore(outdir)
+    parent = os.path.dirname(os.path.abspath(outdir))
+    name = os.path.basename(os.path.abspath(outdir))
+    os.makedirs(parent, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(prefix=name + ".", dir=parent)
+    try:
+        build_read_store(tmpdir, fastqs, key=key, logger=logger)
+    except Exception:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    if os.path.exists(outdir):
+        stale = tempfile.mkdtemp(prefix=name + ".stale.", dir=parent)
+        try:
+            os.rename(outdir, os.path.join(stale, name))
+        except OSError:
+            pass
+        shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.rename(tmpdir, outdir)
+    except OSError:
+        # another run finished the same store first
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return ReadStore(outdir)
+
+
+def open_shared_read_store(store_root, fastqs, logger=None):
+    """ the store of these fastqs in store_root/<read_store_key>, built
+    there if no earlier run has done so
+    """
+    key = read_store_key(fastqs)
+    return open_or_build_read_store(os.path.join(store_root, key), fastqs,
+                                    key=key, logger=logger)
+
+
+class ReadStore(object):
+    """ read-only access to a store made by build_read_store; the bases
+    and qualities are memory-mapped, so opening a store is cheap
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as inf:
+            self.meta = json.load(inf)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.n_pos = np.load(os.path.join(path, "n_pos.npy"))
+        self.n_reads = self.meta["n_reads"]
+        if self.meta["n_bases"] == 0:
+            self.seq = np.zeros(0, dtype=np.uint8)
+            self.qual = np.zeros(0, dtype=np.uint8)
+        else:
+            self.seq = np.memmap(os.path.join(path, "seq.bin"),
+                                 dtype=np.uint8, mode="r")
+            self.qual = np.memmap(os.path.join(path, "qual.bin"),
+                                  dtype=np.uint8, mode="r")
+        self._names = None
+
+    @property
+    def names(self):
+        """ read names, loaded the first time they are needed
+        """
+        if self._names is None:
+            with open(os.path.join(self.path, "names.txt"), "r") as inf:
+                self._names = inf.read().splitlines()
+        return self._names
+
+    def libraries(self):
+        return [x["name"] for x in self.meta["libraries"]]
+
+    def lib_range(self, lib):
+        """ (first, last) read indexes of a library; last is exclusive
+        """
+        for entry in self.meta["libraries"]:
+            if entry["name"] == lib:
+                return (entry["first"], entry["last"])
+        raise ValueError("library %s is not in the read store" % lib)
+
+    def read_lengths(self, lib=None):
+        lengths = np.diff(self.offsets)
+        if lib is None:
+            return lengths
+        first, last = self.lib_range(lib)
+        return lengths[first: last]
+
+    def count_reads(self, lib):
+        first, last = self.lib_range(lib)
+        return last - first
+
+    def mean_read_length(self, lib, N=None):
+        """ mean length of the first N reads of a library (all if None),
+        like get_ave_read_len_from_fastq
+        """
+        lengths = self.read_lengths(lib)
+        if N is not None:
+            lengths = lengths[0: N]
+        return float(np.mean(lengths)) if len(lengths) != 0 else 0.0
+
+    def get_seq(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        codes = unpack_bases(np.asarray(self.seq[start // 4:
+                                                 (end + 3) // 4]))
+        seq = BASES[codes[start % 4: start % 4 + end - start]]
+        lo, hi = np.searchsorted(self.n_pos, [start, end])
+        if hi > lo:
+            seq[self.n_pos[lo: hi] - start] = ord("N")
+        return seq.tobytes().decode("ascii")
+
+    def get_qual(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return (np.asarray(self.qual[start: end]) + 33).tobytes().decode(
+            "ascii")
+
+    def subsample(self, n, lib=None, seed=None):
+        """ sorted indexes of n reads chosen at random (from one library,
+        if given)
+        """
+        first, last = (0, self.n_reads) if lib is None else \
+            self.lib_range(lib)
+        rng = np.random.RandomState(seed)
+        n = min(n, last - first)
+        return np.sort(rng.choice(np.arange(first, last), size=n,
+                                  replace=False))
+
+    def write_fastq(self, outpath, indexes=None, lib=None):
+        """ stream reads back out as fastq (with binned qualities) for
+        tools that need it; all reads of lib (or of the store) unless
+        indexes are given.  returns the number of reads written
+        """
+        if indexes is None:
+            first, last = (0, self.n_reads) if lib is None else \
+                self.lib_range(lib)
+            indexes = range(first, last)
+        count = 0
+        with open(outpath, "w") as outf:
+            for idx in indexes:
+                outf.write("@{0}\n{1}\n+\n{2}\n".format(
+                    self.names[idx], self.get_seq(idx), self.get_qual(idx)))
+                count = count + 1
+        return count
+
+
+if __name__ == "__main__":
+    args = get_args()
+    output_root = os.path.abspath(os.path.expanduser(args.output))
+    os.makedirs(output_root, exist_ok=True)
+    logger = set_up_logging(verbosity=args.verbosity,
+                            outfile=os.path.join(output_root,
+                                                 "riboReadStore.log"),
+                            name=__name__)
+    logger.info("Usage:\n{0}\n".format(" ".join([x for x in sys.argv])))
+    fastqs = [(lib, path) for lib, path in [("readF", args.fastq1),
+                                            ("readR", args.fastq2),
+                                            ("readS0", args.fastqS1)]
+              if path is not None]
+    if len(fastqs) == 0:
+        logger.error("no reads given!")
+        sys.exit(1)
+    t0 = time.time()
+    try:
+        store = open_shared_read_store(output_root, fastqs, logger=logger)
+    except Exception as e:
+        logger.error(e)
+        logger.error(last_exception())
+        sys.exit(1)
+    for lib in store.libraries():
+        logger.info("%s: %i reads, mean length %.1f", lib,
+                    store.count_reads(lib), store.mean_read_length(lib))
+    logger.info("read store: %s", store.path)
+    logger.info("Time taken: %.2fs" % (time.time() - t0))
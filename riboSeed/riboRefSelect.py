@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""
+Rank candidate reference genomes by how much of each one is contained in
+a read set, before committing to a genome-wide mapping.
+
+Each reference is reduced to a FracMinHash sketch: the canonical k-mers of
+the sequence are hashed to 64 bit integers, and only the hashes below
+2^64 / scaled are kept.  Because the same threshold is applied to the
+reads, the fraction of a reference's sketch found in the reads' sketch
+estimates the fraction of the reference's k-mers present in the isolate.
+
+The sketch database is built once (it is just a .npz file) and can be
+added to later; sketching a read set is a single streaming pass.
+
+USAGE:
+ $ riboRefSelect.py -d refs.npz -g ./candidate_genbanks/
+ $ riboRefSelect.py -d refs.npz -F reads_1.fq -R reads_2.fq -o ./refselect/
+"""
+
+import argparse
+import sys
+import time
+import gzip
+import json
+import os
+import traceback
+
+import numpy as np
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+from pyutilsnrw.utils3_5 import set_up_logging
+from Bio import SeqIO
+
+# 2-bit codes for nucleotides; anything else breaks the k-mer
+NT_CODES = np.full(256, 4, dtype=np.uint8)
+for _nt, _code in zip("ACGTacgt", [0, 1, 2, 3, 0, 1, 2, 3]):
+    NT_CODES[ord(_nt)] = _code
+
+# --------------------------- methods --------------------------- #
+
+
+def get_args():  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Build a k-mer sketch database of candidate " +
+        "references, and rank them by containment in a read set to pick " +
+        "the reference for riboSelect/riboSeed",
+        add_help=False)  # to allow for custom help
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument("-d", "--db", dest='db', action="store",
+                               help="sketch database (.npz); created if " +
+                               "it does not exist", type=str,
+                               required=True)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("-g", "--genbanks", dest='genbanks',
+                          action="store", nargs="+", default=[],
+                          help="GenBank files, or directories of GenBank " +
+                          "files, to add to the database", type=str)
+    optional.add_argument("-F", "--fastq1", dest='fastq1', action="store",
+                          help="forward fastq reads, can be compressed",
+                          type=str, default=None)
+    optional.add_argument("-R", "--fastq2", dest='fastq2', action="store",
+                          help="reverse fastq reads, can be compressed",
+                          type=str, default=None)
+    optional.add_argument("-S1", "--fastq_single1", dest='fastqS1',
+                          action="store",
+                          help="single fastq reads", type=str, default=None)
+    optional.add_argument("-o", "--output", dest='output', action="store",
+                          help="output directory for the ranking; " +
+                          "default: %(default)s", default=os.getcwd(),
+                          type=str)
+    optional.add_argument("-k", "--kmer_size", dest='kmer_size',
+                          action="store", default=21, type=int,
+                          help="k-mer size, at most 31; only used when " +
+                          "creating a new database; default: %(default)s")
+    optional.add_argument("--scaled", dest='scaled', action="store",
+                          default=1000, type=int,
+                          help="keep roughly one in this many k-mers; " +
+                          "only used when creating a new database; " +
+                          "default: %(default)s")
+    optional.add_argument("--min_count", dest='min_count', action="store",
+                          default=2, type=int,
+                          help="ignore read k-mers seen fewer times than " +
+                          "this, as they are mostly sequencing errors; " +
+                          "default: %(default)s")
+    optional.add_argument("--max_reads", dest='max_reads', action="store",
+                          default=None, type=int,
+                          help="stop after this many reads per file; " +
+                          "default: use all reads")
+    optional.add_argument("-v", "--verbosity", dest='verbosity',
+                          action="store",
+                          default=2, type=int, choices=[1, 2, 3, 4, 5],
+                          help="Logger writes debug to file in output dir; " +
+                          "this sets verbosity level sent to stderr. " +
+                          " 1 = debug(), 2 = info(), 3 = warning(), " +
+                          "4 = error() and 5 = critical(); " +
+                          "default: %(default)s")
+    optional.add_argument("-h", "--help",
+                          action="help", default=argparse.SUPPRESS,
+                          help="Displays this help message")
+    args = parser.parse_args()
+    return args
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def mix64(x):
+    """ splitmix64 finalizer; spreads k-mer integers over the whole
+    uint64 range so a threshold picks an unbiased fraction of them
+    """
+    x = x.copy()
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def sequence_kmer_hashes(seq, k=21):
+    """ return the hashes of the canonical k-mers of seq (a str or bytes),
+    one per valid window, in order.  Windows containing anything other
+    than ACGT are skipped, so sequences can be joined with N's and hashed
+    in one call
+    """
+    assert 0 < k < 32, "k must be between 1 and 31"
+    if isinstance(seq, str):
+        seq = seq.encode("ascii", "replace")
+    codes = NT_CODES[np.frombuffer(seq, dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    valid = codes < 4
+    wide = np.where(valid, codes, 0).astype(np.uint64)
+    fwd = np.zeros(n, dtype=np.uint64)
+    rev = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        fwd = (fwd << np.uint64(2)) | wide[j: j + n]
+        rev |= (np.uint64(3) - wide[j: j + n]) << np.uint64(2 * j)
+    # a window is usable only if it has no ambiguous bases
+    bad = np.concatenate(([0], np.cumsum(~valid, dtype=np.int64)))
+    ok = (bad[k:] - bad[:-k]) == 0
+    return mix64(np.minimum(fwd, rev)[ok])
+
+
+def hash_threshold(scaled):
+    """ hashes below this value are kept in a sketch
+    """
+    return np.uint64((2 ** 64 - 1) // scaled)
+
+
+def sketch_sequences(seqs, k=21, scaled=1000):
+    """ FracMinHash sketch (sorted unique uint64 hashes) of several
+    sequences, such as the records of a genome
+    """
+    keep = []
+    thresh = hash_threshold(scaled)
+    for seq in seqs:
+        hashes = sequence_kmer_hashes(seq, k=k)
+        keep.append(hashes[hashes < thresh])
+    if len(keep) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique(np.concatenate(keep))
+
+
+def open_maybe_gzip(path):
+    """ open plain or gzipped text for reading
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path, "r")
+
+
+def read_fastq_seqs(path, max_reads=None):
+    """ yield the sequence lines of a fastq without parsing the rest
+    """
+    with open_maybe_gzip(path) as inf:
+        for idx, line in enumerate(inf):
+            if idx % 4 == 1:
+                yield line.strip()
+                if max_reads is not None and (idx // 4) + 1 >= max_reads:
+                    break
+
+
+def sketch_reads(fastqs, k=21, scaled=1000, min_count=2, max_reads=None,
+                 batch_size=20000, logger=None):
+    """ stream one or more fastqs, keeping only the hashes below the
+    threshold, and return the sorted unique hashes seen at least min_count
+    times, along with the number of reads looked at.  Reads are hashed in
+    batches joined by an N, so each batch is a single vectorized call
+    """
+    thresh = hash_threshold(scaled)
+    kept = []
+    nreads = 0
+    for fastq in fastqs:
+        if logger:
+            logger.info("sketching reads from %s", fastq)
+        batch = []
+        for seq in read_fastq_seqs(fastq, max_reads=max_reads):
+            batch.append(seq)
+            if len(batch) == batch_size:
+                hashes = sequence_kmer_hashes("N".join(batch), k=k)
+                kept.append(hashes[hashes < thresh])
+                nreads = nreads + len(batch)
+                batch = []
+        if len(batch) != 0:
+            hashes = sequence_kmer_hashes("N".join(batch), k=k)
+            kept.append(hashes[hashes < thresh])
+            nreads = nreads + len(batch)
+    if len(kept) == 0:
+        return (np.zeros(0, dtype=np.uint64), nreads)
+    uniq, counts = np.unique(np.concatenate(kept), return_counts=True)
+    return (uniq[counts >= min_count], nreads)
+
+
+def find_genbanks(paths):
+    """ expand directories into the GenBank files they contain
+    """
+    gbs = []
+    for path in paths:
+        if os.path.isdir(path):
+            gbs.extend(sorted(
+                os.path.join(path, x) for x in os.listdir(path)
+                if os.path.splitext(x)[1] in [".gb", ".gbk", ".genbank"]))
+        else:
+            gbs.append(path)
+    return gbs
+
+
+class SketchDB(object):
+    """ sketches of candidate references, stored as one .npz: a single
+    concatenated array of hashes, the offset of each reference's sketch in
+    it, and a JSON string with the settings and per-reference metadata
+    """
+    def __init__(self, k=21, scaled=1000):
+        self.k = k
+        self.scaled = scaled
+        self.refs = []  # dicts of name, path, n_records, length
+        self.sketches = []
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            hashes = data["hashes"]
+            offsets = data["offsets"]
+        db = cls(k=meta["k"], scaled=meta["scaled"])
+        db.refs = meta["refs"]
+        db.sketches = [hashes[offsets[i]: offsets[i + 1]]
+                       for i in range(len(db.refs))]
+        return db
+
+    def save(self, path):
+        meta = {"k": self.k, "scaled": self.scaled, "refs": self.refs}
+        offsets = np.zeros(len(self.sketches) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x in self.sketches])
+        hashes = np.concatenate(self.sketches) if len(self.sketches) != 0 \
+            else np.zeros(0, dtype=np.uint64)
+        # write to a temp name so an interrupted save keeps the old db
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, hashes=hashes, offsets=offsets,
+                 meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+
+    def add_genbank(self, gb, logger=None):
+        """ sketch all the records of a GenBank file; re-adding a file
+        replaces its old sketch
+        """
+        path = os.path.abspath(gb)
+        seqs = []
+        length = 0
+        with open(gb, "r") as inf:
+            for rec in SeqIO.parse(inf, "genbank"):
+                seqs.append(str(rec.seq))
+                length = length + len(rec.seq)
+        if len(seqs) == 0:
+            raise ValueError("no GenBank records found in %s" % gb)
+        sketch = sketch_sequences(seqs, k=self.k, scaled=self.scaled)
+        entry = {"name": os.path.splitext(os.path.basename(gb))[0],
+                 "path": path, "n_records": len(seqs), "length": length}
+        for idx, ref in enumerate(self.refs):
+            if ref["path"] == path:
+                self.refs[idx] = entry
+                self.sketches[idx] = sketch
+                break
+        else:
+            self.refs.append(entry)
+            self.sketches.append(sketch)
+        if logger:
+            logger.debug("sketched %s: %i records, %i hashes", gb,
+                         len(seqs), len(sketch))
+
+    def rank(self, query):
+        """ return a list of dicts, best first, with the fraction of each
+        reference's sketch contained in the (sorted unique) query sketch,
+        and the identity that containment implies
+        """
+        results = []
+        for ref, sketch in zip(self.refs, self.sketches):
+            shared = int(np.count_nonzero(np.isin(
+                sketch, query, assume_unique=True)))
+            containment = shared / len(sketch) if len(sketch) != 0 else 0
+            res = dict(ref)
+            res.update({"shared": shared, "sketch_size": len(sketch),
+                        "containment": containment,
+                        "identity": containment ** (1 / self.k)})
+            results.append(res)
+        return sorted(results, key=lambda x: (-x["containment"],
+                                              -x["shared"]))
+
+
+def write_ranking(results, outfile):
+    """ tab-separated ranking, best reference first
+    """
+    with open(outfile, "w") as outf:
+        outf.write("\t".join(["rank", "name", "containment", "identity",
+                              "shared", "sketch_size", "length",
+                              "path"]) + "\n")
+        for idx, res in enumerate(results):
+            outf.write("{0}\t{1}\t{2:.4f}\t{3:.4f}\t{4}\t{5}\t{6}\t{7}\n".format(
+                idx + 1, res["name"], res["containment"], res["identity"],
+                res["shared"], res["sketch_size"], res["length"],
+                res["path"]))
+
+
+if __name__ == "__main__":
+    args = get_args()
+    output_root = os.path.abspath(os.path.expanduser(args.output))
+    os.makedirs(output_root, exist_ok=True)
+    log_path = os.path.join(output_root, "riboRefSelect.log")
+    logger = set_up_logging(verbosity=args.verbosity,
+                            outfile=log_path,
+                            name=__name__)
+    logger.info("Usage:\n{0}\n".format(" ".join([x for x in sys.argv])))
+    t0 = time.time()
+    if os.path.exists(args.db):
+        db = SketchDB.load(args.db)
+        logger.info("loaded %i sketches from %s (k=%i, scaled=%i)",
+                    len(db.refs), args.db, db.k, db.scaled)
+    else:
+        if not 0 < args.kmer_size < 32:
+            logger.error("--kmer_size must be between 1 and 31")
+            sys.exit(1)
+        db = SketchDB(k=args.kmer_size, scaled=args.scaled)
+    gbs = find_genbanks(args.genbanks)
+    if len(gbs) != 0:
+        for gb in gbs:
+            try:
+                db.add_genbank(gb, logger=logger)
+            except Exception as e:
+                logger.error("could not sketch %s: %s", gb, e)
+                logger.error(last_exception())
+                sys.exit(1)
+        db.save(args.db)
+        logger.info("saved %i sketches to %s", len(db.refs), args.db)
+    fastqs = [x for x in [args.fastq1, args.fastq2, args.fastqS1]
+              if x is not None]
+    if len(fastqs) == 0:
+        logger.info("no reads given; nothing to rank")
+        sys.exit(0)
+    if len(db.refs) == 0:
+        logger.error("the sketch database is empty; add references with -g")
+        sys.exit(1)
+    query, nreads = sketch_reads(fastqs, k=db.k, scaled=db.scaled,
+                                 min_count=args.min_count,
+                                 max_reads=args.max_reads, logger=logger)
+    logger.info("kept %i hashes from %i reads", len(query), nreads)
+    results = db.rank(query)
+    write_ranking(results, os.path.join(output_root, "ranking.tsv"))
+    with open(os.path.join(output_root, "best_reference.txt"), "w") as outf:
+        outf.write(results[0]["path"] + "\n")
+    for res in results[0:5]:
+        logger.info("%s: containment %.3f, identity ~%.3f", res["name"],
+                    res["containment"], res["identity"])
+    logger.info("Time taken: %.2fs" % (time.time() - t0))
+    print(results[0]["path"])
@@ -11,6 +11,8 @@ import argparse
 import sys
 import time
 import random
+import io
+import gzip
 import logging
 import os
 import shutil
@@ -19,6 +21,12 @@ import subprocess
 import traceback
 import pysam
 import math
+import numpy as np
+import re
+import json
+import hashlib
+import heapq
+import tempfile
 import pkg_resources
 
 try:  # development mode
@@ -28,37 +36,40 @@ except ImportError:  # ie, if an installed pkg from pip or other using setup.py
 
 from bisect import bisect
 from itertools import chain
-from collections import namedtuple
+from collections import namedtuple, Counter
 from Bio import SeqIO
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 from Bio.Alphabet import IUPAC
 
-try:
-    import numpy as np
-    import matplotlib as mpl
-    mpl.use('Agg')
-    import matplotlib.pyplot as plt
-    import matplotlib.patches as patches
-    PLOT = True
-except Exception as e:  # most likely an ImportError, but Im not taking chances
-    print(e)
-    print("\nlooks like you have some issue with matplotlib.  " +
-          "Classic matplotlib, amirite? Plotting is disabled\n")
-    PLOT = False
-
 
 # need this line for unittesting
 sys.path.append(os.path.join('..', 'riboSeed'))
 
 from pyutilsnrw.utils3_5 import set_up_logging, \
     combine_contigs, get_ave_read_len_from_fastq, \
-    get_number_mapped, \
-    keep_only_first_contig, get_fasta_lengths, \
     file_len, check_version_from_cmd
 
 from riboSnag import parse_clustered_loci_file, pad_genbank_sequence, \
-    extract_coords_from_locus
+    extract_coords_from_locus, describe, ClusterRegistry
+
+from riboWorker import run_cmd_lists_on_queue, kill_process_tree, \
+    subprocess_run_list_watched, get_straggler_timeout
+
+from riboReadStore import open_shared_read_store
+
+from riboStats import assembly_stats, write_stats_report
+
+from riboRefSelect import sequence_kmer_hashes
+
+from riboFigures import FigureService, summarize_score_counts
+
+from riboToolchain import open_toolchain_manifest, cached_check
+from riboMappers import get_mapper_backend
+from riboCatalog import RunCatalog, requested_catalog_path
+from riboArchive import archive_directories
+from riboGenbank import open_genbank_cache, default_cache_dir, \
+    IndexedFasta, seq_metadata, sequence_metadata, SequenceMetadata
 
 # GLOBALS
 SAMTOOLS_MIN_VERSION = '1.3.1'
@@ -71,7 +82,8 @@ class SeedGenome(object):
     current iteration as execution progresses.
 
     When instantiated, self.check_mands() checks that all required attributes
-    are present, self.attach_genome_seqRecords() parses and loads the gb data,
+    are present, the gb data is loaded from the GenBank cache (parsing it
+    only if this file hasn't been seen before),
     self.write_fasta_genome() writes a .fasta version of the genome for later
     use, and self.make_map_paths_and_dir() sets up the required directories for
     each iteration
@@ -84,7 +96,8 @@ class SeedGenome(object):
                  max_iterations=None, initial_map_sam=None, unmapped_sam=None,
                  clustered_loci_txt=None, seq_records=None, master_ngs_ob=None,
                  initial_map_sorted_bam=None, initial_map_prefix=None,
-                 assembled_seeds=None, seq_records_count=None, logger=None):
+                 assembled_seeds=None, seq_records_count=None,
+                 genbank_cache_dir=None, logger=None):
         self.name = name  # get from commsanline in case running multiple
         self.this_iteration = this_iteration  # this should always start at 0
         self.max_iterations = max_iterations
@@ -130,6 +143,12 @@ class SeedGenome(object):
         # a logger
         self.logger = logger
         self.check_mands()
+        # parsed once; see riboGenbank
+        if genbank_cache_dir is None:
+            genbank_cache_dir = default_cache_dir(self.output_root)
+        self.genbank = open_genbank_cache(self.genbank_path,
+                                          cache_dir=genbank_cache_dir,
+                                          logger=logger)
         # self.attach_genome_seqrecords()  # this method comes first,
         self.refreshSeqRecGenerator()  # this method comes first,
         # sets self.seq_records_count
@@ -172,10 +191,7 @@ class SeedGenome(object):
             os.path.basename(self.genbank_path))[0]
         self.ref_fasta = os.path.join(self.output_root,
                                       str(self.name + ".fasta"))
-        with open(self.genbank_path, 'r') as fh:
-            with open(self.ref_fasta, 'w') as outfh:
-                sequences = SeqIO.parse(fh, "genbank")
-                count = SeqIO.write(sequences, outfh, "fasta")
+        count = self.genbank.write_fasta(self.ref_fasta)
         assert count == self.seq_records_count, "Error parsing genbank file!"
         self.refreshSeqRecGenerator()
 
@@ -193,20 +209,9 @@ class SeedGenome(object):
                 os.path.basename(self.ref_fasta),
                 str(os.path.splitext(self.ref_fasta)[0] +
                     "_padded.fasta"))
-            with open(self.genbank_path, 'r') as fh:
-                with open(new_fasta_ref, 'w') as outfh:
-                    recs = SeqIO.parse(fh, "genbank")
-                    count = 0
-                    for rec in recs:
-                        new_rec = SeqRecord(
-                            id=rec.id,
-                            seq=Seq(str(rec.seq[-pad:] + rec.seq +
-                                    rec.seq[0: pad]),
-                                    IUPAC.IUPACAmbiguousDNA()))
-                        SeqIO.write(new_rec, outfh, "fasta")
-                        count = count + 1
-                    assert count == self.seq_records_count, \
-                        "Error parsing genbank file!"
+            count = self.genbank.write_padded_fasta(new_fasta_ref, pad=pad)
+            assert count == self.seq_records_count, \
+                "Error parsing genbank file!"
             self.ref_fasta = new_fasta_ref
         else:
             pass
@@ -214,15 +219,15 @@ class SeedGenome(object):
     def countSeqRecords(self):
         """ Nothing fancy; just a quick way to get the number of records
         """
-        self.seq_records_count = sum(1 for x in self.seq_records)
-        self.refreshSeqRecGenerator()
+        self.seq_records_count = self.genbank.count
 
     def refreshSeqRecGenerator(self):
         """instead of using stored genbank records, this method restarts
         the generator so that each time self.seq_records is accessed
-        this method can get things going again
+        this method can get things going again.  The records come from
+        the GenBank cache, so this doesnt parse anything
         """
-        self.seq_records = SeqIO.parse(self.genbank_path, "genbank")
+        self.seq_records = self.genbank.iter_seq_records()
 
     def purge_old_files(self, all_iters=False, logger=None):
         """ remove bulky files from two iterations ago, or if
@@ -273,7 +278,7 @@ class NgsLib(object):
                  readS0=None, readS1=None, mapping_success=False,
                  smalt_dist_path=None, readlen=None, make_dist=False,
                  libtype=None, logger=None, mapper_exe=None, liblist=None,
-                 ref_fasta=None):
+                 ref_fasta=None, read_store=None):
         self.name = name
         # Bool: whether this is a master record
         self.master = master
@@ -285,8 +290,15 @@ class NgsLib(object):
         self.readR = readR
         # singleton Fastq path
         self.readS0 = readS0
-        # other singleton fastq path (thining ahead, but not really...)
-        self.readS1 = readS1
+        # list of any additional singleton fastq paths
+        if readS1 is None:
+            self.readS1 = []
+        elif isinstance(readS1, str):
+            self.readS1 = [readS1]
+        else:
+            self.readS1 = list(readS1)
+        if self.readS0 is None and len(self.readS1) != 0:
+            self.readS0 = self.readS1.pop(0)
         # detected from Forward fastq with gget_readlen below
         self.readlen = readlen  # set this dynamically
         # bool: did mapping have errors?
@@ -300,6 +312,9 @@ class NgsLib(object):
         # results of distance mapping
         self.smalt_dist_path = smalt_dist_path  # set this dynamically
         self.liblist = liblist  # make dynamically
+        # optional ReadStore of the master reads, used instead of the fastqs
+        # for passes we make ourselves
+        self.read_store = read_store
         self.logger = logger
         self.check_mands()
         self.set_libtype()
@@ -341,7 +356,11 @@ class NgsLib(object):
         """
         if self.master is not True:
             return None
-
+        if self.read_store is not None:
+            self.readlen = self.read_store.mean_read_length(
+                "readF" if self.libtype in ['pe', 'pe_s'] else "readS0",
+                N=36)
+            return None
         if self.libtype in ['pe', 'pe_s']:
             self.readlen = get_ave_read_len_from_fastq(
                 self.readF, N=36, logger=self.logger)
@@ -388,7 +407,7 @@ class NgsLib(object):
 
         for f in [self.readF,
                   self.readR,
-                  self.readS0]:
+                  self.readS0] + self.readS1:
             if f is not None:
                 if os.path.isfile(f):
                     if f not in master.liblist:
@@ -402,9 +421,14 @@ class NgsLib(object):
 
     def listLibs(self):
         self.liblist = [x for x in
-                        [self.readF, self.readR, self.readS0, self.readS1]
+                        [self.readF, self.readR, self.readS0] + self.readS1
                         if x is not None]
 
+    def single_libs(self):
+        """ all the singleton libraries, readS0 first
+        """
+        return [x for x in [self.readS0] + self.readS1 if x is not None]
+
 
 class LociMapping(object):
     """
@@ -424,7 +448,7 @@ class LociMapping(object):
                  mapped_ids_txt=None, unmapped_bam=None,
                  mappedS=None, assembled_contig=None, assembly_subdir=None,
                  mapped_ngsLib=None, unmapped_ngsLib=None,
-                 assembly_subdir_needed=True):
+                 mapping_stats_json=None, assembly_subdir_needed=True):
         # int: current iteration (0 is initial)
         self.iteration = iteration
         self.name = name
@@ -447,9 +471,12 @@ class LociMapping(object):
         self.unmapped_sam = unmapped_sam
         self.unmapped_bam = unmapped_bam
         self.sorted_mapped_bam = sorted_mapped_bam  # used with intial mapping
+        self.mapping_stats_json = mapping_stats_json  # see MappingStats
         self.mapped_ngsLib = mapped_ngsLib
         self.unmapped_ngsLib = unmapped_ngsLib
         self.assembled_contig = assembled_contig
+        # (seed, reference, contig) lengths, set by evaluate_spades_success
+        self.contig_lengths = None
         #
         self.check_mands()
         self.make_mapping_subdir()
@@ -485,6 +512,7 @@ class LociMapping(object):
         self.mapped_sam = str(mapping_prefix + ".sam")
         self.unmapped_sam = str(mapping_prefix + "_unmapped.sam")
         self.mapped_ids_txt = str(mapping_prefix + "_mapped.txt")
+        self.mapping_stats_json = str(mapping_prefix + "_mapping_stats.json")
 
     def make_assembly_subdir(self):
         """ make a subdirectory for assembly if it is needed """
@@ -503,10 +531,10 @@ class Exes(object):
     path and verifying with shutil.which that the executable is availible
     to the program.
 
-
+    quast and python2_7 are only needed with --run_quast, and can be None.
     """
     def __init__(self, samtools, method, spades, quast, python2_7,
-                 smalt, bwa, check=True, mapper=None):
+                 smalt, bwa, check=True, mapper=None, minimap2="minimap2"):
         self.samtools = samtools
         self.method = method
         self.mapper = mapper
@@ -514,6 +542,7 @@ class Exes(object):
         self.quast = quast
         self.smalt = smalt
         self.bwa = bwa
+        self.minimap2 = minimap2
         self.python2_7 = python2_7
         self.check = check
         self.check_mands()
@@ -523,10 +552,9 @@ class Exes(object):
     def check_mands(self):
         """ checks that all mandatory arguments are not none
         """
-        mandatory = [self.spades, self.quast, self.method,
-                     self.samtools, self.python2_7]
+        mandatory = [self.spades, self.method, self.samtools]
         assert None not in mandatory, \
-            "must instantiate with samtools, spades, method, python2_7, quast!"
+            "must instantiate with samtools, spades, and method!"
 
     def set_mapper(self):
         """Exes.mapper attribute is set here to avoid further
@@ -536,6 +564,8 @@ class Exes(object):
             self.mapper = self.smalt
         elif self.method == "bwa":
             self.mapper = self.bwa
+        elif self.method == "minimap2":
+            self.mapper = self.minimap2
         else:
             raise ValueError("Mapping method not found!")
 
@@ -546,6 +576,9 @@ class Exes(object):
         if self.check:
             for exe in ["mapper", "samtools", "spades",
                         "quast", "python2_7", "mapper"]:
+                if exe in ["quast", "python2_7"] and \
+                   getattr(self, exe) is None:
+                    continue
                 exe_groomed = os.path.expanduser(getattr(self, exe))
                 exe_groomed = shutil.which(exe_groomed)
                 if exe_groomed is None:
@@ -598,9 +631,10 @@ def get_args():  # pragma: no cover
     optional.add_argument("-S1", "--fastq_single1", dest='fastqS1',
                           action="store",
                           help="single fastq reads", type=str, default=None)
-    # optional.add_argument("-S2", "--fastq_single2", dest='fastqS2',
-    #                       action="store",
-    #                       help="single fastq reads", type=str, default=None)
+    optional.add_argument("-S2", "--fastq_single2", dest='fastqS2',
+                          action="store", nargs="+",
+                          help="additional single fastq libraries; give " +
+                          "as many as you have", type=str, default=None)
     optional.add_argument("-n", "--experiment_name", dest='exp_name',
                           action="store",
                           help="prefix for results files; " +
@@ -611,8 +645,10 @@ def get_args():  # pragma: no cover
                           "default: %(default)s",
                           default=1000, type=int, dest="flanking")
     optional.add_argument("-m", "--method_for_map", dest='method',
-                          action="store", choices=["smalt", "bwa"],
-                          help="available mappers: smalt and bwa; " +
+                          action="store",
+                          choices=["smalt", "bwa", "minimap2"],
+                          help="available mappers: smalt, bwa, and " +
+                          "minimap2 (short read mode); " +
                           "default: %(default)s",
                           default='bwa', type=str)
     optional.add_argument("-c", "--cores", dest='cores', action="store",
@@ -694,7 +730,9 @@ def get_args():  # pragma: no cover
                           "SPAdes will treat as --untrusted-contig. if '', " +
                           "seeds will not be used during assembly. " +
                           "See SPAdes docs; default: if mapping " +
-                          "percentage over 80%%: 'trusted', else 'untrusted'")
+                          "percentage over 80%%: 'trusted', else " +
+                          "'untrusted' (when warm started with " +
+                          "--seed_library, 'trusted')")
     optional.add_argument("--clean_temps", dest='clean_temps',
                           default=False, action="store_true",
                           help="if --clean_temps, mapping files will be " +
@@ -747,6 +785,148 @@ def get_args():  # pragma: no cover
                           help="if --serialize, runs seeding and assembly " +
                           "without multiprocessing. This is recommended for " +
                           "machines with less than 8GB RAM: %(default)s")
+    optional.add_argument("--map_cache_dir", dest='map_cache_dir',
+                          action="store",
+                          default=None, type=str,
+                          help="if set (and not mapping with SMALT), the " +
+                          "filtered iteration 0 mapping " +
+                          "is stored in (and reused from) this directory, " +
+                          "keyed by the reads, reference, mapper, " +
+                          "--mapper_args and --score_min. Useful when " +
+                          "rerunning the same data with different " +
+                          "parameters; default: %(default)s")
+    optional.add_argument("--queue_dir", dest='queue_dir',
+                          action="store",
+                          default=None, type=str,
+                          help="if set, subassemblies and final assemblies " +
+                          "are written as jobs to this shared directory " +
+                          "instead of run with multiprocessing; start one " +
+                          "or more riboWorker.py processes (on this or " +
+                          "other hosts) pointing to the same directory to " +
+                          "run them. default: %(default)s")
+    optional.add_argument("--queue_poll", dest='queue_poll',
+                          action="store",
+                          default=5, type=float,
+                          help="seconds between checks for finished " +
+                          "jobs when using --queue_dir; " +
+                          "default: %(default)s")
+    optional.add_argument("--dedup", dest='dedup',
+                          action="store_true", default=False,
+                          help="before each subassembly, collapse " +
+                          "duplicate reads (or pairs) mapping to the " +
+                          "same position, keeping the best quality " +
+                          "copy; default: %(default)s")
+    optional.add_argument("--async_clusters", dest='async_clusters',
+                          action="store_true", default=False,
+                          help="after the genome-wide first iteration, " +
+                          "let each cluster iterate on its own, mapping " +
+                          "against just its own contig (only its own " +
+                          "reads and those that mapped nowhere in the " +
+                          "first iteration), rather than " +
+                          "waiting for every cluster each iteration. " +
+                          "Clusters no longer compete for multimapping " +
+                          "reads. Not with SMALT; default: %(default)s")
+    optional.add_argument("--toolchain_cache", dest='toolchain_cache',
+                          action="store",
+                          default=None, type=str,
+                          help="JSON manifest of the tool checks already " +
+                          "passed (samtools version, SMALT bam support), " +
+                          "so they are only rerun when a binary changes; " +
+                          "default: $RIBOSEED_TOOLCHAIN_CACHE if set, " +
+                          "otherwise the checks are run every time")
+    optional.add_argument("--recheck_tools", dest='recheck_tools',
+                          action="store_true", default=False,
+                          help="ignore the recorded tool checks and run " +
+                          "them all again; default: %(default)s")
+    optional.add_argument("--catalog", dest='catalog',
+                          action="store",
+                          default=None, type=str,
+                          help="SQLite catalog (shared between runs) to " +
+                          "add this run's per-iteration metrics to; query " +
+                          "it with riboCatalog.py. default: " +
+                          "$RIBOSEED_CATALOG if set, else the run is not " +
+                          "catalogued")
+    optional.add_argument("--archive_intermediates",
+                          dest='archive_intermediates',
+                          action="store_true", default=False,
+                          help="once an iteration is done with, pack its " +
+                          "per-cluster mapping and assembly directories " +
+                          "into one zip (intermediates/iteration_N.zip), " +
+                          "to save inodes; see riboArchive.py. " +
+                          "default: %(default)s")
+    optional.add_argument("--no_figures", dest='no_figures',
+                          action="store_true", default=False,
+                          help="dont draw any figures (or load " +
+                          "matplotlib); the text reports are still " +
+                          "written; default: %(default)s")
+    optional.add_argument("--precheck_depth", dest='precheck_depth',
+                          action="store_true", default=False,
+                          help="before any mapping, estimate the depth " +
+                          "over each cluster's flanking regions from the " +
+                          "k-mers of a sample of the reads, write it to " +
+                          "predicted_flank_depths.tsv, and drop clusters " +
+                          "predicted to fall below --min_flank_depth; " +
+                          "default: %(default)s")
+    optional.add_argument("--precheck_reads", dest='precheck_reads',
+                          action="store",
+                          default=100000, type=int,
+                          help="reads sampled from each library for " +
+                          "--precheck_depth; default: %(default)s")
+    optional.add_argument("--seed_library", dest='seed_library',
+                          action="store",
+                          default=None, type=str,
+                          help="long reads from a previous riboSeed run " +
+                          "(riboSeedContigs.fasta, or a final_long_reads " +
+                          "directory). If a read matches every cluster, " +
+                          "the first mapping is to these rather than to " +
+                          "the reference; default: %(default)s")
+    optional.add_argument("--seed_min_similarity",
+                          dest='seed_min_similarity',
+                          action="store",
+                          default=0.8, type=float,
+                          help="fraction of the k-mers of each of a " +
+                          "cluster's flanking regions that must be in a " +
+                          "--seed_library read to match it; " +
+                          "default: %(default)s")
+    optional.add_argument("--read_store", dest='read_store',
+                          action="store",
+                          default=None, type=str,
+                          help="directory of read stores, shared between " +
+                          "runs: the reads are packed once into a 2-bit " +
+                          "store keyed by a hash of the read files, and " +
+                          "any later run on the same reads reuses it.  " +
+                          "riboSeed's own passes over the reads (read " +
+                          "length, pairing check, --precheck_depth " +
+                          "sampling) then use the store; the mappers " +
+                          "and SPAdes still read the fastqs; " +
+                          "default: %(default)s")
+    optional.add_argument("--straggler_factor", dest='straggler_factor',
+                          action="store",
+                          default=5, type=float,
+                          help="once half of an iteration's subassemblies " +
+                          "are done, kill any still running after this " +
+                          "many times the median time taken, and drop " +
+                          "those clusters. 0 disables; " +
+                          "default: %(default)s")
+    optional.add_argument("--min_job_timeout", dest='min_job_timeout',
+                          action="store",
+                          default=1800, type=float,
+                          help="never kill a subassembly as a straggler " +
+                          "before it has run for this many seconds; " +
+                          "default: %(default)s")
+    optional.add_argument("--oom_retries", dest='oom_retries',
+                          action="store",
+                          default=2, type=int,
+                          help="if a SPAdes assembly runs out of memory, " +
+                          "retry it up to this many times, each time with " +
+                          "half the threads and memory and without the " +
+                          "largest k-mer; default: %(default)s")
+    optional.add_argument("--min_free_mem", dest='min_free_mem',
+                          action="store",
+                          default=1, type=float,
+                          help="GB of free memory to wait for before " +
+                          "starting each assembly (linux only); " +
+                          "default: %(default)s")
     optional.add_argument("--smalt_scoring", dest='smalt_scoring',
                           action="store",
                           default="match=1,subst=-4,gapopen=-4,gapext=-3",
@@ -755,13 +935,14 @@ def get_args():  # pragma: no cover
                           "scorespec option; default: %(default)s")
     optional.add_argument("--mapper_args", dest='mapper_args',
                           action="store",
-                          default="-L 0,0 -U 0 -a",
+                          default=None,
                           help="submit custom parameters to mapper. " +
-                          "And by mapper, I mean bwa, cause we dont support " +
-                          "this option for SMALT, sorry. " +
+                          "And by mapper, I mean bwa or minimap2, cause " +
+                          "we dont support this option for SMALT, sorry. " +
                           "This requires knowledge of your chosen mapper's " +
                           "optional arguments. Proceed with caution!  " +
-                          "default: %(default)s")
+                          "default: '-L 0,0 -U 0 -a' for bwa, none for " +
+                          "minimap2")
 
     # # had to make this explicitly to call it a faux optional arg
     optional.add_argument("-h", "--help",
@@ -785,6 +966,16 @@ def get_args():  # pragma: no cover
                           action="store", default="bwa",
                           help="Path to BWA executable;" +
                           " default: %(default)s")
+    optional.add_argument("--minimap2_exe", dest="minimap2_exe",
+                          action="store", default="minimap2",
+                          help="Path to minimap2 executable;" +
+                          " default: %(default)s")
+    optional.add_argument("--run_quast", dest="run_quast",
+                          action="store_true", default=False,
+                          help="also run QUAST against the reference on " +
+                          "the final assemblies, in the background. The " +
+                          "basic contig statistics are always reported " +
+                          "without it; default: %(default)s")
     optional.add_argument("--quast_exe", dest="quast_exe",
                           action="store", default="quast.py",
                           help="Path to quast executable; " +
@@ -887,6 +1078,7 @@ def test_smalt_bam_install(
     os.remove(test_bam)
     os.remove(str(test_index + ".sma"))
     os.remove(str(test_index + ".smi"))
+    return True
 
 
 def estimate_distances_smalt(outfile, smalt_exe, ref_genome,
@@ -928,11 +1120,17 @@ def estimate_distances_smalt(outfile, smalt_exe, ref_genome,
     return outfile
 
 
-def check_fastqs_len_equal(file1, file2):
+def check_fastqs_len_equal(file1, file2, read_store=None):
     """ using file_len from pyutilsnrw, check that the fastqs contain
     the same number of lines, ie tat the pairing looks proper.
+    If a read store is given, its read counts are compared instead.
     """
-    if file_len(file1) != file_len(file2):
+    if read_store is not None:
+        unequal = read_store.count_reads("readF") != \
+            read_store.count_reads("readR")
+    else:
+        unequal = file_len(file1) != file_len(file2)
+    if unequal:
         raise ValueError(
             "Input Fastq's are of unequal length! Try " +
             "fixing with this script: " +
@@ -966,6 +1164,14 @@ def nonify_empty_lib_files(ngsLib, logger=None):
             EMPTIES = EMPTIES + 1
             # set to None so mapper will ignore
             setattr(ngsLib, f, None)
+    for f in ngsLib.readS1[:]:
+        if not os.path.exists(f) or not os.path.getsize(f) > 0:
+            logger.warning("read file %s is missing or empty and will not " +
+                           "be used for mapping!", f)
+            ngsLib.readS1.remove(f)
+    if ngsLib.readS0 is None and len(ngsLib.readS1) != 0:
+        ngsLib.readS0 = ngsLib.readS1.pop(0)
+        EMPTIES = EMPTIES - 1
     if EMPTIES == 3:
         raise ValueError("None of the read files hold data!")
 
@@ -975,122 +1181,305 @@ def nonify_empty_lib_files(ngsLib, logger=None):
 #     "score_minimum single_lib scoring step k smalt_scoring")
 
 
-def map_to_genome_ref_smalt(mapping_ob, ngsLib, cores,
-                            samtools_exe, smalt_exe,
-                            genome_fasta,
-                            score_minimum=None,
-                            scoring="match=1,subst=-4,gapopen=-4,gapext=-3",
-                            step=3, k=5, logger=None):
-    """run smalt based on pased args
-    #TODO rework this to read libtype of ngslib object
-    requires at least paired end input, but can handle an additional library
-    of singleton reads. Will not work on just singletons
+def get_library_map_specs(ngsLib, mapping_ob):
+    """ one (label, fastqs, out_bam) tuple per library of the ngsLib: the
+    pair (if present), then each singleton library.  The first singleton
+    library keeps the mapping_ob.s_map_bam name, later ones get a number.
     """
+    specs = []
+    if ngsLib.readF is not None and ngsLib.readR is not None:
+        specs.append(("PE", [ngsLib.readF, ngsLib.readR],
+                      mapping_ob.pe_map_bam))
+    for idx, single in enumerate(ngsLib.single_libs()):
+        if idx == 0:
+            specs.append(("Singleton", [single], mapping_ob.s_map_bam))
+        else:
+            specs.append(("Singleton %i" % idx, [single], "{0}{1}.bam".format(
+                os.path.splitext(mapping_ob.s_map_bam)[0], idx)))
+    return specs
 
-    logger.info("Mapping reads to reference genome with SMALT")
-    # check min score
-    assert score_minimum is not None, "must sassign score outside map function!"
-    score_min = score_minimum
-    logger.debug(str("using a score min of " +
-                     "{0}").format(score_min))
-    # index the reference
-    cmdindex = str("{0} index -k {1} -s {2} {3} {3}").format(
-        smalt_exe, k, step, genome_fasta)
-    # map paired end reads to reference index
-    smaltcommands = [cmdindex]
-    if "pe" in ngsLib.libtype:
-        cmdmap = str('{0} map -l pe -S {1} ' +
-                     '-m {2} -n {3} -g {4} -f bam -o {5} {6} {7} ' +
-                     '{8}').format(smalt_exe, scoring,
-                                   score_min, cores, ngsLib.smalt_dist_path,
-                                   mapping_ob.pe_map_bam, genome_fasta,
-                                   ngsLib.readF,
-                                   ngsLib.readR)
-        smaltcommands.append(cmdmap)
-    else:
-        with open(mapping_ob.pe_map_bam, 'w') as tempfile:
-            tempfile.write("@HD riboseed_dummy_file")
-        pass
-    # if singletons are present, map those too.  Index is already made
-    if ngsLib.readS0 is not None:  # and not ignore_singletons:
-        # because erros are thrown if there is no file, this
-        cmdmapS = str(
-            "{0} map -S {1} -m {2} -n {3} -g {4} -f bam -o {5} " +
-            "{6} {7}").format(smalt_exe, scoring, score_min, cores,
-                              ngsLib.smalt_dist_path, mapping_ob.s_map_bam,
-                              genome_fasta, ngsLib.readS0)
-        with open(mapping_ob.s_map_bam, 'w') as tempfile:
-            tempfile.write("@HD riboseed_dummy_file")
-        # merge together the singleton and pe reads
-        cmdmergeS = '{0} merge -f {3} {1} {2}'.format(
-            samtools_exe, mapping_ob.pe_map_bam,
-            mapping_ob.s_map_bam, mapping_ob.mapped_bam)
-        smaltcommands.extend([cmdmapS, cmdmergeS])
-    else:
-        # if not already none, set to None when ignoring singleton
-        ngsLib.readS0 = None
-        # 'merge', but reallt just converts
-        cmdmerge = str("{0} view -bh {1} >" +
-                       "{2}").format(samtools_exe, mapping_ob.pe_map_bam, mapping_ob.mapped_bam)
-        smaltcommands.extend([cmdmerge])
-    logger.info("running SMALT:")
-    logger.debug("with the following SMALT commands:")
-    for i in smaltcommands:
-        logger.debug(i)
-        subprocess.run(i, shell=sys.platform != "win32",
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE, check=True)
-    # report simgpleton reads mapped
-    if ngsLib.readS0 is not None:
-        logger.info(str("Singleton mapped reads: " +
-                        get_number_mapped(mapping_ob.s_map_bam,
-                                          samtools_exe=samtools_exe)))
-    # report paired reads mapped
-    if "pe" in ngsLib.libtype:
-        logger.info(str("PE mapped reads: " +
-                        get_number_mapped(mapping_ob.pe_map_bam,
-                                          samtools_exe=samtools_exe)))
-    combined_map_string = get_number_mapped(mapping_ob.mapped_bam_unfiltered,
-                                            samtools_exe=samtools_exe)
-    logger.info(str("Combined mapped reads: " + combined_map_string))
-    # extract overall percentage as a float
-    map_percentage = float(combined_map_string.split("(")[1].split("%")[0])
-
-    # apparently there have been no errors, so mapping success!
-    ngsLib.mapping_success = True
-    return map_percentage
 
+def split_cores_by_size(file_lists, cores):
+    """ share out cores between libraries in proportion to the size of their
+    files, with at least one each.  Cores left over after rounding down go
+    to the libraries that lost the most to rounding.
+    """
+    sizes = [sum([os.path.getsize(x) for x in files]) for files in file_lists]
+    total = sum(sizes)
+    if total == 0 or cores <= len(sizes):
+        return [1 for x in sizes]
+    shares = [cores * x / total for x in sizes]
+    alloc = [max(1, int(math.floor(x))) for x in shares]
+    by_remainder = sorted(range(len(sizes)),
+                          key=lambda i: alloc[i] - shares[i])
+    for i in by_remainder[0: max(0, cores - sum(alloc))]:
+        alloc[i] = alloc[i] + 1
+    return alloc
+
+
+def run_cmds_concurrently(cmds, logger=None):
+    """ start all the (shell) commands at once and wait for all of them.
+    stderr goes to a temp file rather than a pipe, as bwa writes enough
+    to stderr to fill a pipe buffer and hang.  Like subprocess.run with
+    check=True, raise CalledProcessError if any command fails.
+    """
+    assert logger is not None, "must use logging"
+    procs = []
+    for cmd in cmds:
+        logger.debug(cmd)
+        errf = tempfile.TemporaryFile()
+        procs.append((cmd, errf, subprocess.Popen(
+            cmd, shell=sys.platform != "win32",
+            stdout=subprocess.DEVNULL, stderr=errf)))
+    failed = None
+    for cmd, errf, proc in procs:
+        proc.wait()
+        errf.seek(0)
+        stderr = errf.read()
+        errf.close()
+        if proc.returncode != 0 and failed is None:
+            failed = subprocess.CalledProcessError(
+                proc.returncode, cmd, stderr=stderr)
+    if failed is not None:
+        logger.error("Error running %s:\n%s", failed.cmd,
+                     failed.stderr.decode("utf-8", "replace")[-2000:])
+        raise failed
+
+
+def bam_sort_key(read):
+    """ samtools sort order: by reference, then position, with the unplaced
+    unmapped reads at the end
+    """
+    if read.reference_id < 0:
+        return (sys.maxsize, 0)
+    return (read.reference_id, read.reference_start)
+
+
+class MappingStats(object):
+    """ MappingStats objects hold everything we report about a mapping,
+    gathered in the one pass merge_filter_bams makes over the alignments
+    rather than by rerunning samtools flagstat or rescanning the bams:
+    flagstat-style counts for all the libraries together and for each
+    library, a histogram of the alignment scores, a histogram of insert
+    sizes, and the number of reads (and their scores) written for each
+    cluster region.  They are saved as json alongside each mapping.
+    """
+    FLAG_FIELDS = ["total", "mapped", "secondary", "supplementary",
+                   "duplicates", "paired", "read1", "read2",
+                   "properly_paired", "with_mate_mapped", "singletons",
+                   "mate_diff_chr"]
+
+    def __init__(self, libraries=None, regions=None):
+        # flagstat-style counts
+        self.counts = {k: 0 for k in self.FLAG_FIELDS}
+        # [label, total, mapped] for each library, in the order mapped
+        self.libraries = [[x, 0, 0] for x in libraries or []]
+        # alignment score: count, for the placed reads
+        self.as_counts = Counter()
+        self.notag = 0
+        # template length: count, for the first read of proper pairs
+        self.insert_counts = Counter()
+        # number of reads that passed the filter
+        self.written = 0
+        # regions are (key, sequence name, start, end), 1-based inclusive
+        # like samtools regions; reads written to each are tallied by key
+        self.regions = [list(x) for x in regions or []]
+        self._region_tids = []
+        self.cluster_reads = {str(x[0]): 0 for x in self.regions}
+        self.cluster_as_counts = {str(x[0]): Counter() for x in self.regions}
+
+    @property
+    def total(self):
+        return self.counts["total"]
+
+    @property
+    def mapped(self):
+        return self.counts["mapped"]
+
+    def map_percentage(self):
+        return 100.0 * self.mapped / self.total if self.total != 0 else 0.0
+
+    def add_read(self, read, lib=0):
+        """ count a read as samtools flagstat would """
+        flag = read.flag
+        c = self.counts
+        c["total"] += 1
+        self.libraries[lib][1] += 1
+        if not flag & 0x4:
+            c["mapped"] += 1
+            self.libraries[lib][2] += 1
+        if flag & 0x400:
+            c["duplicates"] += 1
+        if flag & 0x100:
+            c["secondary"] += 1
+            return
+        if flag & 0x800:
+            c["supplementary"] += 1
+            return
+        if not flag & 0x1:
+            return
+        c["paired"] += 1
+        if flag & 0x40:
+            c["read1"] += 1
+        if flag & 0x80:
+            c["read2"] += 1
+        if flag & 0x4:
+            return
+        if flag & 0x2:
+            c["properly_paired"] += 1
+            if flag & 0x40 and read.template_length != 0:
+                self.insert_counts[abs(read.template_length)] += 1
+        if flag & 0x8:
+            c["singletons"] += 1
+        else:
+            c["with_mate_mapped"] += 1
+            if read.reference_id != read.next_reference_id:
+                c["mate_diff_chr"] += 1
+
+    def add_written(self, read, score=None):
+        """ tally a read that passed filtering against the regions """
+        self.written += 1
+        if read.reference_id < 0:
+            return
+        start = read.reference_start
+        end = read.reference_end or start + 1
+        for key, tid, rstart, rend in self._region_tids:
+            if tid == read.reference_id and start < rend and end >= rstart:
+                self.cluster_reads[key] += 1
+                if score is not None:
+                    self.cluster_as_counts[key][score] += 1
+
+    def set_region_tids(self, bam):
+        """ look up the reference ids for the regions in a bam's header """
+        self._region_tids = [(str(key), bam.get_tid(name), start, end) for
+                             key, name, start, end in self.regions]
+
+    def score_list(self, cluster=None):
+        """ the alignment scores (of the placed reads, or the reads written
+        for one cluster), expanded from the histogram, for plotting
+        """
+        counts = self.as_counts if cluster is None else \
+            self.cluster_as_counts[str(cluster)]
+        return [score for score, count in sorted(counts.items())
+                for i in range(count)]
+
+    def mean_insert_size(self):
+        n = sum(self.insert_counts.values())
+        if n == 0:
+            return 0.0
+        return sum([k * v for k, v in self.insert_counts.items()]) / n
+
+    def insert_size_quantile(self, q):
+        """ the insert size that fraction q of the proper pairs are within,
+        or 0 if there were none
+        """
+        n = sum(self.insert_counts.values())
+        seen = 0
+        for size, count in sorted(self.insert_counts.items()):
+            seen = seen + count
+            if seen >= q * n:
+                return size
+        return 0
 
-def filter_bam_AS(inbam, outsam, score, logger=None):
-    """ This is needed because bwa cannot filter based n alignment score
-    for paired reads.
-    https://sourceforge.net/p/bio-bwa/mailman/message/31968535/
-    Given a  bam file from bwa (has "AS" tags), write out
-    reads with AS higher than --score to outsam
-    read count from https://www.biostars.org/p/1890/
+    def report_lines(self):
+        """ flagstat-like summary for the log """
+        lines = ["{0} in total".format(self.total),
+                 "{0} secondary".format(self.counts["secondary"]),
+                 "{0} supplementary".format(self.counts["supplementary"]),
+                 "{0} duplicates".format(self.counts["duplicates"]),
+                 map_percentage_string(self.mapped, self.total),
+                 "{0} paired in sequencing".format(self.counts["paired"]),
+                 "{0} properly paired".format(
+                     self.counts["properly_paired"]),
+                 "{0} singletons".format(self.counts["singletons"]),
+                 "{0} with mate mapped to a different chr".format(
+                     self.counts["mate_diff_chr"])]
+        if len(self.insert_counts) != 0:
+            lines.append("{0:.1f} mean insert size".format(
+                self.mean_insert_size()))
+        for key, n in sorted(self.cluster_reads.items()):
+            lines.append("{0} reads in cluster {1}".format(n, key))
+        return lines
+
+    def write(self, path):
+        with open(path, "w") as outf:
+            json.dump({"counts": self.counts,
+                       "libraries": self.libraries,
+                       "as_counts": self.as_counts,
+                       "notag": self.notag,
+                       "insert_counts": self.insert_counts,
+                       "written": self.written,
+                       "regions": self.regions,
+                       "cluster_reads": self.cluster_reads,
+                       "cluster_as_counts": self.cluster_as_counts},
+                      outf, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as inf:
+            data = json.load(inf)
+        stats = cls()
+        stats.counts = data["counts"]
+        stats.libraries = data["libraries"]
+        # json keys are always strings
+        stats.as_counts = Counter(
+            {int(k): v for k, v in data["as_counts"].items()})
+        stats.notag = data["notag"]
+        stats.insert_counts = Counter(
+            {int(k): v for k, v in data["insert_counts"].items()})
+        stats.written = data["written"]
+        stats.regions = data["regions"]
+        stats.cluster_reads = data["cluster_reads"]
+        stats.cluster_as_counts = {
+            key: Counter({int(k): v for k, v in counts.items()})
+            for key, counts in data["cluster_as_counts"].items()}
+        return stats
+
+
+def merge_filter_bams(inbams, outbam, score=None, labels=None, regions=None,
+                      logger=None):
+    """ streaming k-way merge of coordinate-sorted bams (one per library)
+    into a single sorted outbam, done in the same pass as the filtering.
+    If score is given, only reads with an AS tag at least that high are
+    written (bwa cannot filter paired reads by alignment score, see
+    https://sourceforge.net/p/bio-bwa/mailman/message/31968535/);
+    otherwise all reads are written.  Unplaced reads have no score, so
+    they are only kept when not filtering.
+    returns a MappingStats, with the library labels (default: the bam
+    paths), and the reads written to each of the regions tallied
     """
-    notag = 0
-    written = 0
-    score_list = []
-    pysam.index(inbam)
-    bam = pysam.AlignmentFile(inbam, "rb")
-    osam = pysam.Samfile(outsam, 'wh', template=bam)
-    for read in bam.fetch():
-        if read.has_tag('AS'):
-            score_list.append(read.get_tag('AS'))
-            if read.get_tag('AS') >= score:
-                osam.write(read)
-                written = written + 1
+    assert logger is not None, "must use logging"
+    stats = MappingStats(libraries=labels if labels is not None else inbams,
+                         regions=regions)
+
+    def counted(bam, lib):
+        for read in bam.fetch(until_eof=True):
+            stats.add_read(read, lib)
+            yield read
+
+    bams = [pysam.AlignmentFile(x, "rb") for x in inbams]
+    stats.set_region_tids(bams[0])
+    obam = pysam.AlignmentFile(outbam, "wb", template=bams[0])
+    for read in heapq.merge(*[counted(b, i) for i, b in enumerate(bams)],
+                            key=bam_sort_key):
+        read_score = None
+        if read.reference_id >= 0:
+            if read.has_tag('AS'):
+                read_score = read.get_tag('AS')
+                stats.as_counts[read_score] += 1
             else:
-                pass
-        else:
-            notag = notag + 1
-            pass
-    bam.close()
-    logger.debug("Reads after filtering: %i", written)
-    if notag != 0:
-        logger.debug("Reads lacking alignment score: %i", notag)
-    return(score_list)
+                stats.notag = stats.notag + 1
+        if score is None or \
+           (read_score is not None and read_score >= score):
+            obam.write(read)
+            stats.add_written(read, read_score)
+    obam.close()
+    for b in bams:
+        b.close()
+    logger.debug("Reads after filtering: %i", stats.written)
+    if stats.notag != 0:
+        logger.debug("Reads lacking alignment score: %i", stats.notag)
+    return stats
 
 
 def get_bam_AS(inbam, logger=None):
@@ -1117,132 +1506,318 @@ def get_bam_AS(inbam, logger=None):
     return score_list
 
 
-def sam_to_bam(samtools_exe, bam, sam, logger=None):
+def unclipped_five_prime(read):
+    """ the reference position of a mapped read's 5' end, counting any
+    clipped bases, as used to call duplicates
+    """
+    cigar = read.cigartuples or []
+    if read.is_reverse:
+        clipped = sum([n for op, n in cigar[::-1][0:2] if op in [4, 5]])
+        return (read.reference_end or read.reference_start) + clipped
+    clipped = sum([n for op, n in cigar[0:2] if op in [4, 5]])
+    return read.reference_start - clipped
+
+
+def dedup_bam(inbam, outbam, logger=None):
+    """ collapse duplicate reads (or pairs) in a bam, keeping the copy with
+    the highest summed base quality.  Mapped templates are duplicates if
+    their ends start at the same unclipped positions on the same strands
+    (using the mate's position when the mate is not in this bam), so exact
+    duplicates are caught too; templates with no mapped reads are
+    duplicates only if their sequences are identical.  The first pass
+    picks a read name for each key; the second writes the reads of those
+    names, so the output keeps the input's order.
+    returns (number of templates, number kept)
+    """
+    assert logger is not None, "must use logging"
+    templates = {}
+    with pysam.AlignmentFile(inbam, "rb") as bam:
+        for read in bam.fetch(until_eof=True):
+            if read.is_secondary or read.is_supplementary:
+                continue
+            ends, quals, seqs = templates.setdefault(
+                read.query_name, ([], [0], []))
+            if read.query_qualities is not None:
+                quals[0] += sum(read.query_qualities)
+            seqs.append(read.query_sequence or "")
+            if read.is_unmapped:
+                continue
+            ends.append((read.reference_id, unclipped_five_prime(read),
+                         read.is_reverse))
+            if read.is_paired and not read.mate_is_unmapped:
+                ends.append(("mate", read.next_reference_id,
+                             read.next_reference_start,
+                             read.mate_is_reverse))
+    best = {}
+    for name, (ends, quals, seqs) in templates.items():
+        if len(ends) != 0:
+            # a mate's own end (if present) replaces its "mate" stand-in
+            own = [x for x in ends if x[0] != "mate"]
+            key = ("pos", tuple(sorted(own)) if len(own) > 1 else
+                   tuple(sorted(ends, key=str)))
+        else:
+            key = ("seq", tuple(sorted(seqs)))
+        if key not in best or quals[0] > best[key][0]:
+            best[key] = (quals[0], name)
+    keep = set([x[1] for x in best.values()])
+    with pysam.AlignmentFile(inbam, "rb") as bam:
+        with pysam.AlignmentFile(outbam, "wb", template=bam) as obam:
+            for read in bam.fetch(until_eof=True):
+                if read.query_name in keep:
+                    obam.write(read)
+    logger.debug("kept %i of %i templates in %s", len(keep),
+                 len(templates), inbam)
+    return (len(templates), len(keep))
+
+
+def dedup_bam_in_place(bam, logger=None):
+    """ dedup a mapping's bam before its reads are extracted for assembly;
+    the original is kept alongside it with a _with_dups suffix
+    """
+    assert logger is not None, "must use logging"
+    with_dups = os.path.splitext(bam)[0] + "_with_dups.bam"
+    os.replace(bam, with_dups)
+    return dedup_bam(inbam=with_dups, outbam=bam, logger=logger)
+
+
+def map_percentage_string(mapped, total):
+    """ mimic the mapped line of samtools flagstat
     """
-    becasue pysam doesnt like to write bams in an iterator, which makes sense
+    return "{0} mapped ({1:.2f}%)".format(
+        mapped, 100.0 * mapped / total if total != 0 else 0.0)
+
+
+def map_libraries(mapping_ob, ngsLib, cores, samtools_exe, index_cmd,
+                  make_map_cmd, score_min=None, regions=None, logger=None):
+    """ index the reference, map every library of the ngsLib at the same
+    time (splitting cores by library size), each to its own sorted bam,
+    then merge and filter them into mapping_ob.mapped_bam.
+    make_map_cmd(fastqs, cores) must return a mapper command writing
+    unsorted bam/sam to stdout.  regions are passed to merge_filter_bams.
+    returns (map_percentage, MappingStats); the stats are also saved to
+    mapping_ob.mapping_stats_json
     """
     assert logger is not None, "must use logging"
-    logger.debug("Making mapped bam file:")
-    make_mapped_bam = "{0} view -o {1} -h {2}".format(samtools_exe, bam, sam)
-    logger.debug(make_mapped_bam)
-    subprocess.run([make_mapped_bam],
-                   shell=sys.platform != "win32",
+    specs = get_library_map_specs(ngsLib, mapping_ob)
+    assert len(specs) != 0, "No libraries to map!"
+    logger.debug(index_cmd)
+    subprocess.run(index_cmd, shell=sys.platform != "win32",
                    stdout=subprocess.PIPE,
-                   stderr=subprocess.PIPE,
-                   check=True)
+                   stderr=subprocess.PIPE, check=True)
+    lib_cores = split_cores_by_size([x[1] for x in specs], cores)
+    map_cmds = []
+    for (label, fastqs, bam), ncores in zip(specs, lib_cores):
+        logger.debug("mapping %s library with %i cores", label, ncores)
+        map_cmds.append("{0} | {1} view -bh - | {1} sort -o {2} -".format(
+            make_map_cmd(fastqs, ncores), samtools_exe, bam))
+    run_cmds_concurrently(map_cmds, logger=logger)
+    logger.debug("merging and filtering %i libraries", len(specs))
+    stats = merge_filter_bams(inbams=[x[2] for x in specs],
+                              outbam=mapping_ob.mapped_bam,
+                              score=score_min, labels=[x[0] for x in specs],
+                              regions=regions, logger=logger)
+    stats.write(mapping_ob.mapping_stats_json)
+    for label, total, mapped in stats.libraries:
+        logger.info("%s mapped reads: %s", label,
+                    map_percentage_string(mapped, total))
+    logger.info("Combined mapped reads: %s",
+                map_percentage_string(stats.mapped, stats.total))
+    if score_min is not None:
+        logger.info("Mapped reads after filtering: %i", stats.written)
+    logger.debug("Mapping stats:\n%s", "\n".join(stats.report_lines()))
+    # apparently there have been no errors, so mapping success!
+    ngsLib.mapping_success = True
+    return (stats.map_percentage(), stats)
+
+
+def map_to_genome_ref(mapping_ob, ngsLib, cores, samtools_exe, mapper,
+                      genome_fasta, score_minimum=None, regions=None,
+                      logger=None):
+    """ map with any backend from riboMappers: index genome_fasta, map
+    the paired library (if present) and every singleton library
+    concurrently, then merge them into mapping_ob.mapped_bam, filtering
+    by score_minimum unless the mapper has done so already.
+    If score_minimum is None, the backend's default for ngsLib's read
+    length is used.
+    returns (map_percentage, MappingStats)
+    """
+    assert logger is not None, "must use logging"
+    logger.info("Mapping reads to reference genome with %s", mapper.name)
+    score_min = mapper.score_minimum(readlen=ngsLib.readlen,
+                                     score_min=score_minimum)
+    logger.debug("using a score minimum of %i", score_min)
+
+    def make_map_cmd(fastqs, ncores):
+        return mapper.map_cmd(ref_fasta=genome_fasta, fastqs=fastqs,
+                              cores=ncores, score_min=score_min,
+                              insert_dist=ngsLib.smalt_dist_path)
+    logger.info("running %s", mapper.name)
+    return map_libraries(
+        mapping_ob=mapping_ob, ngsLib=ngsLib, cores=cores,
+        samtools_exe=samtools_exe,
+        index_cmd=mapper.index_cmd(genome_fasta),
+        make_map_cmd=make_map_cmd, score_min=mapper.filter_score(score_min),
+        regions=regions, logger=logger)
+
+
+def map_to_genome_ref_smalt(mapping_ob, ngsLib, cores,
+                            samtools_exe, smalt_exe,
+                            genome_fasta,
+                            score_minimum=None,
+                            scoring="match=1,subst=-4,gapopen=-4,gapext=-3",
+                            step=3, k=5, regions=None, logger=None):
+    """run smalt based on pased args
+    maps the paired library (if present) and every singleton library
+    concurrently, then merges them into mapping_ob.mapped_bam.  SMALT
+    filters by score itself, so the merged bam is not filtered further
+    returns (map_percentage, MappingStats)
+    """
+    # check min score
+    assert score_minimum is not None, "must sassign score outside map function!"
+    return map_to_genome_ref(
+        mapping_ob=mapping_ob, ngsLib=ngsLib, cores=cores,
+        samtools_exe=samtools_exe,
+        mapper=get_mapper_backend("smalt", exe=smalt_exe, scoring=scoring,
+                                  k=k, step=step),
+        genome_fasta=genome_fasta, score_minimum=score_minimum,
+        regions=regions, logger=logger)
 
 
 def map_to_genome_ref_bwa(mapping_ob, ngsLib, cores,
                           samtools_exe, bwa_exe, genome_fasta,
                           score_minimum=None,
-                          add_args='-L 0,0 -U 0 -a', logger=None):
-    """ Map to bam.  maps PE and S reads separately,
-    then combines them into a X_mapped.bam file
-    TODO:: break up into execution and comamnd generation
+                          add_args='-L 0,0 -U 0 -a', regions=None,
+                          logger=None):
+    """ Map to bam.  maps the paired library (if present) and every
+    singleton library concurrently, then merges them into
+    mapping_ob.mapped_bam, keeping reads with an alignment score of at
+    least score_minimum (default is 1/2 read length or 50, whichever is
+    greater).
+    returns (map_percentage, MappingStats)
+    """
+    return map_to_genome_ref(
+        mapping_ob=mapping_ob, ngsLib=ngsLib, cores=cores,
+        samtools_exe=samtools_exe,
+        mapper=get_mapper_backend("bwa", exe=bwa_exe, add_args=add_args),
+        genome_fasta=genome_fasta, score_minimum=score_minimum,
+        regions=regions, logger=logger)
+
+
+def hash_file_contents(path, hash_record=None, chunk_size=1 << 20):
+    """ return the sha1 of a file's contents.  Hashing a full read library
+    isnt free, so if a hash_record dict is given, hashes are remembered
+    by absolute path, size, and mtime, and reused while those match
+    """
+    stat = os.stat(path)
+    record_key = "{0}:{1}:{2}".format(
+        os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if hash_record is not None and record_key in hash_record:
+        return hash_record[record_key]
+    sha = hashlib.sha1()
+    with open(path, "rb") as inf:
+        for block in iter(lambda: inf.read(chunk_size), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    if hash_record is not None:
+        hash_record[record_key] = digest
+    return digest
+
+
+def get_mapping_cache_key(ngsLib, genome_fasta, method, mapper_args,
+                          score_minimum, cache_dir, logger=None):
+    """ the iteration 0 mapping depends only on the reads, the (padded)
+    reference, the mapper and its arguments, and the score minimum, so
+    a hash of those is used as the key for the mapping cache.
     """
+    assert logger is not None, "must use logging"
+    record_path = os.path.join(cache_dir, "file_hashes.json")
+    try:
+        with open(record_path, "r") as inf:
+            hash_record = json.load(inf)
+    except (IOError, ValueError):
+        hash_record = {}
+    logger.debug("hashing reads and reference for the mapping cache")
+    key_parts = {
+        "reads": [hash_file_contents(x, hash_record=hash_record) for
+                  x in [ngsLib.readF, ngsLib.readR, ngsLib.readS0] +
+                  ngsLib.readS1 if x is not None],
+        "reference": hash_file_contents(genome_fasta,
+                                        hash_record=hash_record),
+        "method": method,
+        "mapper_args": mapper_args,
+        "score_minimum": score_minimum}
+    tmp_record = "{0}.{1}".format(record_path, os.getpid())
+    with open(tmp_record, "w") as outf:
+        json.dump(hash_record, outf)
+    os.rename(tmp_record, record_path)
+    return hashlib.sha1(
+        json.dumps(key_parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def link_or_copy(src, dest):
+    """ hard-link if we can (ie, same filesystem), copy if we cant
+    """
+    if os.path.exists(dest):
+        os.unlink(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
 
-    logger.info("Mapping reads to reference genome with BWA")
-    # check min score
-    if score_minimum is not None:
-        score_min = score_minimum
-    else:
-        logger.debug(
-            "no bwa mapping score minprovided; default is 1/2 read " +
-            "length or 50, whichever is greater.")
-        # hard minimum of 50
-        score_min = max(int(round(float(ngsLib.readlen) / 2.0)),
-                        50)
-    logger.debug("using a score minimum of %i", score_min)
-    # index the reference
-    cmdindex = str("{0} index {1}").format(
-        bwa_exe, genome_fasta)
-    # map paired end reads to reference index.
-    bwacommands = [cmdindex]
-    if "pe" in ngsLib.libtype:
-        cmdmap = str('{0} mem -t {1} {2} -k 15 ' +
-                     '{3} {4} {5} | {6} view -bh - | ' +
-                     '{6} sort -o ' +
-                     '{7} - ').format(bwa_exe,  # 0
-                                      cores,  # 1
-                                      add_args,  # 2
-                                      genome_fasta,  # 3
-                                      ngsLib.readF,  # 4
-                                      ngsLib.readR,  # 5
-                                      samtools_exe,  # 6
-                                      mapping_ob.pe_map_bam)  # 7)
-        bwacommands.append(cmdmap)
-    else:
-        assert ngsLib.readS0 is not None, \
-            str("No readS0 attribute found, cannot run mapping with " +
-                "any reads in .readS0 or .readF and .readR")
-
-    # if singletons are present, map those too.  Index is already made
-    if ngsLib.readS0 is not None:  # and not ignore_singletons:
-        cmdmapS = str(
-            '{0} mem -t {1} {2} -k 15 ' +
-            '{3} {4} | {5} view -bh - | ' +
-            '{5} sort -o {6} - ').format(bwa_exe,  # 0
-                                         cores,  # 1
-                                         add_args,  # 2
-                                         genome_fasta,  # 3
-                                         ngsLib.readS0,  # 4
-                                         samtools_exe,  # 5
-                                         mapping_ob.s_map_bam)  # 5)
-        # merge together the singleton and pe reads, if there are any
-        if "s" in ngsLib.libtype:
-            cmdmergeS = str(
-                "{0} view -bh {1} > {2}"
-            ).format(samtools_exe, mapping_ob.s_map_bam, mapping_ob.mapped_bam_unfiltered)
-        else:
-            cmdmergeS = '{0} merge -f {3} {1} {2}'.format(
-                samtools_exe, mapping_ob.pe_map_bam,
-                mapping_ob.s_map_bam, mapping_ob.mapped_bam_unfiltered)
-        bwacommands.extend([cmdmapS, cmdmergeS])
-    else:
-        # if not already none, set to None when ignoring singleton
-        ngsLib.readS0 = None
-        cmdmerge = str("{0} view -bh {1} > " +
-                       "{2}").format(samtools_exe, mapping_ob.pe_map_bam,
-                                     mapping_ob.mapped_bam_unfiltered)
-        bwacommands.extend([cmdmerge])
-    logger.info("running BWA:")
-    logger.debug("with the following BWA commands:")
-    for i in bwacommands:
-        logger.debug(i)
-        subprocess.run(i, shell=sys.platform != "win32",
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE, check=True)
-    # report simgpleton reads mapped
-    if ngsLib.readS0 is not None:
-        logger.info(str("Singleton mapped reads: " +
-                        get_number_mapped(mapping_ob.s_map_bam,
-                                          samtools_exe=samtools_exe)))
-    # report paired reads mapped
-    if "pe" in ngsLib.libtype:
-        logger.info(str("PE mapped reads: " +
-                        get_number_mapped(mapping_ob.pe_map_bam,
-                                          samtools_exe=samtools_exe)))
-
-    combined_map_string = get_number_mapped(mapping_ob.mapped_bam_unfiltered,
-                                            samtools_exe=samtools_exe)
-    logger.info(str("Combined mapped reads: " + combined_map_string))
-    # extract overall percentage as a float
-    map_percentage = float(combined_map_string.split("(")[1].split("%")[0])
-    logger.debug("filtering mapped reads with an AS score minimum of %i",
-                 score_min)
-    score_list = filter_bam_AS(inbam=mapping_ob.mapped_bam_unfiltered,
-                               outsam=mapping_ob.mapped_sam,
-                               score=score_min, logger=logger)
-    sam_to_bam(bam=mapping_ob.mapped_bam,
-               sam=mapping_ob.mapped_sam,
-               samtools_exe=samtools_exe,
-               logger=logger)
-    logger.info(str("Mapped reads after filtering: " +
-                    get_number_mapped(mapping_ob.mapped_bam,
-                                      samtools_exe=samtools_exe)))
-    # apparently there have been no errors, so mapping success!
-    ngsLib.mapping_success = True
-    return (map_percentage, score_list)
+
+def fetch_cached_mapping(cache_dir, key, mapping_ob, regions=None,
+                         logger=None):
+    """ if a mapping with this key is in the cache, link the filtered bam
+    to mapping_ob.mapped_bam, copy its stats to mapping_ob.mapping_stats_json,
+    and return (map_percentage, MappingStats); otherwise return None.
+    The key doesnt cover the cluster regions, so if those differ from
+    the ones tallied when the entry was stored, the per-cluster tallies
+    are dropped
+    """
+    assert logger is not None, "must use logging"
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry):
+        logger.info("no cached iteration 0 mapping found for key %s", key)
+        return None
+    try:
+        stats = MappingStats.load(os.path.join(entry, "mapping_stats.json"))
+    except (IOError, ValueError, KeyError):
+        logger.info("ignoring cached mapping %s with unreadable stats", entry)
+        return None
+    if [list(x) for x in regions or []] != stats.regions:
+        logger.debug("cached mapping has different regions; per-cluster " +
+                     "stats will be gathered from the cluster bams")
+        stats.regions, stats.cluster_reads, stats.cluster_as_counts = \
+            [], {}, {}
+    link_or_copy(os.path.join(entry, "mapped.bam"), mapping_ob.mapped_bam)
+    stats.write(mapping_ob.mapping_stats_json)
+    logger.info("using cached iteration 0 mapping from %s", entry)
+    logger.info("Combined mapped reads (cached): %.2f%%",
+                stats.map_percentage())
+    return (stats.map_percentage(), stats)
+
+
+def store_cached_mapping(cache_dir, key, mapping_ob, logger=None):
+    """ add the filtered bam and its mapping stats to the cache.  The entry
+    is built under a temporary name and renamed into place, so concurrent
+    runs never see a partial entry
+    """
+    assert logger is not None, "must use logging"
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return entry
+    tmp_entry = "{0}.tmp.{1}".format(entry, os.getpid())
+    os.makedirs(tmp_entry)
+    link_or_copy(mapping_ob.mapped_bam, os.path.join(tmp_entry, "mapped.bam"))
+    shutil.copyfile(mapping_ob.mapping_stats_json,
+                    os.path.join(tmp_entry, "mapping_stats.json"))
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # someone else stored the same mapping while we were busy
+        shutil.rmtree(tmp_entry)
+    logger.info("stored iteration 0 mapping in cache: %s", entry)
+    return entry
 
 
 def convert_bam_to_fastqs_cmd(mapping_ob, ref_fasta, samtools_exe,
@@ -1298,6 +1873,28 @@ def convert_bam_to_fastqs_cmd(mapping_ob, ref_fasta, samtools_exe,
                             ref_fasta=ref_fasta))
 
 
+def write_unmapped_reads(mapping_ob, ngsLib, samtools_exe, logger=None):
+    """ write the reads that mapped nowhere in a genome-wide mapping to a
+    single fastq, from the per-library bams the mapper wrote (the merged
+    mapped_bam only has the reads that passed the score filter).
+    returns the path, or None if those bams are not there (ie, the
+    mapping came from --map_cache_dir)
+    """
+    assert logger is not None, "must use logging"
+    bams = [x[2] for x in get_library_map_specs(ngsLib, mapping_ob)]
+    if not all([os.path.isfile(x) for x in bams]):
+        return None
+    outfastq = os.path.splitext(mapping_ob.mapped_bam)[0] + \
+        "_unmappedreadS.fastq"
+    with open(outfastq, "w") as outf:
+        for bam in bams:
+            cmd = "{0} fastq -f 4 {1}".format(samtools_exe, bam)
+            logger.debug(cmd)
+            subprocess.run([cmd], shell=sys.platform != "win32",
+                           stdout=outf, stderr=subprocess.PIPE, check=True)
+    return outfastq
+
+
 def generate_spades_cmd(
         mapping_ob, ngs_ob, ref_as_contig, as_paired=True, addLibs="",
         prelim=False, k="21,33,55,77,99", spades_exe="spades.py",
@@ -1359,6 +1956,12 @@ def generate_spades_cmd(
         libs.append(ngs_ob.readS0)
         libs.append(ngs_ob.readF)
         libs.append(ngs_ob.readR)
+    # any additional singleton libraries get their own --s<#> slot
+    assert len(ngs_ob.readS1) < 10, \
+        "SPAdes accepts at most 9 additional single libraries"
+    for idx, single in enumerate(ngs_ob.readS1):
+        singles = singles + " --s{0} {1} ".format(idx + 1, single)
+        libs.append(single)
     reads = str(pairs + singles)
 
     if prelim:
@@ -1397,6 +2000,32 @@ def make_spades_empty_check(liblist, cmd, logger):
     return str(prefix + suffix)
 
 
+def keep_only_first_contig(ref, newname="contig1"):
+    """ given a multi fasta from SPAdes, keep only its first entry,
+    renaming "NODE_1" with newname, and overwrite the file.  The contig's
+    metadata is recorded in seq_metadata on the way through
+    """
+    temp = os.path.join(os.path.dirname(ref), "temp.fasta")
+    md5 = hashlib.md5()
+    length = 0
+    with open(temp, "w") as outf, open(ref, "r") as inf:
+        header = inf.readline()
+        if not header.startswith(">"):
+            raise ValueError("Error  with spades output contig! " +
+                             "Not a valid fasta!")
+        header = re.sub(r"NODE_\d*", newname, header)
+        outf.write(header)
+        for line in inf:
+            if line.startswith(">"):
+                break  # stop after first entry
+            outf.write(line)
+            md5.update(line.strip().encode("utf-8"))
+            length = length + len(line.strip())
+    os.replace(temp, ref)
+    return seq_metadata.record(ref, SequenceMetadata(
+        id=header[1:].split()[0], length=length, checksum=md5.hexdigest()))
+
+
 def evaluate_spades_success(clu, mapping_ob, proceed_to_target, target_len,
                             include_short_contigs, min_assembly_len, read_len,
                             flank=1000,
@@ -1454,8 +2083,8 @@ def evaluate_spades_success(clu, mapping_ob, proceed_to_target, target_len,
     # -------------------------- --------------------------- #
 
     logger.info("%s analyzing  mapping", prelog)
-    seed_len = get_fasta_lengths(clu.mappings[0].ref_fasta)[0]
-    # seed_len = get_fasta_lengths(mapping_ob.ref_fasta)[0]
+    # lengths come from seq_metadata, filled in as these were written
+    seed_len = seq_metadata.length(clu.mappings[0].ref_fasta)
     # set proceed_to_target params
     if proceed_to_target:
         if target_len > 0 and 5 > target_len:
@@ -1470,9 +2099,10 @@ def evaluate_spades_success(clu, mapping_ob, proceed_to_target, target_len,
     else:
         pass
     # compare lengths of reference and freshly assembled contig
-    contig_len = get_fasta_lengths(mapping_ob.assembled_contig)[0]
-    ref_len = get_fasta_lengths(mapping_ob.ref_fasta)[0]
+    contig_len = seq_metadata.length(mapping_ob.assembled_contig)
+    ref_len = seq_metadata.length(mapping_ob.ref_fasta)
     contig_length_diff = contig_len - ref_len
+    mapping_ob.contig_lengths = (seed_len, ref_len, contig_len)
     logger.info("%s Seed length: %i", prelog, seed_len)
     if proceed_to_target:
         logger.info("Target length: {0}".format(target_seed_len))
@@ -1544,9 +2174,15 @@ def parse_subassembly_return_code(cluster, final_contigs_dir, skip_copy=False,
     1 = include contigs, but dont keep iterating
     2 = exclude contigs, and keep from iterating
     3 = exclude contigs, error ocurred
+    4 = exclude contigs, subassembly was killed for running too long
     """
     assert logger is not None, "must use logging"
-    if cluster.assembly_success == 3:
+    if cluster.assembly_success == 4:
+        logger.warning("cluster %i timed out, and will be excluded from " +
+                       "further iterations", cluster.index)
+        cluster.continue_iterating = False
+        cluster.keep_contigs = False
+    elif cluster.assembly_success == 3:
         # TODO other error handling; make a "failed" counter?
         cluster.continue_iterating = False
         cluster.keep_contigs = False
@@ -1576,38 +2212,25 @@ def make_quick_quast_table(pathlist, write=False, writedir=None, logger=None):
     filelist = pathlist
     logger.debug("Quast reports to combine: %s", str(filelist))
     mainDict = {}
-    counter = 0
-    for i in filelist:
-        if counter == 0:
-            try:
-                with open(i, "r") as handle:
-                    for dex, line in enumerate(handle):
-                        row, val = line.strip().split("\t")
-                        if dex in [0]:
-                            continue  # skip header
-                        else:
-                            mainDict[row] = [val]
-            except Exception:
+    for counter, i in enumerate(filelist):
+        try:
+            with open(i, "r") as handle:
+                report = {}
+                for dex, line in enumerate(handle):
+                    row, val = line.strip().split("\t")
+                    if dex == 0 and counter == 0:
+                        continue  # skip header
+                    report[row] = val
+        except Exception as e:
+            if counter == 0:
                 raise ValueError("error parsing %s", i)
+            logger.warning("error parsing %s", i)
+            raise e
+        if counter == 0:
+            mainDict = {k: [v] for k, v in report.items()}
         else:
-            report_list = []
-            try:
-                with open(i, "r") as handle:
-                    for dex, line in enumerate(handle):
-                        row, val = line.strip().split("\t")
-                        report_list.append([row, val])
-                    # logger.debug("report list: %s", str(report_list))
-                    for k, v in mainDict.items():
-                        if k in [x[0] for x in report_list]:
-                            mainDict[k].append(
-                                str([x[1] for x in
-                                     report_list if x[0] == k][0]))
-                        else:
-                            mainDict[k].append("XX")
-            except Exception as e:
-                logger.warning("error parsing %s", i)
-                raise e
-        counter = counter + 1
+            for k, v in mainDict.items():
+                v.append(str(report.get(k, "XX")))
     if write:
         if writedir is None:
             logger.warning("no output dir, cannot write!")
@@ -1737,10 +2360,62 @@ def get_samtools_depths(samtools_exe, bam, chrom, start, end,
     return [covs, ave]
 
 
+def set_global_coords(cluster, flank, logger=None):
+    """ set the region of the (iteration 0) reference that reads for the
+    cluster are gathered from: its loci plus the flanking regions, as far
+    as the sequence goes.  Does nothing if the coords are already set.
+    """
+    if cluster.global_start_coord is not None and \
+       cluster.global_end_coord is not None:
+        return
+    if sorted([x.start_coord for x in cluster.loci_list]) != \
+       [x.start_coord for x in cluster.loci_list]:
+        logger.warning("Coords are not in increasing order; " +
+                       "you've been warned")
+    start_list = sorted([x.start_coord for x in cluster.loci_list])
+    logger.debug("Start_list: {0}".format(start_list))
+
+    logger.debug("Finding coords to gather reads from the following loci:")
+    for i in cluster.loci_list:
+        logger.debug("%s cluster %i -- locus %i -- %s (%i, %i)(%i) %s",
+                     i.sequence_id, cluster.index,
+                     i.index, i.locus_tag,
+                     i.start_coord, i.end_coord, i.strand,
+                     i.product)
+    #  This works as long as coords are never in reverse order
+    cluster.global_start_coord = min([x.start_coord for
+                                      x in cluster.loci_list]) - flank
+    # if start is negative, just use 1, the beginning of the sequence
+    if cluster.global_start_coord < 1:
+        logger.warning(
+            "Caution! Cannot retrieve full flanking region, as " +
+            "the 5' flanking region extends past start of " +
+            "sequence. If this is a problem, try using a smaller " +
+            "--flanking region, and/or if  appropriate, run with " +
+            "--linear.")
+        cluster.global_start_coord = 1
+    cluster.global_end_coord = max([x.end_coord for
+                                    x in cluster.loci_list]) + flank
+    # logger.debug("rec len: %i", len(cluster.seq_record.seq))
+    if cluster.global_end_coord > len(cluster.seq_record):
+        logger.warning(
+            "Caution! Cannot retrieve full flanking region, as " +
+            "the 5' flanking region extends past start of " +
+            "sequence. If this is a problem, try using a smaller " +
+            "--flanking region, and/or if  appropriate, run with " +
+            "--linear.")
+        cluster.global_end_coord = len(cluster.seq_record)
+    logger.debug("global start and end: %s %s",
+                 cluster.global_start_coord,
+                 cluster.global_end_coord)
+
+
 def prepare_next_mapping(cluster, seedGenome, samtools_exe, flank,
-                         logger=None):
+                         write_seed=True, logger=None):
     """use within partition mapping funtion;
     makes LociMapping, get region coords, write extracted region,
+    (unless write_seed is False, as when the seeds of many clusters are
+    written together with write_seed_sequences)
     """
     mapping_subdir = os.path.join(
         seedGenome.output_root, cluster.cluster_dir_name,
@@ -1763,53 +2438,14 @@ def prepare_next_mapping(cluster, seedGenome, samtools_exe, flank,
         if seedGenome.this_iteration != 0:
             raise ValueError(
                 "global start and end should be defined previously! Exiting")
-        if sorted([x.start_coord for x in cluster.loci_list]) != \
-           [x.start_coord for x in cluster.loci_list]:
-            logger.warning("Coords are not in increasing order; " +
-                           "you've been warned")
-        start_list = sorted([x.start_coord for x in cluster.loci_list])
-        logger.debug("Start_list: {0}".format(start_list))
-
-        logger.debug("Finding coords to gather reads from the following loci:")
-        for i in cluster.loci_list:
-            logger.debug("%s cluster %i -- locus %i -- %s (%i, %i)(%i) %s",
-                         i.sequence_id, cluster.index,
-                         i.index, i.locus_tag,
-                         i.start_coord, i.end_coord, i.strand,
-                         i.product)
-        #  This works as long as coords are never in reverse order
-        cluster.global_start_coord = min([x.start_coord for
-                                          x in cluster.loci_list]) - flank
-        # if start is negative, just use 1, the beginning of the sequence
-        if cluster.global_start_coord < 1:
-            logger.warning(
-                "Caution! Cannot retrieve full flanking region, as " +
-                "the 5' flanking region extends past start of " +
-                "sequence. If this is a problem, try using a smaller " +
-                "--flanking region, and/or if  appropriate, run with " +
-                "--linear.")
-            cluster.global_start_coord = 1
-        cluster.global_end_coord = max([x.end_coord for
-                                        x in cluster.loci_list]) + flank
-        # logger.debug("rec len: %i", len(cluster.seq_record.seq))
-        if cluster.global_end_coord > len(cluster.seq_record):
-            logger.warning(
-                "Caution! Cannot retrieve full flanking region, as " +
-                "the 5' flanking region extends past start of " +
-                "sequence. If this is a problem, try using a smaller " +
-                "--flanking region, and/or if  appropriate, run with " +
-                "--linear.")
-            cluster.global_end_coord = len(cluster.seq_record)
-        logger.debug("global start and end: %s %s",
-                     cluster.global_start_coord,
-                     cluster.global_end_coord)
+        set_global_coords(cluster=cluster, flank=flank, logger=logger)
     #  if not the first time though, fuhgetaboudit.
     #  Ie, the coords have been reassigned by the make_faux_genome function
     #  WE WONT USE A FLANKING REGION BECAUSE NO FLANKING READS ARE AVAILIBLE!
     #  meaning, the overhang is gained from the bits that overhand the end of
     #  the mapping. Because both SMALT and BWA use soft-clipping by defualt, we
     #  recover and use the clipped regions
-    else:
+    elif seedGenome.this_iteration != 0:
         logger.info("using coords from previous iterations 'genome':")
     logger.info("Coordinates for %s cluster %i:  [%i - %i]",
                 cluster.seq_record.id,
@@ -1817,16 +2453,78 @@ def prepare_next_mapping(cluster, seedGenome, samtools_exe, flank,
                 cluster.global_start_coord,
                 cluster.global_end_coord)
 
-    cluster.extractedSeqRecord = SeqRecord(
-        cluster.seq_record.seq[
-            cluster.global_start_coord:
-            cluster.global_end_coord])
-
     mapping0.ref_fasta = os.path.join(mapping0.mapping_subdir,
                                       "extracted_seed_sequence.fasta")
-    with open(mapping0.ref_fasta, "w") as writepath:
-        SeqIO.write(cluster.extractedSeqRecord, writepath, 'fasta')
     cluster.mappings.append(mapping0)
+    if write_seed:
+        write_seed_sequences([cluster], seedGenome, logger=logger)
+
+
+def write_seed_sequences(clusters, seedGenome, width=60, logger=None):
+    """ write each cluster's seed -- the region of the current reference
+    (seedGenome.next_reference_path) between its global coords -- to the
+    ref_fasta of its latest mapping.  The reference is opened once as an
+    indexed fasta, and only the bytes of each region are read from it,
+    in reference order
+    """
+    assert logger is not None, "must use logging"
+    ref = pysam.FastaFile(seedGenome.next_reference_path)
+    try:
+        for cluster in sorted(clusters, key=lambda x: (
+                x.seq_record.id, x.global_start_coord)):
+            seq = ref.fetch(cluster.seq_record.id,
+                            cluster.global_start_coord,
+                            cluster.global_end_coord)
+            name = "{0}_cluster_{1}".format(cluster.sequence_id,
+                                            cluster.index)
+            with open(cluster.mappings[-1].ref_fasta, "w") as outf:
+                outf.write(">{0}\n".format(name))
+                for i in range(0, len(seq), width):
+                    outf.write(seq[i: i + width] + "\n")
+            seq_metadata.record(cluster.mappings[-1].ref_fasta,
+                                sequence_metadata(name, seq))
+    finally:
+        ref.close()
+    logger.debug("wrote the seeds of %i clusters from %s", len(clusters),
+                 seedGenome.next_reference_path)
+
+
+def archive_cluster_intermediates(seedGenome, iterations, logger=None):
+    """ pack the mapping and assembly directories of every cluster for
+    each of the given iterations into one archive per iteration (see
+    riboArchive.py), in output_root/intermediates.  The files later
+    stages still read -- each cluster's first seed, and its latest
+    reference and contig -- are left on disk as well.
+    returns the paths to the archives
+    """
+    assert logger is not None, "must use logging"
+    archive_dir = os.path.join(seedGenome.output_root, "intermediates")
+    os.makedirs(archive_dir, exist_ok=True)
+    keep = []
+    for clu in seedGenome.loci_clusters:
+        if len(clu.mappings) != 0:
+            keep.extend([clu.mappings[0].ref_fasta,
+                         clu.mappings[-1].ref_fasta,
+                         clu.mappings[-1].assembled_contig])
+    archives = []
+    for iteration in iterations:
+        dirs = []
+        for clu in seedGenome.loci_clusters:
+            for mapping in clu.mappings:
+                if mapping.iteration != iteration:
+                    continue
+                for kind, path in [("mapping", mapping.mapping_subdir),
+                                   ("assembly", mapping.assembly_subdir)]:
+                    if path is not None and os.path.isdir(path):
+                        dirs.append((clu.index, iteration, kind, path))
+        if len(dirs) == 0:
+            continue
+        archives.append(os.path.join(archive_dir,
+                                     "iteration_{0}.zip".format(iteration)))
+        archive_directories(archive_path=archives[-1],
+                            root=seedGenome.output_root, dirs=dirs,
+                            keep=keep, logger=logger)
+    return archives
 
 
 def make_mapped_partition_cmds(cluster, mapping_ob, seedGenome, samtools_exe,
@@ -1943,7 +2641,8 @@ def partition_mapping(seedGenome, samtools_exe, flank, min_flank_depth,
     for cluster in cluster_list:
         prepare_next_mapping(cluster=cluster, seedGenome=seedGenome,
                              samtools_exe=samtools_exe, flank=flank,
-                             logger=logger)
+                             write_seed=False, logger=logger)
+    write_seed_sequences(cluster_list, seedGenome, logger=logger)
 
     mapped_regions = []
     all_depths = []  # each entry is a tuple (idx, start_ave, end_ave)
@@ -2037,22 +2736,50 @@ def add_coords_to_clusters(seedGenome, logger=None):
     """
     for cluster in seedGenome.loci_clusters:  # for each cluster of loci
         # get seq record that cluster is  from
-        try:
-            cluster.seq_record = get_rec_from_generator(
-                recordID=cluster.sequence_id,
-                gen=seedGenome.seq_records,
-                method=seedGenome.refreshSeqRecGenerator)
-        except Exception as e:
-            raise e
+        cluster.seq_record = seedGenome.genbank.genome_view(
+            cluster.sequence_id)
         try:  # make coord list
             extract_coords_from_locus(
                 cluster=cluster, feature=cluster.feat_of_interest,
+                feature_index=seedGenome.genbank.feature_index(
+                    cluster.sequence_id),
                 logger=logger)
         except Exception as e:
             raise e
         logger.debug("Here are the detected region,coords, strand, product, " +
                      "locus tag, subfeatures and sequence id of the results:")
-        logger.debug(str(cluster.__dict__))
+        logger.debug(str(describe(cluster)))
+    check_interleaved_clusters(seedGenome, logger=logger)
+
+
+def check_interleaved_clusters(seedGenome, logger=None):
+    """ warn about any cluster whose span (from its first locus to its
+    last) holds a feature of interest assigned to another cluster; their
+    flanking regions, and so their reads, will overlap
+    returns {cluster index: [locus tags of other clusters]}
+    """
+    owner = {}
+    for cluster in seedGenome.loci_clusters:
+        for loc in cluster.loci_list:
+            owner[(cluster.sequence_id, loc.locus_tag)] = cluster.index
+    interleaved = {}
+    for cluster in seedGenome.loci_clusters:
+        located = [x for x in cluster.loci_list if x.start_coord is not None]
+        if len(located) == 0:
+            continue
+        index = seedGenome.genbank.feature_index(cluster.sequence_id)
+        others = [
+            x.locus_tag for x in index.overlapping(
+                min([x.start_coord for x in located]) - 1,
+                max([x.end_coord for x in located]),
+                feature=cluster.feat_of_interest)
+            if owner.get((cluster.sequence_id, x.locus_tag),
+                         cluster.index) != cluster.index]
+        if len(others) != 0:
+            logger.warning("cluster %i spans loci from other clusters: %s",
+                           cluster.index, " ".join(others))
+            interleaved[cluster.index] = others
+    return interleaved
 
 
 def get_final_assemblies_cmds(seedGenome, exes,
@@ -2061,11 +2788,14 @@ def get_final_assemblies_cmds(seedGenome, exes,
                               memory,
                               serialize,
                               skip_control=True,
-                              kmers="21,33,55,77,99", logger=None):
+                              kmers="21,33,55,77,99", run_quast=True,
+                              logger=None):
     """make cmds for runnning of SPAdes and QUAST final assembly and analysis.
     if skip_control, just do the de fere novo assembly.  otherwise, do bother
     returns list of listed cmds
     ([[spades_cmd, quast_cmd], [spades_cmd2, quast_cmd2]])
+    if not run_quast, the lists only hold the SPAdes cmds, and no
+    quast reports are returned
     """
     logger.info("\n\nStarting Final Assemblies\n\n")
     quast_reports = []
@@ -2107,6 +2837,9 @@ def get_final_assemblies_cmds(seedGenome, exes,
         modest_spades_cmd = make_modest_spades_cmd(
             cmd=spades_cmd, cores=cores, memory=memory, split=2,
             serialize=serialize, logger=logger)
+        if not run_quast:
+            cmd_list.append([modest_spades_cmd])
+            continue
         ref = str("-R %s" % seedGenome.ref_fasta)
         quast_cmd = str("{0} {1} {2} {3} -o {4}").format(
             exes.python2_7,
@@ -2120,47 +2853,508 @@ def get_final_assemblies_cmds(seedGenome, exes,
     return(cmd_list, quast_reports)
 
 
+def get_spacer_length(mapping_stats, readlen, default=5000, quantile=0.999):
+    """ the runs of N's between the contigs of a pseudogenome only need to
+    be long enough that read pairs cant span two contigs: the insert size
+    that nearly all (quantile) of the proper pairs are within, but at least
+    twice the read length.  Without any pairs to go by, use default.
+    """
+    if mapping_stats is None or len(mapping_stats.insert_counts) == 0:
+        return default
+    return max(mapping_stats.insert_size_quantile(quantile), 2 * readlen)
+
+
+class PseudogenomeWriter(object):
+    """ writes a pseudogenome -- contigs, each preceded by a spacer of N's,
+    with one more spacer at the end -- straight to a wrapped fasta as the
+    contigs are read, rather than building it up in memory.  close()
+    writes the .fai alongside, and a table of where each contig went
+    (<fasta>.coords.tsv)
+    """
+    def __init__(self, path, name, spacer, width=60):
+        self.path = path
+        self.name = name
+        self.spacer = "N" * spacer
+        self.width = width
+        self.length = 0
+        self.coords = []
+        self.md5 = hashlib.md5()
+        self.outf = open(path, "w")
+        self.outf.write(">{0}\n".format(name))
+
+    def write(self, seq):
+        """ append seq, wrapping lines at width """
+        self.md5.update(seq.encode("utf-8"))
+        pos = 0
+        while pos < len(seq):
+            chunk = seq[pos: pos + self.width - self.length % self.width]
+            self.outf.write(chunk)
+            self.length = self.length + len(chunk)
+            pos = pos + len(chunk)
+            if self.length % self.width == 0:
+                self.outf.write("\n")
+
+    def add_fasta(self, key, fasta):
+        """ append a spacer, then the first record of fasta, line by line.
+        returns its (start, end) in the pseudogenome
+        """
+        self.write(self.spacer)
+        start = self.length
+        with open(fasta, "r") as inf:
+            in_record = False
+            for line in inf:
+                if line.startswith(">"):
+                    if in_record:
+                        break
+                    in_record = True
+                    continue
+                self.write(line.strip())
+        self.coords.append((key, start, self.length, fasta))
+        return (start, self.length)
+
+    def close(self):
+        """ returns the length of the pseudogenome """
+        self.write(self.spacer)
+        if self.length % self.width != 0:
+            self.outf.write("\n")
+        self.outf.close()
+        with open(self.path + ".fai", "w") as outf:
+            outf.write("\t".join([str(x) for x in [
+                self.name, self.length, len(self.name) + 2, self.width,
+                self.width + 1]]) + "\n")
+        with open(self.path + ".coords.tsv", "w") as outf:
+            outf.write("cluster\tstart\tend\tsource\n")
+            for row in self.coords:
+                outf.write("\t".join([str(x) for x in row]) + "\n")
+        seq_metadata.record(self.path, SequenceMetadata(
+            id=self.name, length=self.length, checksum=self.md5.hexdigest()))
+        return self.length
+
+
 def make_faux_genome(cluster_list, seedGenome, iteration,
                      output_root, nbuff, logger=None):
-    """ stictch together viable assembled contigs.  perhaps more importnatly,
-    this also re-write thes coords relative to the new "genome"
-    returns path to new faux_genome
+    """ stictch together viable assembled contigs, separated by nbuff N's
+    (see get_spacer_length), streaming them into the new "genome" fasta.
+    perhaps more importnatly, this also re-write thes coords relative to
+    the new "genome"; these are also written to <genome>.coords.tsv
+    returns (path to new faux_genome, its length), or 1 if there were no
+    viable contigs
     """
     logger.info("preparing extracted region genome for next round of mapping")
     logger.debug("using %i sequences", len(cluster_list))
-    nbuffer = "N" * nbuff
-    faux_genome = ""
-    counter = 0
     new_seq_name = seedGenome.name
-    if len(cluster_list) == 0:
+    viable = [x for x in cluster_list if
+              x.keep_contigs and x.continue_iterating]
+    if len(viable) == 0:
+        if len(cluster_list) != 0:
+            logger.warning("No viable contigs for faux genome construction!")
         return 1
-    for clu in cluster_list:
-        if not clu.keep_contigs or not clu.continue_iterating:
-            pass
-        else:
-            clu.global_start_coord = len(faux_genome) + nbuff
-            with open(clu.mappings[-1].assembled_contig, 'r') as con:
-                contig_rec = list(SeqIO.parse(con, 'fasta'))[0]
-            faux_genome = str(faux_genome + nbuffer + contig_rec.seq)
-            clu.global_end_coord = len(faux_genome)
-            # lastly, set cluster name to new sequence name
-            clu.sequence_id = new_seq_name
-            counter = counter + 1
-    if counter == 0:
-        logger.warning("No viable contigs for faux genome construction!")
-        return 1
-    else:
-        logger.info("combined %s records as genome for next round of mapping",
-                    counter)
-    record = SeqRecord(Seq(str(faux_genome + nbuffer),
-                           IUPAC.IUPACAmbiguousDNA()),
-                       id=new_seq_name)
-
+    logger.info("combining %i records as genome for next round of mapping",
+                len(viable))
     outpath = os.path.join(output_root,
                            "iter_{0}_buffered_genome.fasta".format(iteration))
-    with open(outpath, 'w') as outf:
-        SeqIO.write(record, outf, 'fasta')
-    return (outpath, len(record))
+    writer = PseudogenomeWriter(outpath, name=new_seq_name, spacer=nbuff)
+    for clu in viable:
+        clu.global_start_coord, clu.global_end_coord = writer.add_fasta(
+            clu.index, clu.mappings[-1].assembled_contig)
+        # lastly, set cluster name to new sequence name
+        clu.sequence_id = new_seq_name
+    return (outpath, writer.close())
+
+
+def read_seed_library(path):
+    """ returns the SeqRecords of a seed library: a fasta of long reads
+    from a previous run (such as riboSeedContigs.fasta), or a directory of
+    them (such as final_long_reads/).  Repeated sequences are only
+    returned once.
+    """
+    if os.path.isdir(path):
+        fastas = []
+        for dirpath, dirnames, files in os.walk(path):
+            fastas.extend([os.path.join(dirpath, x) for x in sorted(files)
+                           if os.path.splitext(x)[1] in
+                           [".fasta", ".fa", ".fna"]])
+    else:
+        fastas = [path]
+    records, seen = [], set()
+    for fasta in fastas:
+        for rec in SeqIO.parse(fasta, "fasta"):
+            if str(rec.seq).upper() not in seen:
+                seen.add(str(rec.seq).upper())
+                records.append(rec)
+    return records
+
+
+def match_seed_library(clusters, records, flank, k=21, min_similarity=0.8,
+                       logger=None):
+    """ match long reads from a previous run to clusters by k-mers.
+    Each cluster is scored against each read by the fraction of the
+    k-mers of its 5' and 3' flanking regions (the parts that set clusters
+    apart) found in the read, taking the lower of the two.  Reads are then
+    assigned one per cluster, best score first.  The clusters' global
+    coords must be set.  Returns a dict of {cluster index: (SeqRecord,
+    score)} for the clusters matched with at least min_similarity.
+    """
+    assert logger is not None, "must use logging"
+    read_hashes = [np.unique(sequence_kmer_hashes(str(x.seq), k=k))
+                   for x in records]
+    scores = []
+    for clu in clusters:
+        region = str(clu.seq_record.seq[clu.global_start_coord:
+                                        clu.global_end_coord])
+        flanks = [np.unique(sequence_kmer_hashes(x, k=k)) for x in
+                  [region[:flank], region[-flank:]]]
+        for idx, hashes in enumerate(read_hashes):
+            score = min([np.isin(x, hashes, assume_unique=True).mean()
+                         if len(x) else 0.0 for x in flanks])
+            logger.debug("cluster %i vs %s: %.3f", clu.index,
+                         records[idx].id, score)
+            if score >= min_similarity:
+                scores.append((score, clu.index, idx))
+    matches, used = {}, set()
+    for score, index, idx in sorted(scores,
+                                    key=lambda x: (-x[0], x[1], x[2])):
+        if index in matches or idx in used:
+            continue
+        matches[index] = (records[idx], score)
+        used.add(idx)
+    return matches
+
+
+def warm_start_clusters(clusters, matches, seedGenome, nbuff, logger=None):
+    """ use matched long reads from a seed library in place of the
+    reference regions: each cluster gets a LociMapping holding its read as
+    the assembled contig, and a pseudogenome is made from them for the
+    first round of mapping.  Returns the path to the pseudogenome.
+    """
+    assert logger is not None, "must use logging"
+    for clu in clusters:
+        rec, score = matches[clu.index]
+        logger.info("seeding cluster %i with %s (similarity %.3f)",
+                    clu.index, rec.id, score)
+        seed_mapping = LociMapping(
+            name="{0}_cluster_{1}".format(clu.sequence_id, clu.index),
+            iteration=0,
+            assembly_subdir_needed=False,
+            mapping_subdir=os.path.join(
+                seedGenome.output_root, clu.cluster_dir_name,
+                "{0}_cluster_{1}_seed_library".format(
+                    clu.sequence_id, clu.index)))
+        seed_mapping.ref_fasta = os.path.join(
+            seed_mapping.mapping_subdir, "seed_library_contig.fasta")
+        with open(seed_mapping.ref_fasta, "w") as outf:
+            SeqIO.write(SeqRecord(rec.seq, id=rec.id, description=""),
+                        outf, "fasta")
+        seq_metadata.record(seed_mapping.ref_fasta,
+                            sequence_metadata(rec.id, rec.seq))
+        seed_mapping.assembled_contig = seed_mapping.ref_fasta
+        seed_mapping.assembly_success = True
+        clu.mappings.append(seed_mapping)
+    faux_genome_path, faux_genome_len = make_faux_genome(
+        cluster_list=clusters,
+        seedGenome=seedGenome,
+        iteration="seed_library",
+        output_root=seedGenome.output_root,
+        nbuff=nbuff,
+        logger=logger)
+    faux_rec = IndexedFasta(faux_genome_path).view()
+    for clu in clusters:
+        clu.seq_record = faux_rec
+    return faux_genome_path
+
+
+def sample_fastq(path, max_reads):
+    """ returns the sequences of the first max_reads reads of a (maybe
+    gzipped) fastq, and the fraction of the file they came from, to
+    scale counts from them up to the whole file
+    """
+    seqs = []
+    with open(path, "rb") as raw:
+        if path.endswith(".gz"):
+            inf = io.TextIOWrapper(gzip.GzipFile(fileobj=raw))
+        else:
+            inf = io.TextIOWrapper(raw)
+        for idx, line in enumerate(inf):
+            if idx % 4 == 1:
+                seqs.append(line.strip())
+                if len(seqs) >= max_reads:
+                    return (seqs, min(1.0, float(raw.tell()) /
+                                      os.path.getsize(path)))
+    return (seqs, 1.0)
+
+
+def predict_flank_depths(clusters, flank, fastqs=None, read_store=None,
+                         k=21, max_reads=100000, batch_size=20000,
+                         logger=None):
+    """ estimate the depth over each cluster's 5' and 3' flanking regions
+    without mapping, by counting how often the flanks' k-mers turn up in a
+    sample of each library's reads and scaling up to all of them.  With a
+    read store the sample is random and the totals exact; otherwise it is
+    the start of each fastq.  K-mers in more than one flank are ignored.
+    The clusters' global coords must be set.  Returns a list of (cluster
+    index, 5' depth, 3' depth)
+    """
+    assert logger is not None, "must use logging"
+    flank_hashes = []  # 5' then 3' for each cluster
+    for clu in clusters:
+        region = str(clu.seq_record.seq[clu.global_start_coord:
+                                        clu.global_end_coord])
+        for seq in [region[:flank], region[-flank:]]:
+            flank_hashes.append(np.unique(sequence_kmer_hashes(seq, k=k)))
+    uniq, counts = np.unique(np.concatenate(flank_hashes),
+                             return_counts=True)
+    uniq = uniq[counts == 1]
+    if read_store is not None:
+        samples = []
+        for lib in read_store.libraries():
+            idxs = read_store.subsample(max_reads, lib=lib, seed=38)
+            if len(idxs) != 0:
+                samples.append(
+                    ([read_store.get_seq(x) for x in idxs],
+                     float(read_store.count_reads(lib)) / len(idxs)))
+    else:
+        samples = []
+        for fastq in fastqs:
+            seqs, fraction = sample_fastq(fastq, max_reads=max_reads)
+            if len(seqs) != 0:
+                samples.append((seqs, 1.0 / fraction))
+    hits = np.zeros(len(uniq))
+    nreads, nbases = 0.0, 0.0
+    for seqs, scale in samples:
+        logger.debug("counting flank k-mers in %i reads (x %.2f)",
+                     len(seqs), scale)
+        for i in range(0, len(seqs), batch_size):
+            hashes = sequence_kmer_hashes("N".join(seqs[i: i + batch_size]),
+                                          k=k)
+            hashes = hashes[np.isin(hashes, uniq)]
+            hits = hits + scale * np.bincount(np.searchsorted(uniq, hashes),
+                                              minlength=len(uniq))
+        nreads = nreads + scale * len(seqs)
+        nbases = nbases + scale * sum([len(x) for x in seqs])
+    # a read covers each base it spans, but has only readlen - k + 1 k-mers
+    readlen = nbases / nreads if nreads else 0
+    factor = readlen / max(1.0, readlen - k + 1)
+    depths = []
+    for hashes in flank_hashes:
+        hashes = hashes[np.isin(hashes, uniq)]
+        depths.append(float(hits[np.searchsorted(uniq, hashes)].mean()) *
+                      factor if len(hashes) else 0.0)
+    return [(clu.index, depths[2 * i], depths[2 * i + 1])
+            for i, clu in enumerate(clusters)]
+
+
+def get_flank_depths(bam, flank):
+    """ mean depth over the first and last flank bases of the first
+    reference in an indexed bam, as (5' depth, 3' depth)
+    """
+    with pysam.AlignmentFile(bam, "rb") as inbam:
+        contig, length = inbam.references[0], inbam.lengths[0]
+        flank = max(1, min(flank, length))
+        depths = []
+        for start, end in [(0, flank), (length - flank, length)]:
+            coverage = inbam.count_coverage(contig, start, end,
+                                            quality_threshold=0)
+            depths.append(
+                float(sum([sum(x) for x in coverage])) / (end - start))
+    return tuple(depths)
+
+
+def make_async_cluster_job(cluster, iteration, seedGenome, exes, ngsLib,
+                           cores, memory, mapper, score_min, flank,
+                           min_flank_depth, kmers, oom_retries=0,
+                           min_free=0, dedup=False, unmapped_fastq=None,
+                           logger=None):
+    """ set up the next LociMapping for a cluster iterating on its own,
+    using its last assembled contig as the reference, and return a job
+    spec (a plain dict, so it can be sent to a worker) for
+    run_async_cluster_job: map the reads to that contig, filter,
+    check the flanking depth, and reassemble.
+    Given unmapped_fastq (see write_unmapped_reads), only the reads from
+    the cluster's previous mapping and the reads that mapped nowhere are
+    mapped; otherwise all of ngsLib is
+    """
+    assert logger is not None, "must use logging"
+    previous = cluster.mappings[-1]
+    mapping_ob = LociMapping(
+        name="{0}_cluster_{1}".format(cluster.sequence_id, cluster.index),
+        iteration=iteration,
+        assembly_subdir_needed=True,
+        mapping_subdir=os.path.join(
+            seedGenome.output_root, cluster.cluster_dir_name,
+            "{0}_cluster_{1}_mapping_iteration_{2}".format(
+                cluster.sequence_id, cluster.index, iteration)),
+        assembly_subdir=os.path.join(
+            seedGenome.output_root, cluster.cluster_dir_name,
+            "{0}_cluster_{1}_assembly_iteration_{2}".format(
+                cluster.sequence_id, cluster.index, iteration)))
+    # copy, so the mapper's index files end up in this mapping's dir
+    mapping_ob.ref_fasta = os.path.join(mapping_ob.mapping_subdir,
+                                        "extracted_seed_sequence.fasta")
+    seq_metadata.copy(previous.assembled_contig, mapping_ob.ref_fasta)
+    cluster.mappings.append(mapping_ob)
+    if unmapped_fastq is not None and previous.mapped_ngslib is not None:
+        ngsLib = NgsLib(name="cluster_%i_subset" % cluster.index,
+                        master=False,
+                        readS0=previous.mapped_ngslib.readS0,
+                        readS1=unmapped_fastq,
+                        ref_fasta=mapping_ob.ref_fasta, logger=logger)
+    map_cmds = []
+    inbams = []
+    for label, fastqs, bam in get_library_map_specs(ngsLib, mapping_ob):
+        map_cmds.append("{0} | {1} view -bh - | {1} sort -o {2} -".format(
+            mapper.map_cmd(ref_fasta=mapping_ob.ref_fasta, fastqs=fastqs,
+                           cores=1, score_min=score_min),
+            exes.samtools, bam))
+        inbams.append(bam)
+    convert_cmd, new_ngslib = convert_bam_to_fastqs_cmd(
+        mapping_ob=mapping_ob, which='mapped', single=True,
+        samtools_exe=exes.samtools, ref_fasta=mapping_ob.ref_fasta,
+        logger=logger)
+    mapping_ob.mapped_ngslib = new_ngslib
+    spades_cmd = generate_spades_cmd(
+        mapping_ob=mapping_ob, ngs_ob=new_ngslib, single_lib=True,
+        ref_as_contig="trusted", check_libs=True, as_paired=False,
+        prelim=True, k=kmers, spades_exe=exes.spades, logger=logger)
+    return {"key": cluster.index,
+            "iteration": iteration,
+            "index_cmd": mapper.index_cmd(mapping_ob.ref_fasta),
+            "map_cmds": map_cmds,
+            "inbams": inbams,
+            "mapped_bam": mapping_ob.mapped_bam,
+            "mapping_stats_json": mapping_ob.mapping_stats_json,
+            "dedup": dedup,
+            "score_min": mapper.filter_score(score_min),
+            "flank": flank,
+            "min_flank_depth": min_flank_depth,
+            "assembly_cmds": [convert_cmd, make_modest_spades_cmd(
+                cmd=spades_cmd, cores=cores, memory=memory, logger=logger)],
+            "oom_retries": oom_retries,
+            "min_free": min_free}
+
+
+def run_async_cluster_job(spec):
+    """ run in a worker: the mapping, filtering, depth check, and assembly
+    of one cluster for one iteration.  Logger cant be used with
+    multiprocessing, so this returns a dict like
+    subprocess_run_list_watched, plus the flanking depths, and whether
+    coverage was too low to bother assembling
+    """
+    result = {"key": spec["key"], "iteration": spec["iteration"],
+              "returncode": 0, "peak_rss": 0, "retries": [], "error": "",
+              "elapsed": 0, "depths": (0.0, 0.0), "low_coverage": False}
+    t0 = time.time()
+    if subprocess_run_list([spec["index_cmd"]] + spec["map_cmds"]) != 0:
+        result["returncode"] = 1
+        result["error"] = "mapping failed"
+        return result
+    merge_filter_bams(inbams=spec["inbams"], outbam=spec["mapped_bam"],
+                      score=spec["score_min"],
+                      logger=logging.getLogger(__name__)).write(
+                          spec["mapping_stats_json"])
+    pysam.index(spec["mapped_bam"])
+    result["depths"] = get_flank_depths(spec["mapped_bam"], spec["flank"])
+    if min(result["depths"]) < spec["min_flank_depth"]:
+        result["low_coverage"] = True
+        result["elapsed"] = time.time() - t0
+        return result
+    if spec["dedup"]:
+        result["dedup"] = dedup_bam_in_place(
+            bam=spec["mapped_bam"], logger=logging.getLogger(__name__))
+    assembly = subprocess_run_list_watched(
+        spec["assembly_cmds"], oom_retries=spec["oom_retries"],
+        min_free=spec["min_free"])
+    assembly["elapsed"] = time.time() - t0
+    result.update(assembly)
+    return result
+
+
+def iterate_clusters_async(clusters, seedGenome, exes, iterations, cores,
+                           memory, mapper, score_min, flank,
+                           min_flank_depth, kmers, eval_kwargs,
+                           oom_retries=0, min_free=0, dedup=False, poll=2,
+                           unmapped_fastq=None, catalog=None, logger=None):
+    """ after the genome-wide iteration 0, let each cluster iterate on its
+    own: its reads (and, given unmapped_fastq, the reads that mapped
+    nowhere) are mapped against its own latest contig, and as soon
+    as one of its iterations finishes it is evaluated and (if it should
+    keep going) its next iteration is queued, without waiting for the
+    other clusters.  Note that without a shared pseudogenome, clusters
+    no longer compete for multimapping reads.  If a RunCatalog is given,
+    each subassembly and its evaluation are recorded in it.
+    returns the (index, 5' depth, 3' depth) tuples for each iteration,
+    as passed to ClusterRegistry.record_depths
+    """
+    assert logger is not None, "must use logging"
+    pool = multiprocessing.Pool(processes=cores)
+    pending = {}
+    depths = [[] for i in range(1, iterations)]
+    by_index = {x.index: x for x in clusters}
+
+    def submit(clu):
+        iteration = clu.mappings[-1].iteration + 1
+        if not clu.continue_iterating or iteration >= iterations:
+            return
+        logger.info("queueing iteration %i for cluster %i", iteration,
+                    clu.index)
+        spec = make_async_cluster_job(
+            cluster=clu, iteration=iteration, seedGenome=seedGenome,
+            exes=exes, ngsLib=seedGenome.master_ngs_ob, cores=cores,
+            memory=memory, mapper=mapper, score_min=score_min,
+            flank=flank, min_flank_depth=min_flank_depth, kmers=kmers,
+            oom_retries=oom_retries, min_free=min_free, dedup=dedup,
+            unmapped_fastq=unmapped_fastq, logger=logger)
+        pending[clu.index] = pool.apply_async(run_async_cluster_job, (spec,))
+
+    for clu in clusters:
+        submit(clu)
+    while len(pending) != 0:
+        finished = [k for k, v in pending.items() if v.ready()]
+        if len(finished) == 0:
+            time.sleep(poll)
+            continue
+        for key in finished:
+            result = pending.pop(key).get()
+            clu = by_index[key]
+            depths[result["iteration"] - 1].append(
+                (clu.index, result["depths"][0], result["depths"][1]))
+            if catalog is not None:
+                catalog.record_watched("subassembly", [result],
+                                       iteration=result["iteration"],
+                                       clusters=[clu.index])
+            for retry in result["retries"]:
+                logger.warning("cluster %i ran out of memory; retried as:" +
+                               "\n%s", clu.index, retry["retry_cmd"])
+            if "dedup" in result:
+                logger.info("cluster %i: removed %i of %i reads (or " +
+                            "pairs) as duplicates", clu.index,
+                            result["dedup"][0] - result["dedup"][1],
+                            result["dedup"][0])
+            if result["low_coverage"]:
+                logger.warning(
+                    "cluster %i has insufficient flanking coverage in " +
+                    "iteration %i (%.2f, %.2f); keeping the previous contig",
+                    clu.index, result["iteration"], result["depths"][0],
+                    result["depths"][1])
+                # stop here, but still use it in the pseudogenome
+                clu.mappings[-1].assembled_contig = \
+                    clu.mappings[-2].assembled_contig
+                continue
+            if result["returncode"] != 0:
+                logger.error("cluster %i iteration %i failed: %s", clu.index,
+                             result["iteration"], result["error"])
+            clu.assembly_success = evaluate_spades_success(
+                clu=clu, mapping_ob=clu.mappings[-1], logger=logger,
+                **eval_kwargs)
+            if catalog is not None:
+                record_evaluation(catalog, clu)
+            parse_subassembly_return_code(
+                cluster=clu,
+                final_contigs_dir=seedGenome.final_long_reads_dir,
+                logger=logger)
+            submit(clu)
+    pool.close()
+    pool.join()
+    return depths
 
 
 def decide_proceed_to_target(target_len, logger=None):
@@ -2209,6 +3403,72 @@ def subprocess_run_list(cmdlist, hard=False, logger=None):
     return 0
 
 
+def wait_for_pool_results(async_results, job_keys, job_status,
+                          straggler_factor=0, min_timeout=0, poll=5,
+                          logger=None):
+    """ stands in for pool.join() for jobs run with
+    subprocess_run_list_watched: waits for all the jobs, killing any that
+    take longer than get_straggler_timeout allows so one pathological
+    cluster cant hold up the whole iteration.
+    returns the results, in order
+    """
+    assert logger is not None, "must use logging"
+    durations = {}
+    while len(durations) < len(async_results):
+        for key, res in zip(job_keys, async_results):
+            if key not in durations and res.ready():
+                durations[key] = res.get()["elapsed"]
+        limit = get_straggler_timeout(
+            durations=list(durations.values()), njobs=len(async_results),
+            factor=straggler_factor, min_timeout=min_timeout)
+        if limit is not None:
+            now = time.time()
+            for key in job_keys:
+                if key in durations or \
+                   job_status.get(("killed", key), False):
+                    continue
+                start = job_status.get(("start", key), None)
+                if start is None or now - start < limit:
+                    continue
+                logger.warning("job %s has run for %.0fs, over the limit " +
+                               "of %.0fs; killing it", key, now - start,
+                               limit)
+                job_status[("killed", key)] = True
+                pid = job_status.get(("pid", key), None)
+                if pid is not None:
+                    kill_process_tree(pid)
+        if len(durations) < len(async_results):
+            time.sleep(poll)
+    return [x.get() for x in async_results]
+
+
+def log_watched_results(results, job_names, stage, report, logger=None):
+    """ log failures and out-of-memory retries from
+    subprocess_run_list_watched, and add a row per job to report
+    """
+    assert logger is not None, "must use logging"
+    for name, res in zip(job_names, results):
+        for retry in res["retries"]:
+            logger.warning("%s %s ran out of memory (code %i, peak %.2fGB); " +
+                           "retrying as:\n%s", stage, name,
+                           retry["returncode"], retry["peak_rss"] / 1e9,
+                           retry["retry_cmd"])
+        if res["returncode"] != 0:
+            logger.error("%s %s failed:\n%s", stage, name, res["error"])
+        report.append([stage, name, res["returncode"],
+                       "%.2f" % (res["peak_rss"] / 1e9), len(res["retries"])])
+
+
+def write_resource_report(report, outfile):
+    """ tab-separated summary of each pooled job's peak memory and retries
+    """
+    with open(outfile, "w") as outf:
+        outf.write("\t".join(["stage", "job", "returncode", "peak_rss_gb",
+                              "oom_retries"]) + "\n")
+        for row in report:
+            outf.write("\t".join([str(x) for x in row]) + "\n")
+
+
 def copyToHandyDir(outdir, pre, seedGenome, hard=False, logger=None):
     """ copy the resulting contigs
     """
@@ -2286,73 +3546,39 @@ def printPlot(data, line=None, ymax=30, xmax=60, tick=.2,
     logger.info("\n" + "\n".join(plotlines))
 
 
-def plotAsScores(score_list, score_min, outdir, logger=None):
-
-    assert logger is not None, "must use logging"
-    basename = os.path.join(outdir, "AS_score_plot")
-    if len(score_list) > 200000:
-        logger.info("Downsampling our pltting data to 20k points")
-        score_list = random.sample(score_list, 200000)
-    xmax = max(score_list)
-    ymax = max(set(score_list), key=score_list.count)
-    logger.info("score_min, xmax and ymax: %s, %s, %s", score_min, xmax, ymax)
-    # plt.figure()  # <- makes a new figure and sets it active (add this)
-    fig, (plt1, plt2) = plt.subplots(1, 2, sharex=False)
-    # ,
-    #                                  gridspec_kw={'height_ratios': [1, 1]})
-    plt1.hist(score_list, bins=50, color='b', alpha=0.9, label='Binned')
-    plt1.hist(score_list, bins=100,
-              cumulative=True, color='r', alpha=0.5,
-              label='Cumulative')
-    plt1.set_title('Read Alignment Score Histogram')
-    plt1.set_xlabel('Alignemnt Score')
-    plt1.set_ylabel('Abundance')
-    plt1.plot([score_min, score_min], [0, len(score_list) * 1.1],
-              color='green', linewidth=5, alpha=0.6)
-    plt1.axis([0, max(score_list), 0, len(score_list) * 1.1])
-    # plt1.set_yscale("log", nonposy='clip')
-    plt1.legend()
-    plt.tight_layout()
-    plt1.grid(True)
-    plt2.grid(True)
-
-    plt2.scatter(y=sorted(score_list, reverse=True),
-                 x=range(0, len(score_list)))
-    plt2.plot([0, len(score_list) * 1.1], [score_min, score_min],
-              color='green', linewidth=5, alpha=0.6)
-    plt2.axis([0, len(score_list) * 1.1, 0, max(score_list) * 1.1])
-    plt2.set_title('Read Alignment Score, Sorted')
-    plt2.set_ylabel('Alignment Score')
-    plt2.set_xlabel('Index of Sorted Read')
-    fig.set_size_inches(12, 7.5)
-    fig.savefig(str(basename + '.png'), dpi=(200))
-    fig.savefig(str(basename + '.pdf'), dpi=(200))
-    logger.info("Plotting alignment score of mapping:")
-    # printPlot(data=score_list, line=score_min, ymax=30, xmax=60, tick=.2,
-    #           fill=True,
-    #           title="Average alignment Scores (y) by sorted read index (x)",
-    #           logger=logger)
-    logger.info("Filled area represents the reads retained after filtering. " +
-                "If it looks like " +
-                "this filtering threshold is inapporpriate, consider " +
-                "adjusting with --score_min")
-
-
-def reportRegionDepths(inp, logger):
+def reportRegionDepths(registry, logger):
+    """ lines reporting the flanking depths recorded in a ClusterRegistry
+    for each cluster, by iteration
+    """
     assert logger is not None, "must use logging"
     report_list = []
-    nclusters = len(inp[0])
-    for i in range(0, nclusters):
-        report_list.append("Cluster %i:" % i)
-        for itidx, iteration in enumerate(inp):
-            for cluster in iteration:
-                if cluster[0] == i:
-                    report_list.append(
-                        "\tIter %i -- 5' coverage: %.2f  3' coverage %.2f" % (
-                            itidx, cluster[1], cluster[2]))
+    recorded = ~np.isnan(registry.depths[:, :, 0])
+    for row, index in enumerate(registry.index):
+        report_list.append("Cluster %i:" % index)
+        for itidx in np.flatnonzero(recorded[row]):
+            report_list.append(
+                "\tIter %i -- 5' coverage: %.2f  3' coverage %.2f" % (
+                    itidx, registry.depths[row, itidx, 0],
+                    registry.depths[row, itidx, 1]))
     return(report_list)
 
 
+def record_evaluation(catalog, cluster):
+    """ add the evaluation of a cluster's latest subassembly to the run
+    catalog: its return code, and the lengths of its seed, its reference,
+    and the new contig
+    """
+    mapping_ob = cluster.mappings[-1]
+    lengths = mapping_ob.contig_lengths
+    if lengths is None:
+        lengths = (None, None, None)
+    catalog.record("evaluation", iteration=mapping_ob.iteration,
+                   cluster=cluster.index,
+                   returncode=cluster.assembly_success,
+                   seed_len=lengths[0], ref_len=lengths[1],
+                   contig_len=lengths[2])
+
+
 def make_modest_spades_cmd(cmd, cores, memory, split=0,
                            serialize=False, logger=None):
     """ adjust spades commands to use set amounts of cores and memory
@@ -2422,6 +3648,13 @@ if __name__ == "__main__":
     if args.cores is None:
         args.cores = multiprocessing.cpu_count()
         logger.info("Using %i cores", multiprocessing.cpu_count())
+    if args.queue_dir is not None:
+        queue_dir = os.path.abspath(os.path.expanduser(args.queue_dir))
+        # job ids must be unique among all runs sharing a queue
+        run_token = "{0}_{1}_{2}".format(
+            args.exp_name, int(t0), os.getpid())
+        logger.info("Subassemblies will be run through the queue at %s " +
+                    "by riboWorker.py processes", queue_dir)
 
     logger.info("checking for installations of all required external tools")
     logger.debug("creating an Exes object")
@@ -2430,8 +3663,10 @@ if __name__ == "__main__":
                         spades=args.spades_exe,
                         bwa=args.bwa_exe,
                         smalt=args.smalt_exe,
-                        quast=args.quast_exe,
-                        python2_7=args.python2_7_exe,
+                        minimap2=args.minimap2_exe,
+                        quast=args.quast_exe if args.run_quast else None,
+                        python2_7=args.python2_7_exe if args.run_quast
+                        else None,
                         method=args.method)
     except Exception as e:
         logger.error(e)
@@ -2439,11 +3674,22 @@ if __name__ == "__main__":
 
     logger.debug("All needed system executables found!")
     logger.debug(str(sys_exes.__dict__))
+    # everything about the mapper (commands, scores) goes through this
+    mapper = get_mapper_backend(args.method, exe=sys_exes.mapper,
+                                add_args=args.mapper_args)
+    # checks already passed by these exact binaries are not rerun
+    toolchain = open_toolchain_manifest(args.toolchain_cache, logger=logger)
+    if args.recheck_tools and toolchain is not None:
+        toolchain.clear()
     try:
-        samtools_verison = check_version_from_cmd(
-            exe=sys_exes.samtools, cmd='', line=3, where='stderr',
-            pattern=r"\s*Version: (?P<version>[^(]+)",
-            min_version=SAMTOOLS_MIN_VERSION, logger=logger)
+        samtools_verison = cached_check(
+            toolchain, exe=sys_exes.samtools,
+            check="version>=" + SAMTOOLS_MIN_VERSION,
+            func=lambda: check_version_from_cmd(
+                exe=sys_exes.samtools, cmd='', line=3, where='stderr',
+                pattern=r"\s*Version: (?P<version>[^(]+)",
+                min_version=SAMTOOLS_MIN_VERSION, logger=logger),
+            logger=logger)
     except Exception as e:
         logger.error(e)
         sys.exit(1)
@@ -2451,11 +3697,19 @@ if __name__ == "__main__":
     # check bambamc is installed proper if using smalt
     if args.method == "smalt":
         logger.info("SMALT is the selected mapper")
-        test_smalt_cmds = get_smalt_full_install_cmds(smalt_exe=sys_exes.smalt,
-                                                      logger=logger)
-        test_smalt_bam_install(cmds=test_smalt_cmds, logger=logger)
+        cached_check(
+            toolchain, exe=sys_exes.smalt, check="bam_output",
+            func=lambda: test_smalt_bam_install(
+                cmds=get_smalt_full_install_cmds(smalt_exe=sys_exes.smalt,
+                                                 logger=logger),
+                logger=logger),
+            logger=logger)
     else:
-        logger.info("BWA is the selected mapper")
+        logger.info("%s is the selected mapper", mapper.name)
+    if args.async_clusters and (args.method == "smalt" or args.serialize):
+        logger.error("--async_clusters can only be used with BWA or " +
+                     "minimap2, and not with --serialize")
+        sys.exit(1)
 
     # if the target_len is set. set needed params
     try:
@@ -2494,6 +3748,21 @@ if __name__ == "__main__":
     # add ngslib object for user supplied NGS data
     logger.debug("adding the sequencing libraries to the seedGenome")
     logger.debug(args.fastqS1)
+    read_store = None
+    if args.read_store:
+        store_libs = [(lib, path) for lib, path in [
+            ("readF", args.fastq1), ("readR", args.fastq2),
+            ("readS0", args.fastqS1)] if path is not None]
+        store_libs.extend([("readS%i" % (i + 1), path) for i, path in
+                           enumerate(args.fastqS2 or [])])
+        try:
+            read_store = open_shared_read_store(
+                os.path.abspath(os.path.expanduser(args.read_store)),
+                store_libs, logger=logger)
+        except Exception as e:
+            logger.error("Error building read store")
+            logger.error(last_exception())
+            sys.exit(1)
     seedGenome.master_ngs_ob = NgsLib(
         name="master",
         master=True,
@@ -2501,10 +3770,11 @@ if __name__ == "__main__":
         readF=args.fastq1,
         readR=args.fastq2,
         readS0=args.fastqS1,
-        # readS1=args.fastqS2,
+        readS1=args.fastqS2,
         logger=logger,
         mapper_exe=sys_exes.mapper,
-        ref_fasta=seedGenome.ref_fasta)
+        ref_fasta=seedGenome.ref_fasta,
+        read_store=read_store)
 
     checked_k = check_kmer_vs_reads(
         k=args.kmers,
@@ -2522,7 +3792,8 @@ if __name__ == "__main__":
         # check equal length fastq.  This doesnt actually check propper pairs
         logger.debug("Checking that the fastq pair have equal number of reads")
         try:
-            check_fastqs_len_equal(file1=args.fastq1, file2=args.fastq2)
+            check_fastqs_len_equal(file1=args.fastq1, file2=args.fastq2,
+                                   read_store=read_store)
         except Exception as e:
             # not just value error, whatever file_len throws
             logger.error(last_exception())
@@ -2535,6 +3806,7 @@ if __name__ == "__main__":
             gb_filepath=seedGenome.genbank_path,
             output_root=output_root,
             circular=args.linear is False,
+            gb_records=seedGenome.genbank,
             logger=logger)
     except Exception as e:
         logger.error(e)
@@ -2560,34 +3832,105 @@ if __name__ == "__main__":
         logger.error(last_exception())
         sys.exit(1)
 
+    # from here on, the clusters' coords and flags are kept in arrays
+    cluster_registry = ClusterRegistry(seedGenome.loci_clusters)
     # make first iteration look like future iterations:
     # this should also ensure the mapper uses the padded version
     seedGenome.next_reference_path = seedGenome.ref_fasta
     #
     for cluster in seedGenome.loci_clusters:
         cluster.master_ngs_ob = seedGenome.master_ngs_ob
+    if args.precheck_depth or args.seed_library is not None:
+        for clu in seedGenome.loci_clusters:
+            set_global_coords(cluster=clu, flank=args.flanking,
+                              logger=logger)
+    # drop clusters that wont have the depth to subassemble before
+    # paying for the mapping
+    if args.precheck_depth:
+        try:
+            predicted_depths = predict_flank_depths(
+                clusters=seedGenome.loci_clusters, flank=args.flanking,
+                fastqs=[x for x in [args.fastq1, args.fastq2, args.fastqS1] +
+                        (args.fastqS2 or []) if x is not None],
+                read_store=read_store, max_reads=args.precheck_reads,
+                logger=logger)
+        except Exception as e:
+            logger.error("Error estimating flanking depths")
+            logger.error(last_exception())
+            sys.exit(1)
+        with open(os.path.join(output_root, "predicted_flank_depths.tsv"),
+                  "w") as outf:
+            outf.write("cluster\t5prime_depth\t3prime_depth\texcluded\n")
+            for clu, (index, start_depth, end_depth) in zip(
+                    seedGenome.loci_clusters, predicted_depths):
+                excluded = min(start_depth, end_depth) < args.min_flank_depth
+                logger.info("predicted flanking depths for cluster %i: " +
+                            "%.2f, %.2f", index, start_depth, end_depth)
+                if excluded:
+                    logger.warning(
+                        "cluster %i is predicted to have insufficient " +
+                        "flanking coverage depth for subassembly, and " +
+                        "will be removed", index)
+                    clu.continue_iterating = False
+                    clu.keep_contigs = False
+                outf.write("{0}\t{1:.2f}\t{2:.2f}\t{3}\n".format(
+                    index, start_depth, end_depth, excluded))
+    # with a seed library, start from the long reads of a previous run
+    # rather than re-deriving them from the reference
+    warm_started = False
+    if args.seed_library is not None:
+        seed_clusters = [x for x in seedGenome.loci_clusters if
+                         x.keep_contigs]
+        seed_matches = match_seed_library(
+            clusters=seed_clusters,
+            records=read_seed_library(args.seed_library),
+            flank=args.flanking,
+            min_similarity=args.seed_min_similarity,
+            logger=logger)
+        if len(seed_clusters) != 0 and \
+           len(seed_matches) == len(seed_clusters):
+            seedGenome.next_reference_path = warm_start_clusters(
+                clusters=seed_clusters, matches=seed_matches,
+                seedGenome=seedGenome, nbuff=5000, logger=logger)
+            warm_started = True
+            logger.info("mapping first to seed library pseudogenome %s",
+                        seedGenome.next_reference_path)
+        else:
+            logger.warning(
+                "only %i of %i clusters matched a read in the seed " +
+                "library; starting from the reference", len(seed_matches),
+                len(seed_clusters))
 # ---------------------------------------------------------------------------
+    # figures are drawn in the background, from summaries of the data
+    figures = FigureService(enabled=not args.no_figures, logger=logger)
+    # per-iteration metrics are also kept in the run catalog
+    catalog_path = requested_catalog_path(args.catalog)
+    catalog = RunCatalog(path=catalog_path,
+                         enabled=catalog_path is not None, logger=logger)
+    if catalog_path is not None:
+        logger.info("adding this run to the run catalog %s", catalog_path)
+    catalog.start_run(sample=args.exp_name,
+                      reference=os.path.basename(args.reference_genbank),
+                      output_root=output_root, version=__version__,
+                      command=" ".join(sys.argv))
     # Performance summary lists
     mapping_percentages = []
-    region_depths = []
+    resource_report = []
+    archived_iterations = []
     # now, we need to assemble each mapping object
     # this should exclude any failures
     while seedGenome.this_iteration < args.iterations:
         logger.info("processing iteration %i", seedGenome.this_iteration)
         logger.debug("with new reference: %s", seedGenome.next_reference_path)
-        clusters_to_process = [x for x in seedGenome.loci_clusters if
-                               x.continue_iterating and
-                               x.keep_contigs]
+        active = cluster_registry.active()
+        clusters_to_process = cluster_registry.select(active)
         if len(clusters_to_process) == 0:
             logger.error("No clusters had sufficient mapping! Exiting")
             sys.exit(1)
-        if len(clusters_to_process) < len(seedGenome.loci_clusters):
+        if not active.all():
             logger.warning(
                 "clusters excluded from this iteration \n%s",
-                " ".join([str(x.index) for x in
-                          seedGenome.loci_clusters if
-                          x.index not in [y.index for
-                                          y in clusters_to_process]]))
+                " ".join([str(x) for x in cluster_registry.index[~active]]))
         # For each (non-inital) iteration
         if seedGenome.this_iteration != 0:
             if seedGenome.this_iteration != 1:
@@ -2600,18 +3943,23 @@ if __name__ == "__main__":
                     # probably very upset with me.
                     seedGenome.purge_old_files(all_iters=False, logger=logger)
 
-            # seqrecords for the clusters to be gen.next_reference_path
-            with open(seedGenome.next_reference_path, 'r') as nextref:
-                next_seqrec = list(SeqIO.parse(nextref, 'fasta'))[0]  # next?
+            # seqrecords for the clusters to be gen.next_reference_path;
+            # one view, shared by all of them
+            next_seqrec = IndexedFasta(seedGenome.next_reference_path).view()
             for clu in clusters_to_process:
                 clu.seq_record = next_seqrec
             # print qualities of mapped reads
             for clu in clusters_to_process:
-                logger.debug("getting mapping scores for cluster %i from %s",
-                             clu.index, clu.mappings[-1].mapped_bam)
-                mapped_scores = get_bam_AS(
-                    inbam=clu.mappings[-1].mapped_bam,
-                    logger=logger)
+                if str(clu.index) in mapping_stats.cluster_as_counts:
+                    mapped_scores = mapping_stats.score_list(
+                        cluster=clu.index)
+                else:
+                    logger.debug(
+                        "getting mapping scores for cluster %i from %s",
+                        clu.index, clu.mappings[-1].mapped_bam)
+                    mapped_scores = get_bam_AS(
+                        inbam=clu.mappings[-1].mapped_bam,
+                        logger=logger)
                 if len(mapped_scores) > 200000:
                     logger.info("Downsampling our pltting data to 20k points")
                     mapped_scores = random.sample(mapped_scores, 200000)
@@ -2653,26 +4001,18 @@ if __name__ == "__main__":
             # start with whole lib if first time through
             unmapped_ngsLib = seedGenome.master_ngs_ob
         # Run commands to map to the genome
+        # unless given, the mapper picks the score minimum from the read
+        # length; with SMALT, it gets more stringent with each mapping.
         if not args.score_min:
-            # This makes it such that score minimum is now more stringent
-            # with each mapping.
-            if args.method == 'smalt':
-                scaling_factor = 1.0 - (
-                    1.0 / (2.0 + float(seedGenome.this_iteration)))
-                score_minimum = int(unmapped_ngsLib.readlen * scaling_factor)
-                logger.info(
-                    "Mapping with min_score of %f2 (%f2 of read length, %f2)",
-                    scaling_factor, score_minimum, unmapped_ngsLib.readlen)
-            else:
-                assert args.method == 'bwa', "must be wither smalt or bwa"
-                # score_minimum = int(.15 * unmapped_ngsLib.readlen)
-                logger.info("using the default minimum score for BWA")
-                score_minimum = None
-        else:
-            score_minimum = args.score_min
-            logger.info(
-                "Mapping with min_score of %f2 (read length: %f2)",
-                score_minimum, unmapped_ngsLib.readlen)
+            logger.info("using the default minimum score for %s",
+                        mapper.name)
+        score_minimum = mapper.score_minimum(
+            readlen=unmapped_ngsLib.readlen,
+            iteration=seedGenome.this_iteration,
+            score_min=args.score_min if args.score_min else None)
+        logger.info(
+            "Mapping with min_score of %f2 (read length: %f2)",
+            score_minimum, unmapped_ngsLib.readlen)
 
         try:
             nonify_empty_lib_files(unmapped_ngsLib, logger=logger)
@@ -2686,40 +4026,67 @@ if __name__ == "__main__":
             else:
                 logger.error(" Exiting!")
                 sys.exit(1)
-        # the exe argument is Exes.mapper because that is what is checked
-        # during object instantiation
-        if args.method == "smalt":
-            # # get rid of bwa mapper default args
-            # if args.mapper_args == '-L 0,0 -U 0':
-            #     args.mapper_args =
-            map_percent = map_to_genome_ref_smalt(
-                mapping_ob=seedGenome.iter_mapping_list[
-                    seedGenome.this_iteration],
+        # the reads written for each cluster's region are tallied as the
+        # mapping is filtered, for the per-cluster reports next iteration
+        if seedGenome.this_iteration == 0:
+            for clu in clusters_to_process:
+                set_global_coords(cluster=clu, flank=args.flanking,
+                                  logger=logger)
+        map_regions = [(clu.index, clu.sequence_id, clu.global_start_coord,
+                        clu.global_end_coord) for clu in clusters_to_process]
+        # the iteration 0 mapping is the same for any run on these reads
+        # and reference, so check for a cached one
+        cached_mapping, map_cache_key = None, None
+        if args.map_cache_dir is not None and args.method != "smalt" and \
+           seedGenome.this_iteration == 0:
+            map_cache_dir = os.path.abspath(
+                os.path.expanduser(args.map_cache_dir))
+            os.makedirs(map_cache_dir, exist_ok=True)
+            map_cache_key = get_mapping_cache_key(
                 ngsLib=unmapped_ngsLib,
-                cores=(args.cores * args.threads),
-                samtools_exe=sys_exes.samtools,
                 genome_fasta=seedGenome.next_reference_path,
-                smalt_exe=sys_exes.mapper,
+                method=args.method,
+                mapper_args=mapper.add_args,
                 score_minimum=score_minimum,
-                step=3, k=5,
-                scoring="match=1,subst=-4,gapopen=-4,gapext=-3",
+                cache_dir=map_cache_dir,
                 logger=logger)
+            cached_mapping = fetch_cached_mapping(
+                cache_dir=map_cache_dir, key=map_cache_key,
+                mapping_ob=seedGenome.iter_mapping_list[0],
+                regions=map_regions, logger=logger)
+        t_map = time.time()
+        if cached_mapping is not None:
+            map_percent, mapping_stats = cached_mapping
         else:
-            assert args.method == "bwa", "must be either bwa or smalt"
-            map_percent, score_list = map_to_genome_ref_bwa(
+            map_percent, mapping_stats = map_to_genome_ref(
                 mapping_ob=seedGenome.iter_mapping_list[
                     seedGenome.this_iteration],
                 ngsLib=unmapped_ngsLib,
                 cores=(args.cores * args.threads),
-                genome_fasta=seedGenome.next_reference_path,
                 samtools_exe=sys_exes.samtools,
-                bwa_exe=sys_exes.mapper,
+                mapper=mapper,
+                genome_fasta=seedGenome.next_reference_path,
                 score_minimum=score_minimum,
-                # add_args='-L 0,0 -U 0',
-                add_args=args.mapper_args,
+                regions=map_regions,
                 logger=logger)
+            if map_cache_key is not None:
+                store_cached_mapping(
+                    cache_dir=map_cache_dir, key=map_cache_key,
+                    mapping_ob=seedGenome.iter_mapping_list[0],
+                    logger=logger)
         mapping_percentages.append("Iteration %i: %f" % (
             seedGenome.this_iteration, map_percent))
+        catalog.record("mapping", iteration=seedGenome.this_iteration,
+                       label="cached" if cached_mapping is not None else
+                       mapper.name, elapsed=time.time() - t_map,
+                       map_percent=map_percent)
+        if seedGenome.this_iteration == 0:
+            # the first mapping has the most proper pairs to go by
+            spacer_len = get_spacer_length(
+                mapping_stats, readlen=seedGenome.master_ngs_ob.readlen)
+            logger.info("contigs in the pseudogenomes will be separated " +
+                        "by %i N's", spacer_len)
+        score_list = mapping_stats.score_list()
         # if things go really bad on the first mapping, get out while you can
         if len(score_list) == 0:
             logger.error(
@@ -2736,34 +4103,51 @@ if __name__ == "__main__":
         # on first time through, infer ref_as_contig if not
         #   provided via commandline
         if seedGenome.this_iteration == 0:
-            # do info for smalt mapping
-            if args.method == "bwa":
+            # smalt filters as it maps, so there is nothing to show
+            if mapper.filter_after_mapping:
                 fig_dir = os.path.join(output_root, "figs")
                 os.makedirs(fig_dir)
                 # either use defined min or use the smae heuristic as mapping
-                if PLOT:
-                    plotAsScores(
-                        score_list,
-                        score_min=score_minimum if score_minimum is not None else
-                        int(round(float(seedGenome.master_ngs_ob.readlen) / 2.0)),
-                        outdir=fig_dir, logger=logger)
+                figures.submit(
+                    "as_scores",
+                    summary=summarize_score_counts(mapping_stats.as_counts),
+                    score_min=score_minimum,
+                    basename=os.path.join(fig_dir, "AS_score_plot"))
                 printPlot(data=score_list, line=score_minimum, ymax=30, xmax=60,
                           tick=.2, fill=True,
                           title="Average alignment Scores (y) by sorted " +
                           "read index (x)",
                           logger=logger)
-
-                if args.ref_as_contig is None:
+                logger.info(
+                    "Filled area represents the reads retained after " +
+                    "filtering. If it looks like this filtering threshold " +
+                    "is inapporpriate, consider adjusting with --score_min")
+
+                if args.ref_as_contig is None and warm_started:
+                    # the first mapping was to the seed library, not the
+                    # reference, so its mapping percentage says nothing
+                    # about how close the reference is; the seeds were
+                    # matched to previously assembled long reads, so
+                    # trust them
+                    ref_as_contig = "trusted"
+                    logger.info(
+                        "warm started from --seed_library, so the " +
+                        "mapping percentage cant be used to choose " +
+                        "--ref_as_contig; 'ref_as_contigs' is set to %s",
+                        ref_as_contig)
+                elif args.ref_as_contig is None:
                     if map_percent > 80:
                         ref_as_contig = "trusted"
                     else:
                         ref_as_contig = "untrusted"
-                        logger.info(
-                            str("unfiltered mapping percentage is %f2 so " +
-                                "'ref_as_contigs' is set to %s"),
-                            map_percent, ref_as_contig)
+                    logger.info(
+                        str("unfiltered mapping percentage is %f2 so " +
+                            "'ref_as_contigs' is set to %s"),
+                        map_percent, ref_as_contig)
                 else:
                     ref_as_contig = args.ref_as_contig
+                    logger.info("'ref_as_contigs' is set to %s",
+                                ref_as_contig)
             else:
                 ref_as_contig = args.ref_as_contig
         else:
@@ -2789,14 +4173,22 @@ if __name__ == "__main__":
             sys.exit(1)
 
         logger.info(iter_depths)
-        region_depths.append(iter_depths)
+        cluster_registry.record_depths(seedGenome.this_iteration, iter_depths)
+        catalog.record_depths(seedGenome.this_iteration, iter_depths)
         extract_convert_assemble_cmds = []
+        timed_out = []
         # generate spades cmds (cannot be multiprocessed becuase of python's
         #  inability to pass objects to multiprocessing)
         # ref_as_contig must be 'trusted' here because of the multimapping/
         #  coverage issues
         for cluster in clusters_to_subassemble:
             cmdlist = []
+            if args.dedup:
+                ntemplates, nkept = dedup_bam_in_place(
+                    bam=cluster.mappings[-1].mapped_bam, logger=logger)
+                logger.info("cluster %i: removed %i of %i reads (or " +
+                            "pairs) as duplicates", cluster.index,
+                            ntemplates - nkept, ntemplates)
             logger.debug("generating commands to convert bam to fastqs " +
                          "and assemble long reads")
             convert_cmds, new_ngslib = convert_bam_to_fastqs_cmd(
@@ -2837,21 +4229,74 @@ if __name__ == "__main__":
                                stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE,
                                check=True)
+        elif args.queue_dir is not None:
+            results = run_cmd_lists_on_queue(
+                cmd_lists=extract_convert_assemble_cmds,
+                queue_dir=queue_dir,
+                job_prefix="{0}_iter_{1}".format(
+                    run_token, seedGenome.this_iteration),
+                cores=1, memory=int(args.memory / args.cores),
+                inputs=[[x.mappings[-1].mapped_bam] for
+                        x in clusters_to_subassemble],
+                outputs=[[os.path.join(x.mappings[-1].assembly_subdir,
+                                       "contigs.fasta")] for
+                         x in clusters_to_subassemble],
+                poll=args.queue_poll, oom_retries=args.oom_retries,
+                min_free=args.min_free_mem * 1e9,
+                straggler_factor=args.straggler_factor,
+                min_timeout=args.min_job_timeout, logger=logger)
+            logger.info("Sum of return codes (should be 0):")
+            logger.info(sum(results))
+            timed_out = [x.index for x, code in
+                         zip(clusters_to_subassemble, results) if code == 4]
+            for cluster, code in zip(clusters_to_subassemble, results):
+                catalog.record("subassembly",
+                               iteration=seedGenome.this_iteration,
+                               cluster=cluster.index, returncode=code)
         else:
             pool = multiprocessing.Pool(processes=args.cores)
+            manager = multiprocessing.Manager()
+            job_status = manager.dict()
+            job_keys = [x.index for x in clusters_to_subassemble]
             results = [
-                pool.apply_async(subprocess_run_list,
+                pool.apply_async(subprocess_run_list_watched,
                                  (cmds,),
-                                 {"logger": None,
-                                  "hard": False})
-                for cmds in extract_convert_assemble_cmds]
+                                 {"oom_retries": args.oom_retries,
+                                  "min_free": args.min_free_mem * 1e9,
+                                  "job_status": job_status,
+                                  "job_key": key})
+                for key, cmds in zip(job_keys, extract_convert_assemble_cmds)]
             pool.close()
+            results = wait_for_pool_results(
+                async_results=results, job_keys=job_keys,
+                job_status=job_status,
+                straggler_factor=args.straggler_factor,
+                min_timeout=args.min_job_timeout, logger=logger)
             pool.join()
+            manager.shutdown()
+            timed_out = [key for key, res in zip(job_keys, results) if
+                         res["returncode"] == 4]
+            log_watched_results(
+                results=results,
+                job_names=["cluster_%i" % x.index for
+                           x in clusters_to_subassemble],
+                stage="iteration_%i" % seedGenome.this_iteration,
+                report=resource_report, logger=logger)
+            catalog.record_watched("subassembly", results,
+                                   iteration=seedGenome.this_iteration,
+                                   clusters=job_keys)
             logger.info("Sum of return codes (should be 0):")
-            logger.info(sum([r.get() for r in results]))
+            logger.info(sum([r["returncode"] for r in results]))
 
         # evaluate mapping (cant be multiprocessed)
         for cluster in clusters_to_process:
+            if cluster.index in timed_out:
+                cluster.assembly_success = 4
+                parse_subassembly_return_code(
+                    cluster=cluster,
+                    final_contigs_dir=seedGenome.final_long_reads_dir,
+                    logger=logger)
+                continue
             cluster.assembly_success = evaluate_spades_success(
                 clu=cluster,
                 read_len=seedGenome.master_ngs_ob.readlen,
@@ -2868,15 +4313,55 @@ if __name__ == "__main__":
                 cluster=cluster,
                 final_contigs_dir=seedGenome.final_long_reads_dir,
                 logger=logger)
-        clusters_for_pseudogenome = [
-            x for x in seedGenome.loci_clusters if
-            x.continue_iterating and x.keep_contigs]
+        for cluster in clusters_to_process:
+            record_evaluation(catalog, cluster)
+        if args.async_clusters:
+            # the rest of the iterations happen per-cluster, and the
+            # pseudogenome is only put together at the end
+            unmapped_fastq = write_unmapped_reads(
+                mapping_ob=seedGenome.iter_mapping_list[0],
+                ngsLib=seedGenome.master_ngs_ob,
+                samtools_exe=sys_exes.samtools, logger=logger)
+            if unmapped_fastq is None:
+                logger.warning(
+                    "the reads that mapped nowhere in iteration 0 are not " +
+                    "available (the mapping came from --map_cache_dir), " +
+                    "so each cluster will map all the reads")
+            async_depths = iterate_clusters_async(
+                clusters=[x for x in clusters_to_process if
+                          x.continue_iterating and x.keep_contigs],
+                seedGenome=seedGenome, exes=sys_exes,
+                iterations=args.iterations, cores=args.cores,
+                memory=args.memory, mapper=mapper,
+                score_min=score_minimum,
+                flank=args.flanking, min_flank_depth=args.min_flank_depth,
+                kmers=checked_prek,
+                eval_kwargs={
+                    "read_len": seedGenome.master_ngs_ob.readlen,
+                    "include_short_contigs": args.include_short_contigs,
+                    "keep_best_contig": True,
+                    "min_delta": 10,
+                    "flank": args.flanking,
+                    "seqname": '',
+                    "min_assembly_len": args.min_assembly_len,
+                    "proceed_to_target": proceed_to_target,
+                    "target_len": args.target_len},
+                oom_retries=args.oom_retries,
+                min_free=args.min_free_mem * 1e9, dedup=args.dedup,
+                unmapped_fastq=unmapped_fastq, catalog=catalog,
+                logger=logger)
+            for iteration, depths in enumerate(async_depths, start=1):
+                cluster_registry.record_depths(iteration, depths)
+                catalog.record_depths(iteration, depths)
+            seedGenome.this_iteration = args.iterations - 1
+        clusters_for_pseudogenome = cluster_registry.select(
+            cluster_registry.active())
         if len(clusters_for_pseudogenome) != 0:
             faux_genome_path, faux_genome_len = make_faux_genome(
                 seedGenome=seedGenome,
                 iteration=seedGenome.this_iteration,
                 output_root=seedGenome.output_root,
-                nbuff=5000,
+                nbuff=spacer_len,
                 cluster_list=[x for x in clusters_for_pseudogenome if
                               x.continue_iterating],
                 logger=logger)
@@ -2887,6 +4372,14 @@ if __name__ == "__main__":
             seedGenome.this_iteration = args.iterations + 1
         seedGenome.this_iteration = seedGenome.this_iteration + 1
         seedGenome.next_reference_path = faux_genome_path
+        catalog.flush()
+        # the iteration before the one just finished is no longer needed
+        if args.archive_intermediates and not args.async_clusters and \
+           seedGenome.this_iteration >= 2:
+            done_with = [seedGenome.this_iteration - 2]
+            archive_cluster_intermediates(
+                seedGenome=seedGenome, iterations=done_with, logger=logger)
+            archived_iterations.extend(done_with)
         if seedGenome.this_iteration >= args.iterations:
             logger.info("moving on to final assemblies!")
         else:
@@ -2922,6 +4415,12 @@ if __name__ == "__main__":
             except Exception as e:
                 logger.error(last_exception())
                 sys.exit(1)
+    if args.archive_intermediates:
+        archive_cluster_intermediates(
+            seedGenome=seedGenome,
+            iterations=[x for x in range(0, args.iterations) if
+                        x not in archived_iterations],
+            logger=logger)
     for dirpath, dirnames, files in os.walk(seedGenome.final_long_reads_dir):
         if not files:
             logger.error(
@@ -2929,6 +4428,7 @@ if __name__ == "__main__":
                 "directory; it appears " +
                 "that the subassemblies did not yield pseudocontigs " +
                 "of sufficient quality.  Exiting with code 0")
+            catalog.finish_run(status="no_long_reads")
             sys.exit(0)
     logger.info("combining contigs from %s", seedGenome.final_long_reads_dir)
     seedGenome.assembled_seeds = combine_contigs(
@@ -2937,6 +4437,7 @@ if __name__ == "__main__":
         logger=logger)
     logger.info("Combined Seed Contigs: %s", seedGenome.assembled_seeds)
     logger.info("Time taken to run seeding: %.2fm" % ((time.time() - t0) / 60))
+    catalog.record("seeding", elapsed=time.time() - t0)
     # Diagnostics
     # logger.info("Mapping percentages per iteration: \n" +
     #             "(Iteration 0, which maps to entire reference, should " +
@@ -2944,7 +4445,7 @@ if __name__ == "__main__":
     #             "previously unmapped reads which now map to the seeded " +
     #             "flanking regions, which may be very low)\n" +
     #             "\n".join(mapping_percentages))
-    report = reportRegionDepths(inp=region_depths, logger=logger)
+    report = reportRegionDepths(registry=cluster_registry, logger=logger)
     logger.info("Average depths of mapping for each cluster, by iteration:")
     logger.info("\n" + "\n".join(report))
 
@@ -2955,7 +4456,12 @@ if __name__ == "__main__":
         memory=args.memory,
         serialize=args.serialize,
         ref_as_contig=ref_as_contig,
-        skip_control=args.skip_control, kmers=checked_k, logger=logger)
+        skip_control=args.skip_control, kmers=checked_k,
+        run_quast=args.run_quast, logger=logger)
+    # QUAST is run in the background once the assemblies are done, so
+    # only the SPAdes cmds are run here
+    quast_cmds = [x[1] for x in spades_quast_cmds if len(x) > 1]
+    spades_quast_cmds = [x[0:1] for x in spades_quast_cmds]
 
     if args.serialize:
         logger.info("running without multiprocessing!")
@@ -2967,6 +4473,16 @@ if __name__ == "__main__":
                            stdout=subprocess.PIPE,
                            stderr=subprocess.PIPE,
                            check=True)
+    elif args.queue_dir is not None:
+        results = run_cmd_lists_on_queue(
+            cmd_lists=spades_quast_cmds,
+            queue_dir=queue_dir,
+            job_prefix="{0}_final".format(run_token),
+            cores=args.cores, memory=args.memory,
+            poll=args.queue_poll, oom_retries=args.oom_retries,
+            min_free=args.min_free_mem * 1e9, logger=logger)
+        logger.info("Sum of return codes (should be 0):")
+        logger.info(sum(results))
     else:
         # split the processors based on how many spades_cmds are on the list
         # dont correct for threads, as Spades defaults to lots of threads
@@ -2977,19 +4493,64 @@ if __name__ == "__main__":
         logger.debug("running the following commands:")
         logger.debug("\n".join([j for i in spades_quast_cmds for j in i]))
         results = [
-            pool.apply_async(subprocess_run_list,
+            pool.apply_async(subprocess_run_list_watched,
                              (cmds,),
-                             {"logger": None,
-                              "hard": False})
+                             {"oom_retries": args.oom_retries,
+                              "min_free": args.min_free_mem * 1e9})
             for cmds in spades_quast_cmds]
         pool.close()
         pool.join()
+        results = [r.get() for r in results]
+        log_watched_results(
+            results=results,
+            job_names=["de_fere_novo", "de_novo"][0: len(results)],
+            stage="final", report=resource_report, logger=logger)
+        catalog.record_watched(
+            "final", results,
+            labels=["de_fere_novo", "de_novo"][0: len(results)])
         logger.info("Sum of return codes (should be 0):")
-        logger.info(sum([r.get() for r in results]))
-
-    if not args.skip_control:
-        logger.debug("writing combined quast reports")
+        logger.info(sum([r["returncode"] for r in results]))
+    if len(resource_report) != 0:
+        write_resource_report(
+            resource_report,
+            os.path.join(output_root, "resource_report.tsv"))
+
+    quast_procs = []
+    for cmd in quast_cmds:
+        logger.debug("starting in the background: %s", cmd)
+        quast_procs.append(subprocess.Popen(
+            cmd, shell=sys.platform != "win32",
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    final_names = ["de_fere_novo", "de_novo"][0: len(spades_quast_cmds)]
+    final_contigs = [os.path.join(output_root, "final_{0}_assembly".format(x),
+                                  "contigs.fasta") for x in final_names]
+    if all([os.path.exists(x) for x in final_contigs]):
         logger.info("Comparing de novo and de fere novo assemblies:")
+        try:
+            final_stats = [assembly_stats(x) for x in final_contigs]
+            for line in write_stats_report(
+                    final_stats, names=final_names,
+                    outfile=os.path.join(output_root, "assembly_stats.tsv")):
+                logger.info(line)
+            for name, stats in zip(final_names, final_stats):
+                catalog.record_assembly_stats(name, stats)
+        except Exception as e:
+            logger.error("Error writing out assembly statistics")
+            logger.error(e)
+    else:
+        logger.warning("final assemblies not found; no statistics to report")
+    # make dir for easy downloading from cluster
+    copyToHandyDir(outdir=os.path.join(output_root, "mauve"),
+                   pre=args.exp_name,
+                   seedGenome=seedGenome,
+                   hard=False, logger=logger)
+    if len(quast_procs) != 0:
+        logger.info("waiting for QUAST to finish")
+        quast_codes = [p.wait() for p in quast_procs]
+        if sum(quast_codes) != 0:
+            logger.warning("QUAST return codes: %s", quast_codes)
+    if len(quast_procs) > 1:
+        logger.debug("writing combined quast reports")
         try:
             quast_comp = make_quick_quast_table(
                 quast_reports,
@@ -2997,15 +4558,16 @@ if __name__ == "__main__":
                 writedir=seedGenome.output_root,
                 logger=logger)
             for k, v in sorted(quast_comp.items()):
-                logger.info("%s: %s", k, "  ".join(v))
+                logger.debug("%s: %s", k, "  ".join(v))
+            for idx, name in enumerate(final_names):
+                catalog.record_assembly_stats(
+                    "quast_" + name,
+                    [(k, v[idx]) for k, v in sorted(quast_comp.items())])
         except Exception as e:
             logger.error("Error writing out combined quast report")
             logger.error(e)
-    # make dir for easy downloading from cluster
-    copyToHandyDir(outdir=os.path.join(output_root, "mauve"),
-                   pre=args.exp_name,
-                   seedGenome=seedGenome,
-                   hard=False, logger=logger)
+    figures.close(timeout=300)
+    catalog.finish_run()
     # Report that we've finished
     logger.info("Done: %s", time.asctime())
     logger.info("riboSeed Assembly: %s", seedGenome.output_root)
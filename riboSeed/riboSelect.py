@@ -21,9 +21,12 @@ import argparse
 import sys
 import time
 import jenkspy
-from Bio import SeqIO
 
-from pyutilsnrw.utils3_5 import set_up_logging, multisplit
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+from pyutilsnrw.utils3_5 import set_up_logging
+
+from riboGenbank import open_genbank_cache, default_cache_dir
 
 
 def get_args():  # pragma: no cover
@@ -84,7 +87,8 @@ def get_args():  # pragma: no cover
 
 
 def count_feature_hits(all_feature, gb_path,
-                       specific_features, locus_tag_dict, logger=None):
+                       specific_features, locus_tag_dict, gb_records=None,
+                       logger=None):
     """ given genome seq records, specific_features, and a
     locus_tag_dict from get_filtered_locus_tag_dict, return two structures:
     - nfeatures_occur {record.id, [[16s, 5],[23s, 4],[5s,6]]}
@@ -97,28 +101,29 @@ def count_feature_hits(all_feature, gb_path,
     if not all_feature:
         nfeatures_occur = {}  # makes  {genome : [['18S', 5],['28S',3]]}
         nfeat_simple = {}  # makes  {genome : [5, 3]}
-        with open(gb_path, "r") as genome_seq_records:
-            for record in SeqIO.parse(genome_seq_records, "genbank"):
-                logger.debug("counting hits in %s", record.id)
-                hit_list = []  # [specific feature, count] list
-                hit_list_simple = []  # [count] list
-                subset = {k: v for k, v in locus_tag_dict.items()
-                          if record.id in v}
-                if len(subset) == 0:
-                    continue
-                logger.debug(subset)
-                for i in specific_features:
-                    hits = 0
-                    for k, v in subset.items():
-                        # hint: v[-1] should be the product annotation
-                        if any([i == x for x in v[-1]]):
-                            hits = hits + 1
-                        else:
-                            pass
-                    hit_list.append([i, hits])
-                    hit_list_simple.append(hits)
-                nfeatures_occur[record.id] = (hit_list)
-                nfeat_simple[record.id] = hit_list_simple
+        if gb_records is None:
+            gb_records = open_genbank_cache(gb_path, logger=logger)
+        for record_id in gb_records.ids:
+            logger.debug("counting hits in %s", record_id)
+            hit_list = []  # [specific feature, count] list
+            hit_list_simple = []  # [count] list
+            subset = {k: v for k, v in locus_tag_dict.items()
+                      if record_id in v}
+            if len(subset) == 0:
+                continue
+            logger.debug(subset)
+            for i in specific_features:
+                hits = 0
+                for k, v in subset.items():
+                    # hint: v[-1] should be the product annotation
+                    if any([i == x for x in v[-1]]):
+                        hits = hits + 1
+                    else:
+                        pass
+                hit_list.append([i, hits])
+                hit_list_simple.append(hits)
+            nfeatures_occur[record_id] = (hit_list)
+            nfeat_simple[record_id] = hit_list_simple
     else:
         nfeatures_occur, nfeat_simple = None, None
     return(nfeatures_occur, nfeat_simple)
@@ -126,7 +131,7 @@ def count_feature_hits(all_feature, gb_path,
 
 def get_filtered_locus_tag_dict(gb_path, nrecs, feature="rRNA",
                                 specific_features="16S:23S",
-                                verbose=True, logger=None):
+                                verbose=True, gb_records=None, logger=None):
     """ Given a LIST (as of 20160927) of genbank records,
     returns dictionary of index:locus_tag id pairs for all
     "feature"  entries.  This then gets clustered.
@@ -150,58 +155,52 @@ def get_filtered_locus_tag_dict(gb_path, nrecs, feature="rRNA",
     preunique_feats = []
 
     # loop through records
-    with open(gb_path, "r") as genome_seq_records:
-        # genome_records = list(SeqIO.parse(fh, 'genbank'))
-        for record in SeqIO.parse(genome_seq_records, "genbank"):
-            loc_number = 0  # counter that for index of hits; this is clustered
-            logger.debug("scanning %s", record.id)
-            for feat in record.features:
-                if feat.type in feature:
-                    try:
-                        locustag = feat.qualifiers.get("locus_tag")[0]
-                    except TypeError:
-                        if verbose:
-                            logger.debug("no locus tag for this feature!")
-                        continue
-                    product_list = multisplit(
-                        [",", " ", "-", "_"],
-                        feat.qualifiers.get("product")[0])
-                    coords = [feat.location.start.position + 1,
-                              feat.location.end.position]
-                    if verbose:
-                        logger.debug(product_list)
-                        logger.debug(coords)
-                    # if either specific feature is found in product or
-                    # only interested in all features, add locus to dict
-                    if (specific_features is None or
-                        (specific_features is not None and
-                         any([x in specific_features for x in product_list]))):
-                        # key is start coord
-                        preunique_feats.extend([x for x in specific_features if
-                                                x in product_list])
-                        locus_tag_dict[(record.id, coords[0])] = [loc_number,
-                                                                  record.id,
-                                                                  locustag,
-                                                                  feat.type,
-                                                                  product_list]
-                    else:
-                        if verbose:
-                            logger.debug("Not adding this feat to " +
-                                         "list: %s", product_list)
-                        pass
-
-                    loc_number = loc_number + 1  # increment idx after feature
-                else:
-                    if verbose:
-                        logger.debug("skipping: %s", feat.type)
-                    loc_number = loc_number + 1  # increment idx after feature
-            # this is a soft warning, as we want to be able to loop
-            # through all records before worrying
-            if len(locus_tag_dict) < 1 and logger:
-                logger.info(str("no locus tags found in {0} for {1} " +
-                                "features with annotated products matching" +
-                                "{2}!\n").format(record.id,
-                                                 feature, specific_features))
+    if gb_records is None:
+        gb_records = open_genbank_cache(gb_path, logger=logger)
+    for record_id in gb_records.ids:
+        logger.debug("scanning %s", record_id)
+        index = gb_records.feature_index(record_id)
+        # loc_number (which is clustered) counts every feature in the
+        # record, save those of this type without locus tags
+        skipped = 0
+        for feat in index.of_type(feature):
+            locustag = feat.locus_tag
+            if locustag is None:
+                if verbose:
+                    logger.debug("no locus tag for this feature!")
+                skipped = skipped + 1
+                continue
+            loc_number = feat.index - skipped
+            product_list = index.tokens(feat)
+            coords = [feat.start + 1, feat.end]
+            if verbose:
+                logger.debug(product_list)
+                logger.debug(coords)
+            # if either specific feature is found in product or
+            # only interested in all features, add locus to dict
+            if (specific_features is None or
+                (specific_features is not None and
+                 any([x in specific_features for x in product_list]))):
+                # key is start coord
+                preunique_feats.extend([x for x in specific_features if
+                                        x in product_list])
+                locus_tag_dict[(record_id, coords[0])] = [loc_number,
+                                                          record_id,
+                                                          locustag,
+                                                          feat.type,
+                                                          product_list]
+            else:
+                if verbose:
+                    logger.debug("Not adding this feat to " +
+                                 "list: %s", product_list)
+                pass
+        # this is a soft warning, as we want to be able to loop
+        # through all records before worrying
+        if len(locus_tag_dict) < 1 and logger:
+            logger.info(str("no locus tags found in {0} for {1} " +
+                            "features with annotated products matching" +
+                            "{2}!\n").format(record_id,
+                                             feature, specific_features))
     # locus_tag_dict = locus_tag_dict
     if verbose and logger:
         for key in sorted(locus_tag_dict):
@@ -214,6 +213,7 @@ def get_filtered_locus_tag_dict(gb_path, nrecs, feature="rRNA",
             gb_path=gb_path,
             specific_features=set(preunique_feats),
             locus_tag_dict=locus_tag_dict,
+            gb_records=gb_records,
             logger=logger)
     return(locus_tag_dict, nfeatures_occur, nfeat_simple)
 
@@ -302,10 +302,12 @@ if __name__ == "__main__":
                      "be a fasta ")
         sys.exit(1)
 
-    # get genome records into a generator to count them
-    genome_records = SeqIO.parse(args.genbank_genome, 'genbank')
+    # parsed once into the GenBank cache; see riboGenbank
     logger.info("Getting number of genbank entries")
-    nrecs = sum(1 for x in genome_records)
+    gb_records = open_genbank_cache(
+        args.genbank_genome, cache_dir=default_cache_dir(output_root),
+        logger=logger)
+    nrecs = gb_records.count
     logger.info("Input has %i records", nrecs)
 
     # get list of loci matching feature and optionally specific features
@@ -322,6 +324,7 @@ if __name__ == "__main__":
                                     specific_features=args.specific_features,
                                     verbose=args.debug,
                                     nrecs=nrecs,
+                                    gb_records=gb_records,
                                     logger=logger)
 
     # default case, clusters are inferred
@@ -343,93 +346,92 @@ if __name__ == "__main__":
     for k, v in lociDict.items():
         logger.debug(str(k) + "\t" + str(v))
     outlines = []
-    with open(args.genbank_genome, "r") as gb:
-        for i, rec in enumerate(SeqIO.parse(args.genbank_genome, 'genbank')):
-            logger.info("Processing {0}\n".format(rec.id))
-            # if user gives clusters, make sure it matches the length:
-            if args.clusters:
-                logger.info("using %s clusters for %s\n",
-                            centers_per_seq[i], rec.id)
-            # get subset of lociDict for that id
-            subset = {key: value for key, value in lociDict.items() if
-                      rec.id == value[1]}
-            # skip if that doesnt have any hits
-            if len(subset) == 0:
-                logger.info("no hits in {0}\n".format(rec.id))
-                continue
-            logger.debug("Subset loci:")
-            for k, v in subset.items():
-                logger.debug(str(k) + "\t" + str(v))
-            logger.info("hits in {0}\n".format(rec.id))
-
-            #  find nfeat for this genbank id by subsetting;
-            # is this a bad way of doesnt things?
-
-            # logger.debug("centers: {0}".format(centers_per_seq))
-            # logger.debug("nfeat_simple: {0}".format(nfeat_simple[i]))
-
-            if nfeat_simple is None and centers_per_seq[i] == 0:
-                logger.error("No specific features submitted, cannot calculate " +
-                             " number centers needed for clustering.  Please" +
-                             "submit the desired number of clusters with the  " +
-                             "--clusters argument!\n")
-                sys.exit(1)
-            logger.debug("nfeat_simple")
-            # for k, v in nfeat_simple.items():
-            #     print(k)
-            #     print(v)
-            rec_nfeat = list({k: v for k, v in nfeat_simple.items() if
-                              rec.id in k}.values())[0]
-            logger.debug("rec_nfeat: {0}".format(rec_nfeat))
-            if all([x == 0 for x in rec_nfeat]):
-                logger.error("unable to count features!")
-                sys.exit(1)
-            indexes = [x[1] for x in list(subset)]  # get index back from tuple key
-            ## if centers[i] is 0, try max and min sequentially; if that fails skip
-            if centers_per_seq[i] == 0:
-                # if only looking at two features, take the max
-                # if the smallest value is not greater than 1, take the max
-                # This is a shakey heuistic
-                if min(rec_nfeat) <= 1 or len(rec_nfeat) <= 2:
-                    current_centers = max(rec_nfeat)
-                else:
-                    current_centers = min(rec_nfeat)
-                if current_centers == 0:
-                    logger.info("skipping the clustering for {0}\n".format(i))
-                    continue
-                logger.debug("grouping indexes with jenks natural breaks " +
-                             "assuming %d classes", current_centers)
-                logger.debug(indexes)
-                indexClusters = dict_from_jenks(
-                    data=indexes, centers=current_centers, logger=logger)
+    for i, record_id in enumerate(gb_records.ids):
+        logger.info("Processing {0}\n".format(record_id))
+        # if user gives clusters, make sure it matches the length:
+        if args.clusters:
+            logger.info("using %s clusters for %s\n",
+                        centers_per_seq[i], record_id)
+        # get subset of lociDict for that id
+        subset = {key: value for key, value in lociDict.items() if
+                  record_id == value[1]}
+        # skip if that doesnt have any hits
+        if len(subset) == 0:
+            logger.info("no hits in {0}\n".format(record_id))
+            continue
+        logger.debug("Subset loci:")
+        for k, v in subset.items():
+            logger.debug(str(k) + "\t" + str(v))
+        logger.info("hits in {0}\n".format(record_id))
+
+        #  find nfeat for this genbank id by subsetting;
+        # is this a bad way of doesnt things?
+
+        # logger.debug("centers: {0}".format(centers_per_seq))
+        # logger.debug("nfeat_simple: {0}".format(nfeat_simple[i]))
+
+        if nfeat_simple is None and centers_per_seq[i] == 0:
+            logger.error("No specific features submitted, cannot calculate " +
+                         " number centers needed for clustering.  Please" +
+                         "submit the desired number of clusters with the  " +
+                         "--clusters argument!\n")
+            sys.exit(1)
+        logger.debug("nfeat_simple")
+        # for k, v in nfeat_simple.items():
+        #     print(k)
+        #     print(v)
+        rec_nfeat = list({k: v for k, v in nfeat_simple.items() if
+                          record_id in k}.values())[0]
+        logger.debug("rec_nfeat: {0}".format(rec_nfeat))
+        if all([x == 0 for x in rec_nfeat]):
+            logger.error("unable to count features!")
+            sys.exit(1)
+        indexes = [x[1] for x in list(subset)]  # get index back from tuple key
+        ## if centers[i] is 0, try max and min sequentially; if that fails skip
+        if centers_per_seq[i] == 0:
+            # if only looking at two features, take the max
+            # if the smallest value is not greater than 1, take the max
+            # This is a shakey heuistic
+            if min(rec_nfeat) <= 1 or len(rec_nfeat) <= 2:
+                current_centers = max(rec_nfeat)
             else:
-                ## if centers[i] is not 0, use it
-                current_centers = centers_per_seq[i]
-            # Perform actual clustering
-            try:
-                # indexClusters should be like { "1": [3,4,6], "2": [66,45,63]}
-                logger.debug("grouping indexes with jenks natural breaks " +
-                             "assuming %d classes", current_centers)
-                logger.debug(indexes)
-                indexClusters = dict_from_jenks(
-                    data=indexes, centers=current_centers, logger=logger)
-            except Exception as e:
-                logger.error(e)
-                sys.exit(1)
-            logger.debug("indexClusters:")
-            logger.debug(indexClusters)
-            # add output lines to list
-
-            outlines.append("# Generated cluters for {0} on {1}\n".format(
-                rec.id, date))
-            outlines.append("#$ FEATURE {0}\n".format(args.feature))
-
-            for k, v in indexClusters.items():
-                outlines.append(
-                    "{0} {1}\n".format(
-                        rec.id,
-                        ":".join([subset[(rec.id, int(x))][2] for x in v]))
-                )
+                current_centers = min(rec_nfeat)
+            if current_centers == 0:
+                logger.info("skipping the clustering for {0}\n".format(i))
+                continue
+            logger.debug("grouping indexes with jenks natural breaks " +
+                         "assuming %d classes", current_centers)
+            logger.debug(indexes)
+            indexClusters = dict_from_jenks(
+                data=indexes, centers=current_centers, logger=logger)
+        else:
+            ## if centers[i] is not 0, use it
+            current_centers = centers_per_seq[i]
+        # Perform actual clustering
+        try:
+            # indexClusters should be like { "1": [3,4,6], "2": [66,45,63]}
+            logger.debug("grouping indexes with jenks natural breaks " +
+                         "assuming %d classes", current_centers)
+            logger.debug(indexes)
+            indexClusters = dict_from_jenks(
+                data=indexes, centers=current_centers, logger=logger)
+        except Exception as e:
+            logger.error(e)
+            sys.exit(1)
+        logger.debug("indexClusters:")
+        logger.debug(indexClusters)
+        # add output lines to list
+
+        outlines.append("# Generated cluters for {0} on {1}\n".format(
+            record_id, date))
+        outlines.append("#$ FEATURE {0}\n".format(args.feature))
+
+        for k, v in indexClusters.items():
+            outlines.append(
+                "{0} {1}\n".format(
+                    record_id,
+                    ":".join([subset[(record_id, int(x))][2] for x in v]))
+            )
 
     with open(output_path, "a") as outfile:
         for i in outlines:
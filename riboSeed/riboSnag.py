@@ -25,19 +25,12 @@ import itertools
 import multiprocessing
 
 
-try:
-    import numpy as np
-    import matplotlib as mpl
-    mpl.use('Agg')
-    import matplotlib.pyplot as plt
-    import matplotlib.patches as patches
-    PLOT = True
-except Exception as e:  # most likely an ImportError, but Im not taking chances
-    print(e)
-    print("\nlooks like you have some issue with matplotlib.  " +
-          "Classic matplotlib, amirite? Plotting is disabled\n")
-    PLOT = False
-import pandas as pd
+import importlib.util
+
+import numpy as np
+# matplotlib and pandas are imported by the plotting functions themselves,
+# so that riboSeed.py can use this module without loading them
+PLOT = importlib.util.find_spec("matplotlib") is not None
 
 from Bio import SeqIO
 from Bio.SeqRecord import SeqRecord
@@ -53,12 +46,57 @@ sys.path.append(os.path.join('..', 'riboSeed'))
 from pyutilsnrw.utils3_5 import set_up_logging, check_installed_tools,\
     combine_contigs, check_version_from_cmd
 
+from riboToolchain import open_toolchain_manifest, cached_check
+from riboGenbank import open_genbank_cache, default_cache_dir, \
+    FeatureIndex, seq_record_features, GenomeView
+
+
+class RegistryColumn(object):
+    """ an attribute of a LociCluster or Locus that is kept in the array
+    of the same name in its ClusterRegistry once it has been registered,
+    and on the object until then.  None is stored as the fill value.
+    """
+    def __init__(self, name, fill=None):
+        self.name = name
+        self.slot = "_" + name
+        self.fill = fill
+
+    def __get__(self, ob, owner):
+        if ob is None:
+            return self
+        if ob._registry is None:
+            return getattr(ob, self.slot)
+        value = getattr(ob._registry, self.name)[ob._row].item()
+        if self.fill is not None and value == self.fill:
+            return None
+        return value
+
+    def __set__(self, ob, value):
+        if ob._registry is None:
+            setattr(ob, self.slot, value)
+        else:
+            getattr(ob._registry, self.name)[ob._row] = \
+                self.fill if value is None else value
+
 
 class LociCluster(object):
     """ organizes the clustering process instead of dealing with nested lists
     This holds the whole cluster of one to several individual loci
     """
     newid = itertools.count()
+    # coordinates and flags; see ClusterRegistry
+    global_start_coord = RegistryColumn("global_start_coord", fill=-1)
+    global_end_coord = RegistryColumn("global_end_coord", fill=-1)
+    keep_contigs = RegistryColumn("keep_contigs")
+    continue_iterating = RegistryColumn("continue_iterating")
+    coverage_exclusion = RegistryColumn("coverage_exclusion", fill=False)
+    __slots__ = ["index", "sequence_id", "loci_list", "padding",
+                 "feat_of_interest", "circular", "cluster_dir_name",
+                 "output_root", "mappings", "seq_record",
+                 "extractedSeqRecord", "final_contig_path", "master_ngs_ob",
+                 "assembly_success", "_global_start_coord",
+                 "_global_end_coord", "_keep_contigs", "_continue_iterating",
+                 "_coverage_exclusion", "_registry", "_row"]
 
     def __init__(self, sequence_id, loci_list, padding=None,
                  global_start_coord=None, global_end_coord=None,
@@ -67,6 +105,9 @@ class LociCluster(object):
                  coverage_exclusion=None,
                  circular=False, output_root=None, final_contigs_path=None,
                  continue_iterating=True, keep_contigs=True):
+        # ClusterRegistry holding the columns, and this cluster's row in it
+        self._registry = None
+        self._row = None
         # int: unique identifier for cluster
         self.index = next(LociCluster.newid)
         # self.index = index
@@ -98,6 +139,9 @@ class LociCluster(object):
         self.continue_iterating = continue_iterating  # by default, keep going
         self.coverage_exclusion = coverage_exclusion
         self.final_contig_path = final_contigs_path
+        # set by riboSeed: the reads, and the last subassembly's return code
+        self.master_ngs_ob = None
+        self.assembly_success = None
         self.name_mapping_dir()
 
     def name_mapping_dir(self):
@@ -108,9 +152,18 @@ class LociCluster(object):
 class Locus(object):
     """ this holds the info for each individual Locus"
     """
+    start_coord = RegistryColumn("start_coord", fill=-1)
+    end_coord = RegistryColumn("end_coord", fill=-1)
+    strand = RegistryColumn("strand", fill=0)
+    __slots__ = ["index", "sequence_id", "locus_tag", "product",
+                 "_start_coord", "_end_coord", "_strand", "_registry",
+                 "_row"]
+
     def __init__(self, index, sequence_id, locus_tag, strand=None,
                  start_coord=None, end_coord=None, rel_start_coord=None,
                  rel_end_coord=None, product=None):
+        self._registry = None
+        self._row = None
         # int: unique identifier for cluster
         self.index = index
         # str: sequence name, usually looks like 'NC_17777373.1' or similar
@@ -126,6 +179,82 @@ class Locus(object):
         self.product = product
 
 
+def describe(ob):
+    """ the attributes of a LociCluster or Locus as a dict, for logging
+    """
+    return {x.lstrip("_"): getattr(ob, x.lstrip("_")) for x in ob.__slots__
+            if x not in ["_registry", "_row"]}
+
+
+class ClusterRegistry(object):
+    """ column-wise store for the coordinates, strands and flags of a run's
+    clusters and loci, and their flanking depths each iteration, so runs
+    with thousands of loci can be filtered and reported on with array
+    operations rather than scans over the objects.  Once registered, the
+    clusters and loci read and write these attributes through the arrays.
+    """
+    CLUSTER_COLUMNS = [("global_start_coord", np.int64),
+                       ("global_end_coord", np.int64),
+                       ("keep_contigs", bool),
+                       ("continue_iterating", bool),
+                       ("coverage_exclusion", bool)]
+    LOCUS_COLUMNS = [("start_coord", np.int64),
+                     ("end_coord", np.int64),
+                     ("strand", np.int8)]
+
+    def __init__(self, clusters):
+        self.clusters = list(clusters)
+        self.loci = [x for clu in self.clusters for x in clu.loci_list]
+        # int: cluster index of each cluster, and row of each locus' cluster
+        self.index = np.array([x.index for x in self.clusters],
+                              dtype=np.int64)
+        self.locus_cluster = np.repeat(
+            np.arange(len(self.clusters)),
+            [len(x.loci_list) for x in self.clusters])
+        # dicts: cluster index to row, locus tag to Locus
+        self.rows = {x.index: row for row, x in enumerate(self.clusters)}
+        self.loci_by_tag = {x.locus_tag: x for x in self.loci}
+        # float: (cluster, iteration, 5' or 3') flanking depths
+        self.depths = np.full((len(self.clusters), 0, 2), np.nan)
+        for cls, obs, columns in [
+                (LociCluster, self.clusters, self.CLUSTER_COLUMNS),
+                (Locus, self.loci, self.LOCUS_COLUMNS)]:
+            for name, dtype in columns:
+                column = getattr(cls, name)
+                setattr(self, name, np.array(
+                    [column.fill if getattr(x, name) is None else
+                     getattr(x, name) for x in obs], dtype=dtype))
+            for row, ob in enumerate(obs):
+                ob._registry, ob._row = self, row
+
+    def cluster(self, index):
+        """ the LociCluster with this index
+        """
+        return self.clusters[self.rows[index]]
+
+    def active(self):
+        """ mask of the clusters still being iterated on and kept
+        """
+        return self.keep_contigs & self.continue_iterating
+
+    def select(self, mask):
+        """ the clusters for a boolean mask over the rows
+        """
+        return [self.clusters[x] for x in np.flatnonzero(mask)]
+
+    def record_depths(self, iteration, depths):
+        """ store (cluster index, 5' depth, 3' depth) tuples for an iteration
+        """
+        if self.depths.shape[1] <= iteration:
+            self.depths = np.concatenate(
+                [self.depths, np.full((len(self.clusters),
+                                       iteration + 1 - self.depths.shape[1],
+                                       2), np.nan)], axis=1)
+        for index, start_depth, end_depth in depths:
+            self.depths[self.rows[index], iteration] = \
+                [start_depth, end_depth]
+
+
 def get_args():  # pragma: no cover
     """get the arguments as a main parser with subparsers
     for named required arguments and optional arguments
@@ -180,6 +309,13 @@ def get_args():  # pragma: no cover
                           help="1 = debug(), 2 = info(), 3 = warning(), " +
                           "4 = error() and 5 = critical(); " +
                           "default: %(default)s")
+    optional.add_argument("--toolchain_cache", dest='toolchain_cache',
+                          action="store", default=None, type=str,
+                          help="JSON manifest of tool checks already " +
+                          "passed (shared with riboSeed.py), so the " +
+                          "barrnap version is only rechecked when it " +
+                          "changes; default: $RIBOSEED_TOOLCHAIN_CACHE " +
+                          "if set, otherwise checked every time")
     optional.add_argument("--clobber",
                           help="overwrite previous output files" +
                           "default: %(default)s", action='store_true',
@@ -254,11 +390,13 @@ def get_genbank_rec_from_multigb(recordID, genbank_records):
 
 
 def parse_clustered_loci_file(filepath, gb_filepath, output_root,
-                              circular, padding=1000, logger=None):
+                              circular, padding=1000, gb_records=None,
+                              logger=None):
     """Given a file from riboSelect or manually created (see specs in README)
     this parses the clusters and returns a list where [0] is sequence name
     and [1] is a list of loci in that cluster
     As of 20161028, this returns a list of LociCluster objects!
+    gb_records is the GenbankCache of gb_filepath, if already open
     """
     assert logger is not None, "logging must be used!"
     if not (os.path.isfile(filepath) and os.path.getsize(filepath) > 0):
@@ -316,67 +454,65 @@ def parse_clustered_loci_file(filepath, gb_filepath, output_root,
     if len(clusters) == 0:
         raise ValueError("No Clusters Found!!")
     # match up seqrecords
-    gb_records = SeqIO.index(gb_filepath, 'genbank')
+    if gb_records is None:
+        gb_records = open_genbank_cache(
+            gb_filepath, cache_dir=default_cache_dir(output_root),
+            logger=logger)
     for clu in clusters:
         clu.feat_of_interest = feature
-        clu.seq_record = gb_records[clu.sequence_id]
-    gb_records.close()
+        clu.seq_record = gb_records.genome_view(clu.sequence_id)
     return clusters
 
 
 def extract_coords_from_locus(cluster, feature="rRNA",
-                              logger=None, verbose=False):
+                              logger=None, verbose=False, feature_index=None):
     """given a LociCluster object, ammend values
     20161028 returns a LociCluster
+    feature_index is the FeatureIndex of the cluster's record (from
+    GenbankCache.feature_index); if not given, the one carried by
+    cluster.seq_record's GenomeView is used, or one is built from its
+    SeqRecord
     """
     assert logger is not None, "logging must be used!"
-    loc_number = 0  # index for hits
-    locus_tags = [x.locus_tag for x in cluster.loci_list]
+    if feature_index is None:
+        feature_index = getattr(cluster.seq_record, "feature_index", None)
+    if feature_index is None:
+        feature_index = FeatureIndex(seq_record_features(cluster.seq_record))
     if verbose:
         logger.debug("Locus tags for cluster %s: %s", cluster.index,
-                     " ".join([x for x in locus_tags]))
-    for feat in cluster.seq_record.features:
-        if not feat.type in feature:
+                     " ".join([x.locus_tag for x in cluster.loci_list]))
+    untagged = [x for x in feature_index.untagged if x.type in feature]
+    if len(untagged) != 0:
+        logger.error(str("found a feature ({0}), but there is no" +
+                         "locus tag associated with it! Try formatting " +
+                         "it by running scanScaffolds.sh").format(
+                             untagged[0]))
+        raise ValueError
+    loc_number = 0  # index for hits
+    for this_locus in cluster.loci_list:
+        feat = feature_index.locus_feature(this_locus.locus_tag,
+                                           feature=feature)
+        if feat is None:
             continue
         if verbose:
             logger.debug("found {0} in the following feature : \n{1}".format(
                 feature, feat))
-        try:
-            locus_tag = feat.qualifiers.get("locus_tag")[0]
-        except:
-            logger.error(str("found a feature ({0}), but there is no" +
-                             "locus tag associated with it! Try formatting " +
-                             "it by running scanScaffolds.sh").format(feat))
-            raise ValueError
-
-        # quick way of checking without using whole object
-        if locus_tag in locus_tags:
-            # make this_locus point to locus we are adding info to
-            this_locus = next((x for x in cluster.loci_list if
-                               x.locus_tag == locus_tag), None)
-            #  SeqIO makes coords 0-based; the +1 below undoes that
-            this_locus.start_coord = feat.location.start.position + 1
-            this_locus.end_coord = feat.location.end.position
-            this_locus.strand = feat.strand
-            this_locus.product = feat.qualifiers.get("product")
-            logger.debug("Added attributes for %s", this_locus.locus_tag)
-            # logger.debug(str(this_locus.__dict__))
-            logger.debug(
-                "locus_tag: %s; coords: [%i-%i]; sequence_id: %s; " +
-                "product: %s", this_locus.locus_tag,
-                this_locus.start_coord, this_locus.end_coord,
-                this_locus.sequence_id, this_locus.product[0])
-            loc_number = loc_number + 1
-        else:
-            pass
-            # logger.error("skipping %s", locus_tag)
+        #  coords are 0-based; the +1 below undoes that
+        this_locus.start_coord = feat.start + 1
+        this_locus.end_coord = feat.end
+        this_locus.strand = feat.strand
+        this_locus.product = None if feat.product is None else [feat.product]
+        logger.debug("Added attributes for %s", this_locus.locus_tag)
+        logger.debug(
+            "locus_tag: %s; coords: [%i-%i]; sequence_id: %s; " +
+            "product: %s", this_locus.locus_tag,
+            this_locus.start_coord, this_locus.end_coord,
+            this_locus.sequence_id, this_locus.product[0])
+        loc_number = loc_number + 1
     if not loc_number > 0:
         logger.error("no hits found in any record with feature %s! Double " +
                      "check your genbank file", feature)
         raise ValueError
-    # logger.debug("adding extracted sequence")
-    # cluster.extractedSeqRecord = cluster.seq_record.seq[cluster.
-    # return cluster
 
 
 def pad_genbank_sequence(cluster, logger=None, verbose=False):
@@ -393,13 +529,13 @@ def pad_genbank_sequence(cluster, logger=None, verbose=False):
     for loc in cluster.loci_list:
         if logger:
             logger.debug("pre-padded")
-            logger.debug(str(loc.__dict__))
+            logger.debug(str(describe(loc)))
         start, end = loc.start_coord, loc.end_coord
         loc.start_coord, loc.end_coord = [start + cluster.padding,
                                           end + cluster.padding]
         if logger:
             logger.debug("post-padded")
-            logger.debug(str(loc.__dict__))
+            logger.debug(str(describe(loc)))
     #TODO: check for interference with other clusters
 
     # take care of the sequence
@@ -408,6 +544,10 @@ def pad_genbank_sequence(cluster, logger=None, verbose=False):
         logger.warning("padding cannot be greater than length of " +
                        "sequence! returning original sequence")
         return cluster
+    if isinstance(cluster.seq_record, GenomeView):
+        # wraps around the origin, rather than copying the genome
+        cluster.seq_record = cluster.seq_record.padded(cluster.padding)
+        return cluster
     new_seq = str(old_seq[-cluster.padding:]
                   + old_seq
                   + old_seq[0: cluster.padding])
@@ -441,7 +581,7 @@ def stitch_together_target_regions(cluster,
 
     logger.debug("stitching together the following coords:")
     for i in cluster.loci_list:
-        logger.debug(str(i.__dict__))
+        logger.debug(str(describe(i)))
     #  This works as long as coords are never in reverse order
     cluster.global_start_coord = min([x.start_coord for
                                       x in cluster.loci_list]) - flanking
@@ -500,7 +640,7 @@ def stitch_together_target_regions(cluster,
                 IUPAC.IUPACAmbiguousDNA()),
             id=seq_id)
     ### last minuete check
-    for property, value in vars(cluster).items():
+    for property, value in describe(cluster).items():
         if value is None:
             logger.debug("%s has a value of None!", property)
     return cluster
@@ -692,6 +832,11 @@ def plot_scatter_with_anno(data,
     plot out the entropies for each position,
     plot the annotations, and return 0
     """
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    import pandas as pd
     if len(consensus_cov) != len(data):
         raise ValueError("data and consensus different lengths!")
     df = pd.DataFrame({names[0]: range(1, len(data) + 1),
@@ -823,6 +968,10 @@ def plot_pairwise_least_squares(counts, names_list, output_prefix):
     and a list of counts from plot_kmer_occurances,
     retruns a pandas df of least squares after plotting heatmaps
     """
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    import pandas as pd
     res_list = []
     counts_list = []
     for v in counts.values():
@@ -1005,22 +1154,21 @@ def get_rec_from_generator(recordID, gen, method=None):
 
 
 def main(clusters, gb_path, logger, verbose, no_revcomp,
-         output, circular, flanking, prefix_name):
+         output, circular, flanking, prefix_name, gb_records=None):
     get_rev_comp = no_revcomp is False  # kinda clunky
     flanking_regions_output = os.path.join(output, "flanking_regions_output")
     os.makedirs(flanking_regions_output)
     extracted_regions = []
     logger.debug(clusters)
+    if gb_records is None:
+        gb_records = open_genbank_cache(
+            gb_path, cache_dir=default_cache_dir(output), logger=logger)
     for cluster in clusters:  # for each cluster of loci
         # get seq record that cluster is  from
         logger.debug("fetching genbank record for %s", cluster.sequence_id)
         try:
-            genome_records_gen = SeqIO.parse(gb_path, 'genbank')
-            cluster.seq_record = get_rec_from_generator(
-                recordID=cluster.sequence_id,
-                gen=genome_records_gen,
-                method=None)
-            logger.debug(cluster.seq_record)
+            cluster.seq_record = gb_records.genome_view(cluster.sequence_id)
+            logger.debug("%r", cluster.seq_record)
         except Exception as e:
             logger.error(e)
             sys.exit(1)
@@ -1028,6 +1176,7 @@ def main(clusters, gb_path, logger, verbose, no_revcomp,
         try:
             extract_coords_from_locus(
                 cluster=cluster, feature=cluster.feat_of_interest,
+                feature_index=gb_records.feature_index(cluster.sequence_id),
                 logger=logger,
                 verbose=True)
         except Exception as e:
@@ -1036,7 +1185,7 @@ def main(clusters, gb_path, logger, verbose, no_revcomp,
         logger.debug(
             "Here are the detected region,coords, strand, product, " +
             "locus tag, subfeatures and sequence id of the results:")
-        logger.debug(str(cluster.__dict__))
+        logger.debug(str(describe(cluster)))
         if circular:
             cluster_post_pad = pad_genbank_sequence(cluster=cluster,
                                                     logger=logger)
@@ -1125,12 +1274,7 @@ def main(clusters, gb_path, logger, verbose, no_revcomp,
     # write out the whole file as a fasta as well...
     # append in case of multiple records
     ref_fasta = os.path.join(output, str(prefix_name + "_genome.fasta"))
-    # refresh the generator
-    genome_records_gen = SeqIO.parse(gb_path, 'genbank')
-    with open(ref_fasta, "a") as outfa:
-        for record in genome_records_gen:
-            SeqIO.write(record, outfa, "fasta")
-            outfa.write('\n')
+    gb_records.write_fasta(ref_fasta)
     return extracted_regions, ref_fasta, file_list
 
 
@@ -1304,21 +1448,31 @@ if __name__ == "__main__":
     if all(test_ex):
         logger.debug("All needed system executables found!")
         logger.debug(str([shutil.which(i) for i in executables]))
-    check_version_from_cmd(
+    # only rerun when barrnap changes; see riboToolchain
+    cached_check(
+        open_toolchain_manifest(args.toolchain_cache, logger=logger),
         exe='barrnap',
-        cmd='', line=2,
-        pattern=r"barrnap (?P<version>[^-]+)",
-        where='stderr',
-        logger=logger,
-        coerce_two_digit=True,
-        min_version="0.0.7")
+        check="version>=0.0.7",
+        func=lambda: check_version_from_cmd(
+            exe='barrnap',
+            cmd='', line=2,
+            pattern=r"barrnap (?P<version>[^-]+)",
+            where='stderr',
+            logger=logger,
+            coerce_two_digit=True,
+            min_version="0.0.7"),
+        logger=logger)
     # parse cluster file
     try:
+        gb_records = open_genbank_cache(
+            args.genbank_genome, cache_dir=default_cache_dir(output_root),
+            logger=logger)
         clusters = parse_clustered_loci_file(args.clustered_loci,
                                              gb_filepath=args.genbank_genome,
                                              output_root='',
                                              padding=args.padding,
                                              circular=args.circular,
+                                             gb_records=gb_records,
                                              logger=logger)
     except Exception as e:
         logger.error(e)
@@ -1330,7 +1484,7 @@ if __name__ == "__main__":
     regions = []
     logger.info("clusters:")
     for cluster in clusters:
-            logger.info(cluster.__dict__)
+            logger.info(describe(cluster))
     if args.name is None:  # if none given, use date for name (for out files)
         args.name = date
     regions, ref_fasta, region_files = main(
@@ -1343,6 +1497,7 @@ if __name__ == "__main__":
         circular=args.circular,
         prefix_name=args.name,
         no_revcomp=args.no_revcomp,
+        gb_records=gb_records,
     )
 
     # make MSA and calculate entropy
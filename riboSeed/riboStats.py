@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""
+Quick assembly statistics (contig counts, total length, largest contig,
+GC, N50/N75 and L50/L75) computed directly from contigs.fasta files, in
+the same layout as QUAST's report.tsv.  This is what riboSeed uses to
+compare the de novo and de fere novo assemblies; run QUAST itself for
+the reference-based metrics.
+
+USAGE:
+ $ riboStats.py de_fere_novo/contigs.fasta de_novo/contigs.fasta \
+     -n de_fere_novo de_novo -o assembly_stats.tsv
+"""
+
+import argparse
+import sys
+import os
+import traceback
+
+import numpy as np
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+THRESHOLDS = [0, 1000, 5000, 10000, 25000, 50000]
+
+# --------------------------- methods --------------------------- #
+
+
+def get_args():  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Report contig statistics for one or more assemblies",
+        add_help=False)  # to allow for custom help
+    parser.add_argument("contigs", nargs="+",
+                        help="fasta files of contigs")
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("-n", "--names", dest='names', action="store",
+                          nargs="+",
+                          help="names for the assemblies, in the same " +
+                          "order; default: the file paths",
+                          type=str, default=None)
+    optional.add_argument("-o", "--output", dest='output', action="store",
+                          help="write the report to this file rather " +
+                          "than stdout",
+                          type=str, default=None)
+    optional.add_argument("-m", "--min_contig", dest='min_contig',
+                          action="store",
+                          help="contigs shorter than this are left out " +
+                          "of all but the (>= x bp) rows, like QUAST; " +
+                          "default: %(default)s",
+                          type=int, default=500)
+    optional.add_argument("-h", "--help",
+                          action="help", default=argparse.SUPPRESS,
+                          help="Displays this help message")
+    args = parser.parse_args()
+    return args
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def get_contig_lengths(fasta):
+    """ returns two arrays, the length and the number of G's and C's of
+    each record in a fasta, without parsing it record by record
+    """
+    with open(fasta, "rb") as inf:
+        data = np.frombuffer(inf.read(), dtype=np.uint8)
+    if len(data) == 0:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    newlines = np.flatnonzero(data == ord("\n"))
+    if newlines.size == 0 or newlines[-1] != len(data) - 1:
+        newlines = np.append(newlines, len(data))
+    starts = np.concatenate(([0], newlines[:-1] + 1))
+    line_lens = newlines - starts
+    # dont count windows line endings as bases
+    line_lens = line_lens - (data[np.maximum(newlines - 1, 0)] == ord("\r"))
+    is_header = data[np.minimum(starts, len(data) - 1)] == ord(">")
+    is_header[line_lens <= 0] = False
+    record = np.cumsum(is_header) - 1
+    seq_lines = ~is_header & (record >= 0) & (line_lens > 0)
+    nrecords = int(is_header.sum())
+    lengths = np.bincount(record[seq_lines], weights=line_lens[seq_lines],
+                          minlength=nrecords).astype(np.int64)
+    # G's and C's per line, from where they fall between line starts
+    is_gc = np.isin(data, np.frombuffer(b"GCgc", dtype=np.uint8))
+    gc_cum = np.concatenate(([0], np.cumsum(is_gc)))
+    line_gc = gc_cum[newlines] - gc_cum[starts]
+    gc = np.bincount(record[seq_lines], weights=line_gc[seq_lines],
+                     minlength=nrecords).astype(np.int64)
+    return (lengths, gc)
+
+
+def nx_stats(lengths, x):
+    """ returns (Nx, Lx) for an array of contig lengths
+    """
+    if len(lengths) == 0:
+        return (0, 0)
+    ordered = np.sort(lengths)[::-1]
+    cumulative = np.cumsum(ordered)
+    idx = int(np.searchsorted(cumulative, cumulative[-1] * x / 100.0))
+    return (int(ordered[idx]), idx + 1)
+
+
+def assembly_stats(fasta, min_contig=500):
+    """ returns a list of (field, value) tuples named and ordered as in
+    QUAST's report.tsv
+    """
+    lengths, gc = get_contig_lengths(fasta)
+    stats = []
+    for thresh in THRESHOLDS:
+        stats.append(("# contigs (>= %i bp)" % thresh,
+                      int(np.sum(lengths >= thresh))))
+    for thresh in THRESHOLDS:
+        stats.append(("Total length (>= %i bp)" % thresh,
+                      int(lengths[lengths >= thresh].sum())))
+    keep = lengths >= min_contig
+    lengths, gc = lengths[keep], gc[keep]
+    stats.extend([
+        ("# contigs", len(lengths)),
+        ("Largest contig", int(lengths.max()) if len(lengths) else 0),
+        ("Total length", int(lengths.sum())),
+        ("GC (%)", "%.2f" % (100.0 * gc.sum() / lengths.sum())
+         if lengths.sum() else "0.00")])
+    for x in [50, 75]:
+        n, l = nx_stats(lengths, x)
+        stats.append(("N%i" % x, n))
+        stats.append(("L%i" % x, l))
+    # reorder to match QUAST, which lists all the N's before the L's
+    order = ["N50", "N75", "L50", "L75"]
+    return [s for s in stats if s[0] not in order] + \
+        sorted([s for s in stats if s[0] in order],
+               key=lambda s: order.index(s[0]))
+
+
+def write_stats_report(stats_list, names, outfile=None):
+    """ write the stats for several assemblies side by side, as QUAST does;
+    returns the report lines
+    """
+    assert len(stats_list) == len(names), \
+        "must have a name for each assembly"
+    lines = ["\t".join(["Assembly"] + names)]
+    for idx, (field, _) in enumerate(stats_list[0]):
+        lines.append("\t".join([field] + [str(x[idx][1])
+                                          for x in stats_list]))
+    if outfile is not None:
+        with open(outfile, "w") as outf:
+            outf.write("\n".join(lines) + "\n")
+    return lines
+
+
+if __name__ == "__main__":
+    args = get_args()
+    names = args.names if args.names is not None else args.contigs
+    if len(names) != len(args.contigs):
+        sys.stderr.write("must give a name for each contigs file\n")
+        sys.exit(1)
+    try:
+        lines = write_stats_report(
+            [assembly_stats(x, min_contig=args.min_contig)
+             for x in args.contigs],
+            names=names, outfile=args.output)
+    except Exception as e:
+        sys.stderr.write(last_exception())
+        sys.exit(1)
+    if args.output is None:
+        print("\n".join(lines))
@@ -0,0 +1,162 @@
+#-*- coding: utf-8 -*-
+
+"""
+Cache of the checks riboSeed runs on its external tools (versions, and
+things like whether SMALT can write bam), so that they are only run once
+per binary rather than at every start.  Results are kept in a small JSON
+manifest keyed by each executable's resolved path, and are reused for as
+long as the file's size and modification time are unchanged.
+
+Nothing is written unless a manifest is asked for, with riboSeed's (or
+riboSnag's) --toolchain_cache or the RIBOSEED_TOOLCHAIN_CACHE environment
+variable; without one, every check is run each time.  Several runs can
+share a manifest; each save merges with what is already on disk.
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import traceback
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+
+# --------------------------- methods --------------------------- #
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def requested_manifest_path(path=None):
+    """ the manifest a run should use: path if given, else
+    $RIBOSEED_TOOLCHAIN_CACHE, else None (dont record the checks)
+    """
+    if path is None:
+        path = os.environ.get("RIBOSEED_TOOLCHAIN_CACHE") or None
+    if path is None:
+        return None
+    return os.path.expanduser(path)
+
+
+def open_toolchain_manifest(path=None, logger=None):
+    """ the ToolchainManifest at requested_manifest_path(path), or None,
+    which cached_check takes to mean run every check
+    """
+    path = requested_manifest_path(path)
+    if path is None:
+        return None
+    return ToolchainManifest(path, logger=logger)
+
+
+def exe_stamp(exe):
+    """ returns (resolved path, size, mtime in ns) for an executable name
+    or path, or None if it cant be found
+    """
+    path = shutil.which(os.path.expanduser(exe))
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+class ToolchainManifest(object):
+    """ the recorded results of tool checks.  get() only returns a result
+    if the executable is unchanged since it was recorded
+    """
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger
+        self.entries = self.read()
+        self.updated = {}
+
+    def read(self):
+        try:
+            with open(self.path, "r") as inf:
+                return json.load(inf)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, exe, check):
+        """ the recorded result of check for exe, or None
+        """
+        stamp = exe_stamp(exe)
+        if stamp is None:
+            return None
+        entry = self.entries.get(stamp[0])
+        if entry is None or [entry["size"], entry["mtime_ns"]] != \
+           list(stamp[1:]):
+            return None
+        return entry["checks"].get(check)
+
+    def set(self, exe, check, result):
+        stamp = exe_stamp(exe)
+        if stamp is None:
+            return
+        entry = self.entries.get(stamp[0])
+        if entry is None or [entry["size"], entry["mtime_ns"]] != \
+           list(stamp[1:]):
+            entry = {"size": stamp[1], "mtime_ns": stamp[2], "checks": {}}
+            self.entries[stamp[0]] = entry
+        entry["checks"][check] = result
+        self.updated[stamp[0]] = entry
+
+    def clear(self):
+        """ forget everything, so every check is rerun (and rerecorded)
+        """
+        self.entries = {}
+
+    def save(self):
+        """ write our new results into the manifest on disk, keeping those
+        recorded by other runs meanwhile.  Failing to save is not an error;
+        the checks will just be run again next time
+        """
+        if len(self.updated) == 0:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            entries = self.read()
+            for path, entry in self.updated.items():
+                old = entries.get(path)
+                if old is not None and [old["size"], old["mtime_ns"]] == \
+                   [entry["size"], entry["mtime_ns"]]:
+                    entry["checks"] = dict(old["checks"], **entry["checks"])
+                entries[path] = entry
+            handle, tmp = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(handle, "w") as outf:
+                json.dump(entries, outf, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self.updated = {}
+        except OSError:
+            if self.logger:
+                self.logger.warning("could not save the toolchain " +
+                                    "manifest %s", self.path)
+                self.logger.debug(last_exception())
+
+
+def cached_check(manifest, exe, check, func, logger=None):
+    """ return the result of func() (which should raise if the check
+    fails), reusing the result recorded for this exe if it hasnt changed.
+    With no manifest, func is always run
+    """
+    if manifest is None:
+        return func()
+    result = manifest.get(exe, check)
+    if result is not None:
+        if logger:
+            logger.debug("using recorded %s check for %s: %s", check, exe,
+                         result)
+        return result
+    result = func()
+    manifest.set(exe, check, result)
+    manifest.save()
+    return result
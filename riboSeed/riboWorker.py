@@ -0,0 +1,719 @@
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+
+"""
+File-system-backed work queue, so the independent subassemblies (and the
+final assemblies) of a riboSeed run can be spread over several machines.
+
+The queue is a directory visible to every node:
+  pending/   job specs waiting to be picked up
+  running/   job specs that a worker has claimed; the worker touches its
+             spec every few seconds, and a spec left untouched for longer
+             than its lease is put back in pending/ for another worker
+  done/      completion markers with the return code of each job
+  logs/      one log file per worker
+
+riboSeed.py --queue_dir writes job specs to pending/ and waits for the
+completion markers; riboWorker.py processes, started on any host that can
+see the queue directory, claim jobs by renaming them into running/.
+Because os.rename is atomic within a filesystem, a job can only ever be
+claimed by a single worker.  Jobs are run with the same memory watchdog
+(and out-of-memory retries) as riboSeed's multiprocessing runs, and the
+submitter gives up on (and cancels) stragglers the same way.
+
+This is a script of its own rather than a riboSeed.py subcommand: like
+the other riboX.py tools, it has its own flat set of arguments, and
+riboSeed.py's required arguments (-r, -F, -o ...) mean nothing to a
+worker.
+
+USAGE:
+ $ riboWorker.py /shared/riboSeed_queue --max_idle 3600
+"""
+
+import argparse
+import sys
+import time
+import json
+import socket
+import subprocess
+import os
+import traceback
+import math
+import re
+import signal
+import tempfile
+import threading
+
+# need this line for unittesting
+sys.path.append(os.path.join('..', 'riboSeed'))
+from pyutilsnrw.utils3_5 import set_up_logging
+
+QUEUE_SUBDIRS = ["pending", "running", "done", "logs", "tmp"]
+# seconds a claimed job may go without a heartbeat before it is requeued
+DEFAULT_LEASE = 300
+
+# --------------------------- methods --------------------------- #
+
+
+def get_args():  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Claim and run riboSeed jobs from a shared queue " +
+        "directory. Start as many of these as you like, on as many hosts " +
+        "as can see the queue directory.",
+        add_help=False)  # to allow for custom help
+    parser.add_argument("queue_dir", action="store",
+                        help="queue directory given to riboSeed.py " +
+                        "with --queue_dir")
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("-w", "--worker_id", dest='worker_id',
+                          action="store", default=None, type=str,
+                          help="name for this worker, used in logs and " +
+                          "completion markers; default: hostname_pid")
+    optional.add_argument("--poll", dest='poll', action="store",
+                          default=5, type=float,
+                          help="seconds between checks for new jobs; " +
+                          "default: %(default)s")
+    optional.add_argument("--max_idle", dest='max_idle', action="store",
+                          default=None, type=float,
+                          help="exit after this many seconds without " +
+                          "finding a job; default: run until killed")
+    optional.add_argument("--max_jobs", dest='max_jobs', action="store",
+                          default=None, type=int,
+                          help="exit after running this many jobs; " +
+                          "default: no limit")
+    optional.add_argument("-v", "--verbosity", dest='verbosity',
+                          action="store",
+                          default=2, type=int, choices=[1, 2, 3, 4, 5],
+                          help="Logger writes debug to file in queue_dir/" +
+                          "logs; this sets verbosity level sent to stderr. " +
+                          " 1 = debug(), 2 = info(), 3 = warning(), " +
+                          "4 = error() and 5 = critical(); " +
+                          "default: %(default)s")
+    optional.add_argument("-h", "--help",
+                          action="help", default=argparse.SUPPRESS,
+                          help="Displays this help message")
+    args = parser.parse_args()
+    return args
+
+
+def last_exception():
+    """ Returns last exception as a string, or use in logging.
+    stolen verbatim from pyani
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    return ''.join(traceback.format_exception(exc_type, exc_value,
+                                              exc_traceback))
+
+
+def get_available_memory():
+    """ MemAvailable from /proc/meminfo, in bytes; None if we cant tell
+    (ie, not on linux)
+    """
+    try:
+        with open("/proc/meminfo", "r") as inf:
+            for line in inf:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_process_tree(pid):
+    """ return a dict of pid: rss (bytes) for pid and all of its
+    descendants, read from /proc/<pid>/stat.  Empty without /proc
+    """
+    if not os.path.isdir("/proc"):
+        return {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children, rss = {}, {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join("/proc", entry, "stat"), "r") as inf:
+                stat = inf.read()
+        except (IOError, OSError):
+            # process exited while we were looking
+            continue
+        # the command name can have spaces, so split after its closing paren
+        fields = stat[stat.rindex(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_size
+    tree = {}
+    todo = [pid]
+    while len(todo) != 0:
+        this = todo.pop()
+        tree[this] = rss.get(this, 0)
+        todo.extend(children.get(this, []))
+    return tree
+
+
+def get_process_tree_rss(pid):
+    """ sum of the resident set sizes (bytes) of pid and all of its
+    descendants.  Returns 0 without /proc
+    """
+    return sum(get_process_tree(pid).values())
+
+
+def kill_process_tree(pid):
+    """ SIGKILL pid and all of its descendants
+    """
+    tree = get_process_tree(pid)
+    if len(tree) == 0:
+        tree = {pid: 0}
+    for this in tree.keys():
+        try:
+            os.kill(this, signal.SIGKILL)
+        except OSError:
+            # already gone
+            pass
+
+
+def wait_for_memory(min_free, poll=5, max_wait=3600):
+    """ block until at least min_free bytes are available, or max_wait
+    seconds pass.  returns the seconds spent waiting
+    """
+    waited = 0
+    while waited < max_wait:
+        available = get_available_memory()
+        if available is None or available >= min_free:
+            break
+        time.sleep(poll)
+        waited = waited + poll
+    return waited
+
+
+def is_oom_failure(returncode, output):
+    """ SIGKILL (from the kernel's OOM killer, -9 directly or 137 through a
+    shell), or an allocation error in the output of a failed command
+    """
+    if returncode in [-9, 137]:
+        return True
+    return returncode != 0 and any(
+        [x in output for x in ["std::bad_alloc", "Cannot allocate memory",
+                               "out of memory", "MemoryError"]])
+
+
+SPADES_EXE_NAME = re.compile(r"^(meta|rna|plasmid)?spades(\.py)?$")
+SHELL_SEPARATOR = re.compile(r"(&&|\|\||;|\|)")
+
+
+def is_spades_segment(segment):
+    """ whether a simple shell command (no separators) runs SPAdes, going
+    by the basename of its executable rather than anything in its args
+    """
+    tokens = [x for x in segment.split() if
+              x not in ["if", "then", "else", "do", "time"]]
+    return len(tokens) != 0 and \
+        SPADES_EXE_NAME.match(os.path.basename(tokens[0])) is not None
+
+
+def shrink_spades_args(segment):
+    """ halve -t and -m, and drop the largest of -k, in a SPAdes call
+    """
+    new = segment
+    threads = re.search(r" -t (\d+)", segment)
+    if threads is not None and int(threads.group(1)) > 1:
+        new = new.replace(threads.group(0), " -t %i" %
+                          max(1, int(threads.group(1)) // 2), 1)
+    memory = re.search(r" -m (\d+)", segment)
+    if memory is not None and int(memory.group(1)) > 1:
+        new = new.replace(memory.group(0), " -m %i" %
+                          max(1, int(memory.group(1)) // 2), 1)
+    kmers = re.search(r" -k ([\d,]+)", segment)
+    if kmers is not None and len(kmers.group(1).split(",")) > 1:
+        new = new.replace(kmers.group(0), " -k %s" % ",".join(
+            kmers.group(1).split(",")[:-1]), 1)
+    return new
+
+
+def shrink_spades_cmd(cmd):
+    """ return the SPAdes command with half the threads, half the memory,
+    and without the largest k-mer, or None if there is nothing left to
+    shrink (or if it doesnt run SPAdes).  Only the parts of a compound
+    shell command that run the SPAdes executable are changed, so other
+    tools (eg samtools -m) in the same command are left alone
+    """
+    parts = SHELL_SEPARATOR.split(cmd)
+    new = "".join([shrink_spades_args(x) if
+                   i % 2 == 0 and is_spades_segment(x) else x
+                   for i, x in enumerate(parts)])
+    if new == cmd:
+        return None
+    return new
+
+
+def run_cmd_watched(cmd, poll=2, job_status=None, job_key=None):
+    """ run a shell command, sampling the RSS of its process tree every
+    poll seconds.  Output goes to a temp file rather than a pipe so we
+    dont have to read it while waiting.  If a (multiprocessing.Manager)
+    job_status dict is given, the pid is stored under ("pid", job_key) so
+    the parent can kill a straggler; if the parent has already marked
+    ("killed", job_key), the command is killed straight away.
+    returns (returncode, tail of stdout and stderr, peak rss in bytes)
+    """
+    peak = 0
+    # start polling quickly, so short commands arent held up
+    delay = .05
+    with tempfile.TemporaryFile() as outf:
+        proc = subprocess.Popen(cmd, shell=sys.platform != "win32",
+                                stdout=outf, stderr=subprocess.STDOUT)
+        if job_status is not None:
+            job_status[("pid", job_key)] = proc.pid
+            if job_status.get(("killed", job_key), False):
+                kill_process_tree(proc.pid)
+        while proc.poll() is None:
+            peak = max(peak, get_process_tree_rss(proc.pid))
+            time.sleep(delay)
+            delay = min(poll, delay * 2)
+        outf.seek(max(0, outf.tell() - 100000))
+        output = outf.read().decode("utf-8", "replace")
+    return (proc.returncode, output, peak)
+
+
+def subprocess_run_list_watched(cmdlist, oom_retries=0, min_free=0,
+                                poll=2, max_wait=3600, job_status=None,
+                                job_key=None):
+    """ like subprocess_run_list, but before each command wait (up to
+    max_wait seconds) for min_free bytes of memory, track the peak RSS of
+    the command's process tree, and if a SPAdes command looks like it ran
+    out of memory, rerun it with shrink_spades_cmd, up to oom_retries
+    times.  job_status and job_key are used by wait_for_pool_results to
+    time out stragglers.
+    Logger cant be used with multiprocessing, so this returns a dict with
+    the returncode (0 if all is well, 4 if killed as a straggler,
+    otherwise 1), the peak rss, the retries made, the time taken, and the
+    end of the output of a failed command
+    """
+    t0 = time.time()
+    result = {"returncode": 0, "peak_rss": 0, "retries": [], "error": "",
+              "elapsed": 0}
+    if job_status is not None:
+        job_status[("start", job_key)] = t0
+    for cmd in cmdlist:
+        attempt = 0
+        while True:
+            wait_for_memory(min_free, poll=poll, max_wait=max_wait)
+            returncode, output, peak = run_cmd_watched(
+                cmd, poll=poll, job_status=job_status, job_key=job_key)
+            result["peak_rss"] = max(result["peak_rss"], peak)
+            result["elapsed"] = time.time() - t0
+            if job_status is not None and \
+               job_status.get(("killed", job_key), False):
+                result["returncode"] = 4
+                result["error"] = "killed after running too long"
+                return result
+            if returncode == 0:
+                break
+            smaller = None
+            if is_oom_failure(returncode, output) and attempt < oom_retries:
+                smaller = shrink_spades_cmd(cmd)
+            if smaller is None:
+                result["returncode"] = 1
+                result["error"] = output[-2000:]
+                return result
+            result["retries"].append({"cmd": cmd, "returncode": returncode,
+                                      "peak_rss": peak, "retry_cmd": smaller})
+            cmd = smaller
+            attempt = attempt + 1
+    result["elapsed"] = time.time() - t0
+    return result
+
+
+def get_straggler_timeout(durations, njobs, factor, min_timeout):
+    """ once at least half of the njobs are done, jobs may run for factor
+    times the median duration of the finished ones (but never less than
+    min_timeout seconds).  Returns None if there is no limit yet
+    """
+    if not factor or len(durations) < max(1, int(math.ceil(njobs / 2))) or \
+       len(durations) == njobs:
+        return None
+    ordered = sorted(durations)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        median = ordered[mid]
+    else:
+        median = (ordered[mid - 1] + ordered[mid]) / 2
+    return max(min_timeout, factor * median)
+
+
+def default_worker_id():
+    """ hostname and pid are enough to tell workers apart on a cluster
+    """
+    return "{0}_{1}".format(socket.gethostname(), os.getpid())
+
+
+def make_queue_dirs(queue_dir):
+    """ create the queue subdirectories if they are not there yet
+    """
+    for sub in QUEUE_SUBDIRS:
+        os.makedirs(os.path.join(queue_dir, sub), exist_ok=True)
+
+
+def write_json_atomic(data, queue_dir, dest):
+    """ write to the queue's tmp dir, then rename into place, so that
+    nobody polling the destination ever sees a half-written file
+    """
+    tmp = os.path.join(queue_dir, "tmp", "{0}.{1}.{2}".format(
+        os.path.basename(dest), socket.gethostname(), os.getpid()))
+    with open(tmp, "w") as outf:
+        json.dump(data, outf, indent=1)
+    os.rename(tmp, dest)
+
+
+def make_job_spec(job_id, cmds, inputs=None, outputs=None, cores=1,
+                  memory=None, oom_retries=0, min_free=0,
+                  lease=DEFAULT_LEASE):
+    """ a job spec is a plain dict: the shell commands to run in order,
+    the files that must exist before starting, the files the job should
+    produce, the resources the commands were built to use, and the
+    limits for the worker's memory watchdog and lease
+    """
+    assert isinstance(cmds, list), "cmds must be a list of shell commands"
+    return {"job_id": job_id,
+            "cmds": cmds,
+            "inputs": inputs if inputs is not None else [],
+            "outputs": outputs if outputs is not None else [],
+            "resources": {"cores": cores, "memory": memory},
+            "limits": {"oom_retries": oom_retries, "min_free": min_free,
+                       "lease": lease},
+            "submitted": time.time()}
+
+
+def get_lease(spec):
+    """ specs written before leases were added get the default one
+    """
+    return spec.get("limits", {}).get("lease", DEFAULT_LEASE)
+
+
+def read_spec(path):
+    """ returns the job spec at path, or None if it has been moved away
+    """
+    try:
+        with open(path, "r") as inf:
+            return json.load(inf)
+    except FileNotFoundError:
+        return None
+
+
+def submit_job(queue_dir, spec):
+    """ put a job spec in pending/; returns the path to the spec
+    """
+    dest = os.path.join(queue_dir, "pending", spec["job_id"] + ".json")
+    if os.path.exists(os.path.join(queue_dir, "done",
+                                   spec["job_id"] + ".json")):
+        raise ValueError("job %s has already been run in this queue!" %
+                         spec["job_id"])
+    write_json_atomic(spec, queue_dir, dest)
+    return dest
+
+
+def claim_job(queue_dir, worker_id=None):
+    """ try to claim the oldest pending job by renaming it into running/.
+    returns (spec, running_path), or (None, None) if nothing was claimed.
+    Losing a race for a job just means trying the next one.
+    The spec's mtime is the lease's heartbeat, so it is touched straight
+    away (rename keeps the mtime of when it was submitted), and the
+    claim time is recorded for the submitter's straggler checks
+    """
+    pending = os.path.join(queue_dir, "pending")
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        running_path = os.path.join(queue_dir, "running", name)
+        try:
+            os.rename(os.path.join(pending, name), running_path)
+            os.utime(running_path)
+        except FileNotFoundError:
+            # another worker got there first
+            continue
+        spec = read_spec(running_path)
+        if spec is None:
+            continue
+        spec["claimed"] = time.time()
+        spec["worker"] = worker_id
+        write_json_atomic(spec, queue_dir, running_path)
+        return (spec, running_path)
+    return (None, None)
+
+
+def requeue_expired(queue_dir, logger=None):
+    """ put back in pending/ any running/ spec whose worker has not
+    touched it for longer than its lease (ie, the worker died or its
+    host went away).  returns the ids of the requeued jobs
+    """
+    requeued = []
+    running = os.path.join(queue_dir, "running")
+    for name in sorted(os.listdir(running)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(running, name)
+        spec = read_spec(path)
+        try:
+            if spec is None or \
+               time.time() - os.path.getmtime(path) <= get_lease(spec):
+                continue
+            if os.path.exists(os.path.join(queue_dir, "done", name)):
+                os.unlink(path)
+                continue
+            os.rename(path, os.path.join(queue_dir, "pending", name))
+        except FileNotFoundError:
+            # finished, or requeued by someone else, while we looked
+            continue
+        if logger:
+            logger.warning("lease on job %s (worker %s) expired; " +
+                           "requeueing it", spec["job_id"],
+                           spec.get("worker", None))
+        requeued.append(spec["job_id"])
+    return requeued
+
+
+def run_job(spec, running_path=None, poll=2, logger=None):
+    """ run the commands of a job spec in order with
+    subprocess_run_list_watched, touching running_path every quarter
+    lease while they run.  If running_path disappears, the job was
+    requeued or cancelled by the submitter, so the commands are killed.
+    returns (returncode, message); returncode is 0 if all is well, 4 if
+    it was killed, otherwise 1, or None if the job was taken away
+    """
+    missing = [x for x in spec["inputs"] if not os.path.exists(x)]
+    if len(missing) != 0:
+        return (1, "missing inputs: %s" % " ".join(missing))
+    limits = spec.get("limits", {})
+    job_status, results = {}, []
+    runner = threading.Thread(
+        target=lambda: results.append(subprocess_run_list_watched(
+            spec["cmds"], oom_retries=limits.get("oom_retries", 0),
+            min_free=limits.get("min_free", 0), poll=poll,
+            job_status=job_status, job_key=spec["job_id"])))
+    runner.start()
+    lost = False
+    while runner.is_alive():
+        runner.join(get_lease(spec) / 4)
+        if running_path is None or not runner.is_alive() or lost:
+            continue
+        try:
+            os.utime(running_path)
+        except FileNotFoundError:
+            lost = True
+            job_status[("killed", spec["job_id"])] = True
+            pid = job_status.get(("pid", spec["job_id"]), None)
+            if pid is not None:
+                kill_process_tree(pid)
+    if lost:
+        return (None, "job was requeued or cancelled while running")
+    result = results[0]
+    if logger:
+        for retry in result["retries"]:
+            logger.warning("job %s ran out of memory (code %i, peak " +
+                           "%.2fGB); retrying as:\n%s", spec["job_id"],
+                           retry["returncode"], retry["peak_rss"] / 1e9,
+                           retry["retry_cmd"])
+    if result["returncode"] != 0:
+        return (result["returncode"], result["error"])
+    missing = [x for x in spec["outputs"] if not os.path.exists(x)]
+    if len(missing) != 0:
+        # not fatal: a SPAdes call skipped for lack of reads is expected
+        return (0, "expected outputs not found: %s" % " ".join(missing))
+    return (0, "")
+
+
+def write_marker(queue_dir, job_id, returncode, message, worker_id,
+                 elapsed):
+    """ write the completion marker for a job to done/
+    """
+    marker = {"job_id": job_id,
+              "returncode": returncode,
+              "message": message,
+              "worker": worker_id,
+              "elapsed": elapsed,
+              "finished": time.time()}
+    write_json_atomic(marker, queue_dir,
+                      os.path.join(queue_dir, "done", job_id + ".json"))
+    return marker
+
+
+def complete_job(queue_dir, spec, running_path, returncode, message,
+                 worker_id, elapsed):
+    """ write the completion marker, then drop the running/ copy.  If the
+    running/ copy is already gone, the job was cancelled or requeued, so
+    no marker is written.  returns whether the marker was written
+    """
+    if not os.path.exists(running_path):
+        return False
+    write_marker(queue_dir, spec["job_id"], returncode, message,
+                 worker_id, elapsed)
+    try:
+        os.unlink(running_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def cancel_job(queue_dir, job_id, message):
+    """ used by the submitter to give up on a running job: drop its
+    running/ spec (so its worker kills it at the next heartbeat) and
+    mark it done with a return code of 4.  returns the marker, or None
+    if the job was no longer running
+    """
+    running_path = os.path.join(queue_dir, "running", job_id + ".json")
+    spec = read_spec(running_path)
+    if spec is None:
+        return None
+    try:
+        os.unlink(running_path)
+    except FileNotFoundError:
+        return None
+    return write_marker(queue_dir, job_id, 4, message, "submitter",
+                        time.time() - spec.get("claimed", time.time()))
+
+
+def worker_loop(queue_dir, worker_id=None, poll=5, max_idle=None,
+                max_jobs=None, logger=None):
+    """ claim and run jobs until max_idle seconds pass without work or
+    max_jobs have been run. returns the number of jobs run
+    """
+    if worker_id is None:
+        worker_id = default_worker_id()
+    make_queue_dirs(queue_dir)
+    njobs = 0
+    idle_since = time.time()
+    while max_jobs is None or njobs < max_jobs:
+        requeue_expired(queue_dir, logger=logger)
+        spec, running_path = claim_job(queue_dir, worker_id=worker_id)
+        if spec is None:
+            if max_idle is not None and time.time() - idle_since > max_idle:
+                if logger:
+                    logger.info("no jobs for %.1fs; worker %s exiting",
+                                max_idle, worker_id)
+                break
+            time.sleep(poll)
+            continue
+        if logger:
+            logger.info("worker %s running job %s", worker_id,
+                        spec["job_id"])
+        t0 = time.time()
+        try:
+            returncode, message = run_job(spec, running_path=running_path,
+                                          logger=logger)
+        except Exception:
+            returncode, message = 1, last_exception()
+        if returncode is None:
+            if logger:
+                logger.warning("job %s: %s", spec["job_id"], message)
+        else:
+            if returncode != 0 and logger:
+                logger.warning("job %s failed: %s", spec["job_id"],
+                               message)
+            complete_job(queue_dir, spec, running_path, returncode,
+                         message, worker_id, time.time() - t0)
+        njobs = njobs + 1
+        idle_since = time.time()
+    return njobs
+
+
+def wait_for_jobs(queue_dir, job_ids, poll=5, timeout=None,
+                  straggler_factor=0, min_timeout=0, logger=None):
+    """ block until every job in job_ids has a completion marker.
+    returns a dict of job_id: marker. If timeout (in seconds) is reached,
+    unfinished jobs are left out of the result.  While waiting, jobs
+    whose workers died are requeued, and once get_straggler_timeout
+    gives a limit, jobs running for longer than it are cancelled (and
+    get a return code of 4), as wait_for_pool_results does for local runs
+    """
+    t0 = time.time()
+    finished = {}
+    remaining = list(job_ids)
+    while len(remaining) != 0:
+        requeue_expired(queue_dir, logger=logger)
+        for job_id in remaining[:]:
+            marker_path = os.path.join(queue_dir, "done", job_id + ".json")
+            if os.path.exists(marker_path):
+                with open(marker_path, "r") as inf:
+                    finished[job_id] = json.load(inf)
+                remaining.remove(job_id)
+        if len(remaining) == 0:
+            break
+        limit = get_straggler_timeout(
+            durations=[x["elapsed"] for x in finished.values()],
+            njobs=len(job_ids), factor=straggler_factor,
+            min_timeout=min_timeout)
+        if limit is not None:
+            for job_id in remaining[:]:
+                spec = read_spec(os.path.join(queue_dir, "running",
+                                              job_id + ".json"))
+                if spec is None or "claimed" not in spec or \
+                   time.time() - spec["claimed"] < limit:
+                    continue
+                marker = cancel_job(
+                    queue_dir, job_id,
+                    "killed after running over the limit of %.0fs" % limit)
+                if marker is None:
+                    continue
+                if logger:
+                    logger.warning("job %s has run for %.0fs, over the " +
+                                   "limit of %.0fs; cancelling it",
+                                   job_id, marker["elapsed"], limit)
+                finished[job_id] = marker
+                remaining.remove(job_id)
+        if timeout is not None and time.time() - t0 > timeout:
+            if logger:
+                logger.error("timed out waiting for jobs: %s",
+                             " ".join(remaining))
+            break
+        if len(remaining) != 0:
+            time.sleep(poll)
+    return finished
+
+
+def run_cmd_lists_on_queue(cmd_lists, queue_dir, job_prefix, cores=1,
+                           memory=None, inputs=None, outputs=None,
+                           poll=5, timeout=None, oom_retries=0, min_free=0,
+                           lease=DEFAULT_LEASE, straggler_factor=0,
+                           min_timeout=0, logger=None):
+    """ submit each list of commands as one job, wait for all of them,
+    and return their return codes in submission order (unfinished jobs
+    get a return code of 1, cancelled stragglers 4).  oom_retries and
+    min_free are passed to the workers' memory watchdog;
+    straggler_factor and min_timeout are as for wait_for_pool_results
+    """
+    make_queue_dirs(queue_dir)
+    job_ids = []
+    for idx, cmds in enumerate(cmd_lists):
+        job_id = "{0}_{1}".format(job_prefix, idx)
+        spec = make_job_spec(
+            job_id=job_id, cmds=cmds, cores=cores, memory=memory,
+            inputs=inputs[idx] if inputs is not None else None,
+            outputs=outputs[idx] if outputs is not None else None,
+            oom_retries=oom_retries, min_free=min_free, lease=lease)
+        submit_job(queue_dir, spec)
+        job_ids.append(job_id)
+    if logger:
+        logger.info("submitted %i jobs to %s; waiting for workers",
+                    len(job_ids), queue_dir)
+    finished = wait_for_jobs(queue_dir, job_ids, poll=poll, timeout=timeout,
+                             straggler_factor=straggler_factor,
+                             min_timeout=min_timeout, logger=logger)
+    return [finished[x]["returncode"] if x in finished else 1
+            for x in job_ids]
+
+
+if __name__ == "__main__":
+    args = get_args()
+    queue_dir = os.path.abspath(os.path.expanduser(args.queue_dir))
+    make_queue_dirs(queue_dir)
+    worker_id = args.worker_id if args.worker_id is not None else \
+        default_worker_id()
+    logger = set_up_logging(verbosity=args.verbosity,
+                            outfile=os.path.join(queue_dir, "logs",
+                                                 worker_id + ".log"),
+                            name=__name__)
+    logger.info("Usage:\n{0}\n".format(" ".join([x for x in sys.argv])))
+    logger.info("worker %s watching %s", worker_id, queue_dir)
+    t0 = time.time()
+    njobs = worker_loop(queue_dir=queue_dir, worker_id=worker_id,
+                        poll=args.poll, max_idle=args.max_idle,
+                        max_jobs=args.max_jobs, logger=logger)
+    logger.info("Ran %i jobs", njobs)
+    logger.info("Time taken: %.2fm" % ((time.time() - t0) / 60))
@@ -166,6 +166,12 @@ setup(
              'riboSeed/riboSketch.py',
              'riboSeed/riboScore.py',
              'riboSeed/riboStack.py',
+             'riboSeed/riboWorker.py',
+             'riboSeed/riboRefSelect.py',
+             'riboSeed/riboReadStore.py',
+             'riboSeed/riboStats.py',
+             'riboSeed/riboCatalog.py',
+             'riboSeed/riboArchive.py',
              "scripts/OSX_INSTALL_DEPS.sh",
              'scripts/riboBatch.sh',
              'scripts/concatToyGenome.py'],
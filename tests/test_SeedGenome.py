@@ -15,7 +15,8 @@ from Bio import SeqIO
 sys.path.append(os.path.join(
     os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
 
-from riboSeed.riboSeed import SeedGenome, add_coords_to_clusters
+from riboSeed.riboSeed import SeedGenome, add_coords_to_clusters, \
+    set_global_coords, prepare_next_mapping, write_seed_sequences
 
 from riboSeed.riboSnag import parse_clustered_loci_file
 
@@ -116,6 +117,63 @@ class SeedGenomeTest(unittest.TestCase):
         self.assertEqual(str(oldrec.seq),
                          str(newrec.seq[1000: - 1000]))
 
+    def test_write_seed_sequences(self):
+        """ seeds fetched from the indexed, padded reference match the
+        clusters' (padded) views of the genome, across the origin too
+        """
+        loci_file = os.path.join(self.test_dir, "tiny_loci.txt")
+        with open(loci_file, "w") as outf:
+            outf.write("#$ FEATURE rRNA\nconcatenated_genome_0 " +
+                       "concatenated_genome_0_0:concatenated_genome_0_1\n" +
+                       "concatenated_genome_0 concatenated_genome_0_3\n")
+        self.to_be_removed.append(loci_file)
+        gen = SeedGenome(
+            max_iterations=1,
+            genbank_path=self.ref_tiny_gb,
+            clustered_loci_txt=loci_file,
+            output_root=self.test_dir,
+            logger=logger)
+        for path in [gen.final_long_reads_dir] + \
+                [x.mapping_subdir for x in gen.iter_mapping_list]:
+            self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        gen.loci_clusters = parse_clustered_loci_file(
+            filepath=gen.clustered_loci_txt,
+            gb_filepath=gen.genbank_path,
+            output_root=self.test_dir,
+            circular=True,
+            logger=logger)
+        add_coords_to_clusters(seedGenome=gen, logger=logger)
+        gen.pad_genbank(pad=6000, circular=True, logger=logger)
+        gen.next_reference_path = gen.ref_fasta
+        for clu in gen.loci_clusters:
+            set_global_coords(clu, flank=10000, logger=logger)
+            prepare_next_mapping(cluster=clu, seedGenome=gen,
+                                 samtools_exe="samtools", flank=10000,
+                                 write_seed=False, logger=logger)
+            self.addCleanup(shutil.rmtree,
+                            os.path.join(self.test_dir, clu.cluster_dir_name))
+        write_seed_sequences(gen.loci_clusters, gen, logger=logger)
+        with open(self.ref_tiny_gb, "r") as gbf:
+            seq = str(next(SeqIO.parse(gbf, "genbank")).seq)
+        padded = seq[-6000:] + seq + seq[:6000]
+        for clu in gen.loci_clusters:
+            with open(clu.mappings[-1].ref_fasta, "r") as inf:
+                seed = next(SeqIO.parse(inf, "fasta"))
+            self.assertEqual(
+                str(seed.seq),
+                padded[clu.global_start_coord: clu.global_end_coord])
+            self.assertEqual(
+                str(seed.seq),
+                clu.seq_record.seq[clu.global_start_coord:
+                                   clu.global_end_coord])
+        # the first cluster's 5' flank runs across the origin
+        self.assertTrue(gen.loci_clusters[0].global_start_coord < 6000)
+        for name in ["scannedScaffolds.fasta",
+                     "scannedScaffolds_padded.fasta"]:
+            self.to_be_removed.extend([os.path.join(self.test_dir, name),
+                                       os.path.join(self.test_dir,
+                                                    name + ".fai")])
+
     def test_purge_old_files(self):
         gen = SeedGenome(
             max_iterations=1,
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import unittest
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboArchive import archive_directories, IntermediateArchive
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboArchiveTestCase(unittest.TestCase):
+    """ tests for riboArchive.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboArchive_tests")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.dirs = []
+        for index in [1, 2]:
+            for kind in ["mapping", "assembly"]:
+                path = os.path.join(
+                    self.test_dir, "cluster_%i" % index,
+                    "cluster_%i_%s_iteration_0" % (index, kind))
+                os.makedirs(os.path.join(path, "K21"))
+                with open(os.path.join(path, "contigs.fasta"), "w") as f:
+                    f.write(">c%i_%s\nACGT\n" % (index, kind))
+                with open(os.path.join(path, "K21", "reads.bam"), "wb") as f:
+                    f.write(b"\x1f\x8b" + bytes(range(256)))
+                self.dirs.append((index, 0, kind, path))
+
+    def test_archive_and_read(self):
+        """ archived dirs are removed, apart from files still needed, and
+        single files can be read back
+        """
+        keep = os.path.join(self.dirs[1][3], "contigs.fasta")
+        archive_path = os.path.join(self.test_dir, "iteration_0.zip")
+        manifest = archive_directories(
+            archive_path=archive_path, root=self.test_dir, dirs=self.dirs,
+            keep=[keep, None], logger=logger)
+        self.assertEqual(len(manifest["directories"]), 4)
+        for index, iteration, kind, path in self.dirs:
+            if path == self.dirs[1][3]:
+                self.assertEqual(os.listdir(path), ["contigs.fasta"])
+            else:
+                self.assertFalse(os.path.exists(path))
+        with IntermediateArchive(archive_path) as archive:
+            self.assertEqual(len(archive.files()), 8)
+            self.assertEqual(
+                archive.files(cluster=2, kind="assembly"),
+                ["cluster_2/cluster_2_assembly_iteration_0/contigs.fasta",
+                 "cluster_2/cluster_2_assembly_iteration_0/K21/reads.bam"])
+            with archive.open(archive.files(cluster=2)[0]) as inf:
+                self.assertEqual(inf.read(), b">c2_mapping\nACGT\n")
+            outdir = os.path.join(self.test_dir, "extracted")
+            extracted = archive.extract(outdir, cluster=1)
+            self.assertEqual(len(extracted), 4)
+            with open(os.path.join(
+                    outdir, "cluster_1", "cluster_1_mapping_iteration_0",
+                    "K21", "reads.bam"), "rb") as inf:
+                self.assertEqual(inf.read(), b"\x1f\x8b" + bytes(range(256)))
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
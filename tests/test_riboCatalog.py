@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import unittest
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboCatalog import RunCatalog, query_catalog, QUERIES, \
+    format_table, requested_catalog_path
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboCatalogTestCase(unittest.TestCase):
+    """ tests for riboCatalog.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboCatalog_tests")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.db = os.path.join(self.test_dir, "catalog.sqlite")
+
+    def add_run(self, sample, growth):
+        catalog = RunCatalog(path=self.db, logger=logger)
+        catalog.start_run(sample=sample, reference="ref.gb",
+                          output_root=self.test_dir, version="0.0.0",
+                          command="riboSeed.py")
+        catalog.record("mapping", iteration=0, elapsed=1.5, map_percent=90.0)
+        catalog.record_depths(0, [(1, 20.0, 30.0), (2, 5.0, 6.0)])
+        catalog.record_watched(
+            "subassembly",
+            [{"elapsed": 10, "returncode": 0, "peak_rss": 2e9},
+             {"elapsed": 30, "returncode": 1, "peak_rss": 4e9}],
+            iteration=0, clusters=[1, 2])
+        for index, code in [(1, 0), (2, 3)]:
+            catalog.record("evaluation", iteration=0, cluster=index,
+                           returncode=code, seed_len=5000, ref_len=5000,
+                           contig_len=5000 + growth)
+        catalog.record_assembly_stats("de_fere_novo", [("N50", 80403)])
+        catalog.finish_run()
+        return catalog
+
+    def test_catalog_records(self):
+        catalog = self.add_run("ecoli", growth=100)
+        columns, rows = query_catalog(
+            self.db, "SELECT cluster, depth_5, depth_3 FROM run_records " +
+            "WHERE stage = 'depth' AND run_id = ? ORDER BY cluster",
+            (catalog.run_id,))
+        self.assertEqual(rows, [(1, 20.0, 30.0), (2, 5.0, 6.0)])
+        columns, rows = query_catalog(
+            self.db, "SELECT status, finished IS NOT NULL FROM runs")
+        self.assertEqual(rows, [("done", 1)])
+        columns, rows = query_catalog(
+            self.db, "SELECT value FROM assembly_stats WHERE field = 'N50'")
+        self.assertEqual(rows, [("80403",)])
+
+    def test_canned_queries(self):
+        """ runs from several samples can be compared in one query
+        """
+        self.add_run("ecoli", growth=100)
+        self.add_run("ecoli", growth=300)
+        self.add_run("kleb", growth=10)
+        columns, rows = query_catalog(self.db, QUERIES["iterations"],
+                                      (None,))
+        self.assertEqual(columns[:5],
+                         ["sample", "iteration", "runs", "clusters", "kept"])
+        self.assertEqual([x[:6] for x in rows],
+                         [("ecoli", 0, 2, 4, 2, 200.0),
+                          ("kleb", 0, 1, 2, 1, 10.0)])
+        columns, rows = query_catalog(self.db, QUERIES["stages"],
+                                      ("kleb",))
+        by_stage = {x[0]: x for x in rows}
+        self.assertEqual(by_stage["subassembly"][1:6],
+                         (2, 1, 20.0, 30.0, 4.0))
+        lines = format_table(*query_catalog(self.db, QUERIES["runs"],
+                                            (None,)))
+        self.assertEqual(len(lines), 4)
+
+    def test_disabled_catalog(self):
+        catalog = RunCatalog(path=self.db, enabled=False, logger=logger)
+        catalog.start_run(sample="x", reference="ref.gb", output_root="",
+                          version="0.0.0", command="")
+        catalog.record("mapping", iteration=0, elapsed=1.0)
+        catalog.finish_run()
+        self.assertFalse(os.path.exists(self.db))
+
+    def test_catalog_opt_in(self):
+        """ runs are only catalogued when asked to, and the first status
+        set on the way out is kept
+        """
+        saved = os.environ.pop("RIBOSEED_CATALOG", None)
+        try:
+            self.assertIsNone(requested_catalog_path(None))
+            self.assertEqual(requested_catalog_path(self.db), self.db)
+            os.environ["RIBOSEED_CATALOG"] = self.db
+            self.assertEqual(requested_catalog_path(None), self.db)
+        finally:
+            os.environ.pop("RIBOSEED_CATALOG", None)
+            if saved is not None:
+                os.environ["RIBOSEED_CATALOG"] = saved
+        catalog = RunCatalog(path=self.db, logger=logger)
+        catalog.start_run(sample="x", reference="ref.gb", output_root="",
+                          version="0.0.0", command="")
+        catalog.finish_run(status="failed")
+        catalog.finish_run()
+        columns, rows = query_catalog(
+            self.db, "SELECT status FROM runs WHERE run_id = ?",
+            (catalog.run_id,))
+        self.assertEqual(rows, [("failed",)])
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
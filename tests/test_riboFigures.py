@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import unittest
+
+from collections import Counter
+
+try:
+    import matplotlib
+    PLOT = True
+except ImportError:
+    PLOT = False
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboFigures import summarize_score_counts, FigureService
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboFiguresTestCase(unittest.TestCase):
+    """ tests for riboFigures.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboFigures_tests")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.scores = [60] * 50 + [40] * 30 + [12] * 20 + [3]
+
+    def test_summarize_score_counts(self):
+        """ the thinned curve follows the sorted scores
+        """
+        summary = summarize_score_counts(Counter(self.scores), bins=10,
+                                         npoints=1000)
+        self.assertEqual(summary["n"], len(self.scores))
+        self.assertEqual(sum(summary["hist_counts"]), len(self.scores))
+        self.assertEqual(summary["sorted_scores"],
+                         sorted(self.scores, reverse=True))
+        thinned = summarize_score_counts(Counter(self.scores), npoints=11)
+        self.assertEqual(thinned["sorted_index"],
+                         list(range(0, 101, 10)))
+        self.assertEqual(thinned["sorted_scores"],
+                         [sorted(self.scores, reverse=True)[x]
+                          for x in range(0, 101, 10)])
+        self.assertEqual(summarize_score_counts({}), {"n": 0})
+
+    @unittest.skipIf(not PLOT, "matplotlib is not installed")
+    def test_figure_service(self):
+        basename = os.path.join(self.test_dir, "AS_score_plot")
+        figures = FigureService(logger=logger)
+        figures.submit("as_scores",
+                       summary=summarize_score_counts(Counter(self.scores)),
+                       score_min=30, basename=basename)
+        figures.close(timeout=120)
+        self.assertTrue(os.path.exists(basename + ".png"))
+        self.assertTrue(os.path.exists(basename + ".pdf"))
+
+    def test_disabled_service(self):
+        figures = FigureService(enabled=False, logger=logger)
+        self.assertIsNone(figures.process)
+        figures.submit("as_scores", summary={"n": 0}, score_min=30,
+                       basename=os.path.join(self.test_dir, "nope"))
+        figures.close()
+        self.assertEqual(os.listdir(self.test_dir), [])
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
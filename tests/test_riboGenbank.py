@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import json
+import unittest
+from Bio import SeqIO
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboGenbank import open_genbank_cache, genbank_hash, \
+    default_cache_dir, CACHE_VERSION, \
+    FeatureIndex, GenbankFeature, IndexedFasta, SequenceMetadataCache, \
+    sequence_metadata
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboGenbankTestCase(unittest.TestCase):
+    """ tests for riboGenbank.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboGenbank_tests")
+        self.ref_gb = os.path.join(os.path.dirname(__file__), "references",
+                                   "scannedScaffolds.gb")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        with open(self.ref_gb, "r") as inf:
+            self.rec = next(SeqIO.parse(inf, "genbank"))
+
+    def test_cache_matches_genbank(self):
+        cache = open_genbank_cache(self.ref_gb, cache_dir=self.test_dir,
+                                   logger=logger)
+        self.assertEqual(os.path.basename(cache.path),
+                         genbank_hash(self.ref_gb))
+        self.assertEqual(cache.ids, [self.rec.id])
+        self.assertEqual(cache.length(self.rec.id), len(self.rec))
+        self.assertEqual(cache.seq(self.rec.id), str(self.rec.seq))
+        self.assertEqual(cache.seq(self.rec.id, 5000, 5061),
+                         str(self.rec.seq[5000:5061]))
+        rrnas = cache.record_features(self.rec.id, feature="rRNA")
+        self.assertEqual(
+            [(x.start, x.end, x.locus_tag, x.product) for x in rrnas],
+            [(int(x.location.start), int(x.location.end),
+              x.qualifiers["locus_tag"][0], x.qualifiers["product"][0])
+             for x in self.rec.features if x.type == "rRNA"])
+        seq_record = cache.seq_record(self.rec.id)
+        self.assertIs(seq_record, cache.seq_record(self.rec.id))
+        self.assertEqual(len(seq_record.features), len(self.rec.features))
+        with self.assertRaises(ValueError):
+            cache.seq_record("not_a_record")
+        cache.close()
+
+    def test_cache_reused_and_written(self):
+        cache = open_genbank_cache(self.ref_gb, cache_dir=self.test_dir,
+                                   logger=logger)
+        meta = os.path.join(cache.path, "meta.json")
+        mtime = os.path.getmtime(meta)
+        again = open_genbank_cache(self.ref_gb, cache_dir=self.test_dir,
+                                   logger=logger)
+        self.assertEqual(again.path, cache.path)
+        self.assertEqual(os.path.getmtime(meta), mtime)
+        self.assertEqual(len(os.listdir(self.test_dir)), 1)
+        outfa = os.path.join(self.test_dir, "padded.fasta")
+        self.assertEqual(again.write_padded_fasta(outfa, pad=100), 1)
+        padded = next(SeqIO.parse(outfa, "fasta"))
+        self.assertEqual(str(padded.seq),
+                         str(self.rec.seq[-100:] + self.rec.seq +
+                             self.rec.seq[:100]))
+
+    def test_cache_versions_and_dirs(self):
+        """ caches from another version are rebuilt, and caches are only
+        shared between runs when asked for
+        """
+        cache = open_genbank_cache(self.ref_gb, cache_dir=self.test_dir,
+                                   logger=logger)
+        meta = os.path.join(cache.path, "meta.json")
+        with open(meta, "r") as inf:
+            old = json.load(inf)
+        self.assertEqual(old["version"], CACHE_VERSION)
+        del old["version"]
+        with open(meta, "w") as outf:
+            json.dump(old, outf)
+        again = open_genbank_cache(self.ref_gb, cache_dir=self.test_dir,
+                                   logger=logger)
+        self.assertEqual(again.meta["version"], CACHE_VERSION)
+        self.assertEqual(again.seq(self.rec.id), str(self.rec.seq))
+        self.assertEqual(os.listdir(self.test_dir), [os.path.basename(
+            again.path)])
+        saved = os.environ.pop("RIBOSEED_GENBANK_CACHE", None)
+        try:
+            self.assertEqual(default_cache_dir(self.test_dir),
+                             os.path.join(self.test_dir, "genbank_cache"))
+            self.assertEqual(default_cache_dir(), default_cache_dir())
+            os.environ["RIBOSEED_GENBANK_CACHE"] = self.test_dir
+            self.assertEqual(default_cache_dir("elsewhere"), self.test_dir)
+        finally:
+            os.environ.pop("RIBOSEED_GENBANK_CACHE", None)
+            if saved is not None:
+                os.environ["RIBOSEED_GENBANK_CACHE"] = saved
+
+    def test_feature_index(self):
+        cache = open_genbank_cache(self.ref_gb, cache_dir=self.test_dir,
+                                   logger=logger)
+        index = cache.feature_index(self.rec.id)
+        self.assertEqual(index.locus("concatenated_genome_0_1"),
+                         (6987, 9887, 1, "rRNA",
+                          ["23S", "ribosomal", "RNA"]))
+        self.assertIsNone(index.locus("not_a_tag"))
+        self.assertEqual(
+            [x.locus_tag for x in index.overlapping(6000, 7000, "rRNA")],
+            ["concatenated_genome_0_0", "concatenated_genome_0_1"])
+        self.assertEqual(index.overlapping(6538, 6987), [])
+
+    def test_feature_index_windows(self):
+        """ window queries agree with checking every feature, including
+        for features nested inside longer ones
+        """
+        spans = [(0, 100), (10, 20), (15, 500), (30, 40), (200, 210),
+                 (205, 206), (450, 460), (600, 700)]
+        feats = [GenbankFeature(record_id="r", index=i, type="gene",
+                                start=a, end=b, strand=1,
+                                locus_tag="t%i" % i, product=None)
+                 for i, (a, b) in enumerate(spans)]
+        index = FeatureIndex(feats)
+        for start, end in [(0, 1), (25, 35), (100, 200), (207, 208),
+                           (460, 600), (699, 1000), (700, 800)]:
+            self.assertEqual(
+                sorted([x.index for x in index.overlapping(start, end)]),
+                [x.index for x in feats if x.start < end and x.end > start])
+
+    def test_feature_index_locus_by_type(self):
+        """ a locus tag shared by features of different types is looked
+        up among the requested types only
+        """
+        feats = [GenbankFeature(record_id="r", index=i, type=kind,
+                                start=a, end=b, strand=1, locus_tag="t1",
+                                product=product)
+                 for i, (kind, a, b, product) in enumerate(
+                     [("rRNA", 10, 100, "16S ribosomal RNA"),
+                      ("gene", 5, 105, None)])]
+        index = FeatureIndex(feats)
+        self.assertEqual(index.locus_feature("t1").type, "gene")
+        self.assertEqual(index.locus_feature("t1", "rRNA").index, 0)
+        self.assertEqual(index.locus("t1", "rRNA"),
+                         (10, 100, 1, "rRNA", ["16S", "ribosomal", "RNA"]))
+        self.assertIsNone(index.locus_feature("t1", "tRNA"))
+
+    def test_genome_views(self):
+        """ padded views slice like the padded sequence they replace,
+        including across the origin
+        """
+        seq = "".join(["ACGTTGCA"[(i * 7) % 8] for i in range(250)])
+        fasta = os.path.join(self.test_dir, "genome.fasta")
+        with open(fasta, "w") as outf:
+            outf.write(">chrom description\n")
+            for i in range(0, len(seq), 60):
+                outf.write(seq[i: i + 60] + "\n")
+        genome = IndexedFasta(fasta)
+        self.assertTrue(os.path.exists(fasta + ".fai"))
+        view = genome.view()
+        self.assertEqual((view.id, len(view)), ("chrom", 250))
+        self.assertEqual(str(view), seq)
+        self.assertEqual(view.seq[55:125], seq[55:125])
+        padded = view.padded(30)
+        padded_seq = seq[-30:] + seq + seq[:30]
+        self.assertEqual(len(padded), len(padded_seq))
+        self.assertIs(padded.fasta, genome)
+        for start, end in [(0, 10), (20, 40), (0, 310), (270, 310),
+                           (275, 400), (-5, None), (100, 100)]:
+            self.assertEqual(padded[start:end], padded_seq[start:end])
+        self.assertEqual(padded[3], padded_seq[3])
+        self.assertEqual(padded.padded(10)[0:50],
+                         (seq[-40:] + seq + seq[:40])[0:50])
+
+    def test_sequence_metadata_cache(self):
+        """ recorded files arent parsed again, unless they change
+        """
+        fasta = os.path.join(self.test_dir, "seed.fasta")
+        with open(fasta, "w") as outf:
+            outf.write(">seed_cluster_1\nACGTACGT\nAC\n>other\nGG\n")
+        cache = SequenceMetadataCache()
+        meta = cache.record(fasta, sequence_metadata("seed_cluster_1",
+                                                     "ACGTACGTAC"))
+        self.assertEqual(cache.get(fasta), meta)
+        self.assertEqual(cache.parsed, 0)
+        copied = os.path.join(self.test_dir, "copy.fasta")
+        self.assertEqual(cache.copy(fasta, copied), meta)
+        self.assertEqual(cache.length(copied), 10)
+        self.assertEqual(cache.parsed, 0)
+        # a fresh cache parses the file, and agrees
+        self.assertEqual(SequenceMetadataCache().get(copied), meta)
+        with open(fasta, "w") as outf:
+            outf.write(">rewritten\nACG\n")
+        self.assertEqual(cache.get(fasta).id, "rewritten")
+        self.assertEqual(cache.length(fasta), 3)
+        self.assertEqual(cache.parsed, 1)
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import os
+import unittest
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboMappers import get_mapper_backend, BwaBackend, \
+    SmaltBackend, Minimap2Backend
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboMappersTestCase(unittest.TestCase):
+    """ tests for riboMappers.py
+    """
+    def test_get_backend(self):
+        self.assertIsInstance(get_mapper_backend("bwa", exe="bwa"),
+                              BwaBackend)
+        self.assertIsInstance(get_mapper_backend("minimap2", exe="mm2"),
+                              Minimap2Backend)
+        with self.assertRaises(ValueError):
+            get_mapper_backend("bowtie", exe="bowtie2")
+
+    def test_bwa_cmds(self):
+        bwa = get_mapper_backend("bwa", exe="bwa")
+        self.assertEqual(bwa.index_cmd("ref.fasta"), "bwa index ref.fasta")
+        self.assertEqual(
+            bwa.map_cmd("ref.fasta", ["f.fq", "r.fq"], cores=4),
+            "bwa mem -t 4 -L 0,0 -U 0 -a -k 15 ref.fasta f.fq r.fq")
+        self.assertEqual(
+            get_mapper_backend("bwa", exe="bwa", add_args="-a").map_cmd(
+                "ref.fasta", ["s.fq"], cores=1),
+            "bwa mem -t 1 -a -k 15 ref.fasta s.fq")
+
+    def test_smalt_cmds(self):
+        smalt = get_mapper_backend("smalt", exe="smalt")
+        self.assertEqual(smalt.index_cmd("ref.fasta"),
+                         "smalt index -k 5 -s 3 ref.fasta ref.fasta")
+        self.assertEqual(
+            smalt.map_cmd("ref.fasta", ["f.fq", "r.fq"], cores=2,
+                          score_min=75, insert_dist="dist.txt"),
+            "smalt map -l pe -S match=1,subst=-4,gapopen=-4,gapext=-3 " +
+            "-m 75 -n 2 -g dist.txt -f bam ref.fasta f.fq r.fq")
+
+    def test_minimap2_cmds(self):
+        mm2 = get_mapper_backend("minimap2", exe="minimap2")
+        self.assertEqual(mm2.index_cmd("ref.fasta"),
+                         "minimap2 -x sr -d ref.fasta.mmi ref.fasta")
+        self.assertEqual(
+            mm2.map_cmd("ref.fasta", ["f.fq", "r.fq"], cores=3),
+            "minimap2 -ax sr -t 3 ref.fasta.mmi f.fq r.fq")
+
+    def test_score_semantics(self):
+        """ bwa and minimap2 are filtered afterwards, on their own score
+        scales; smalt filters as it maps, more strictly each iteration
+        """
+        bwa = get_mapper_backend("bwa", exe="bwa")
+        mm2 = get_mapper_backend("minimap2", exe="minimap2")
+        smalt = get_mapper_backend("smalt", exe="smalt")
+        self.assertEqual(bwa.score_minimum(readlen=150), 75)
+        self.assertEqual(bwa.score_minimum(readlen=60), 50)
+        self.assertEqual(mm2.score_minimum(readlen=150), 150)
+        self.assertEqual(bwa.score_minimum(readlen=150, score_min=20), 20)
+        self.assertEqual(bwa.filter_score(75), 75)
+        self.assertEqual(smalt.score_minimum(readlen=150, iteration=0), 75)
+        self.assertEqual(smalt.score_minimum(readlen=150, iteration=1), 100)
+        self.assertIsNone(smalt.filter_score(75))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import gzip
+import random
+import unittest
+
+import numpy as np
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboReadStore import pack_bases, unpack_bases, \
+    build_read_store, store_is_current, open_or_build_read_store, \
+    open_shared_read_store, read_store_key, ReadStore
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboReadStoreTestCase(unittest.TestCase):
+    """ tests for riboReadStore.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboReadStore_tests")
+        self.store_dir = os.path.join(self.test_dir, "store")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        random.seed(33)
+        self.reads = []
+        for i in range(57):
+            length = random.randint(30, 151)
+            seq = "".join(random.choice("ACGT") for _ in range(length))
+            if i % 5 == 0:
+                seq = seq[:10] + "N" + seq[11:]
+            qual = "".join(chr(random.randint(2, 41) + 33)
+                           for _ in range(length))
+            self.reads.append(("read%i" % i, seq, qual))
+        self.fq1 = os.path.join(self.test_dir, "r1.fq")
+        self.fq2 = os.path.join(self.test_dir, "r2.fq.gz")
+        with open(self.fq1, "w") as outf:
+            for name, seq, qual in self.reads:
+                outf.write("@%s extra\n%s\n+\n%s\n" % (name, seq, qual))
+        with gzip.open(self.fq2, "wt") as outf:
+            for name, seq, qual in self.reads[0:20]:
+                outf.write("@%s\n%s\n+\n%s\n" % (name, seq, qual))
+
+    def test_pack_roundtrip(self):
+        codes = np.array([0, 1, 2, 3, 3, 2, 1, 0], dtype=np.uint8)
+        packed = pack_bases(codes)
+        self.assertEqual(len(packed), 2)
+        self.assertTrue(np.array_equal(unpack_bases(packed), codes))
+
+    def test_store_roundtrip(self):
+        """ bases (including N's) come back exactly, qualities binned
+        """
+        store = build_read_store(
+            self.store_dir, [("readF", self.fq1), ("readR", self.fq2)],
+            chunk_reads=7, logger=logger)
+        self.assertEqual(store.libraries(), ["readF", "readR"])
+        self.assertEqual(store.count_reads("readF"), 57)
+        self.assertEqual(store.count_reads("readR"), 20)
+        self.assertEqual(store.lib_range("readR"), (57, 77))
+        for idx, (name, seq, qual) in enumerate(self.reads):
+            self.assertEqual(store.names[idx], name)
+            self.assertEqual(store.get_seq(idx), seq)
+            self.assertEqual(len(store.get_qual(idx)), len(qual))
+        self.assertEqual(store.get_seq(57 + 3), self.reads[3][1])
+        # binned qualities never stray far from the originals
+        binned = [ord(x) - 33 for x in store.get_qual(1)]
+        orig = [ord(x) - 33 for x in self.reads[1][2]]
+        self.assertTrue(all(abs(a - b) <= 5 for a, b in
+                            zip(binned, orig) if b >= 2))
+        self.assertAlmostEqual(
+            store.mean_read_length("readR", N=10),
+            np.mean([len(x[1]) for x in self.reads[0:10]]))
+
+    def test_write_subset(self):
+        store = build_read_store(self.store_dir, [("readF", self.fq1)])
+        idxs = store.subsample(10, lib="readF", seed=1)
+        self.assertEqual(len(idxs), 10)
+        self.assertEqual(list(idxs), sorted(set(idxs)))
+        out = os.path.join(self.test_dir, "subset.fq")
+        self.assertEqual(store.write_fastq(out, indexes=idxs), 10)
+        with open(out, "r") as inf:
+            lines = inf.read().splitlines()
+        self.assertEqual(len(lines), 40)
+        self.assertEqual(lines[0], "@" + self.reads[idxs[0]][0])
+        self.assertEqual(lines[1], self.reads[idxs[0]][1])
+
+    def test_stale_store_rebuilt(self):
+        """ a store is only reused while its sources are unchanged
+        """
+        fastqs = [("readF", self.fq1)]
+        self.assertFalse(store_is_current(self.store_dir, fastqs))
+        open_or_build_read_store(self.store_dir, fastqs, logger=logger)
+        self.assertTrue(store_is_current(self.store_dir, fastqs))
+        self.assertFalse(store_is_current(
+            self.store_dir, [("readF", self.fq1), ("readR", self.fq2)]))
+        with open(self.fq1, "a") as outf:
+            outf.write("@extra\nACGT\n+\nIIII\n")
+        self.assertFalse(store_is_current(self.store_dir, fastqs))
+        store = open_or_build_read_store(self.store_dir, fastqs,
+                                         logger=logger)
+        self.assertEqual(store.n_reads, 58)
+        self.assertEqual(ReadStore(self.store_dir).get_seq(57), "ACGT")
+
+    def test_shared_store_reused(self):
+        """ a shared store is found again by the contents of the reads,
+        even after they move, and not for different reads
+        """
+        fastqs = [("readF", self.fq1), ("readR", self.fq2)]
+        store = open_shared_read_store(self.store_dir, fastqs, logger=logger)
+        self.assertEqual(os.path.basename(store.path),
+                         read_store_key(fastqs))
+        moved = os.path.join(self.test_dir, "moved_1.fq")
+        os.rename(self.fq1, moved)
+        again = open_shared_read_store(
+            self.store_dir, [("readF", moved), ("readR", self.fq2)],
+            logger=logger)
+        self.assertEqual(again.path, store.path)
+        # reused, not packed again
+        self.assertEqual(again.meta["libraries"][0]["source"]["path"],
+                         os.path.abspath(self.fq1))
+        self.assertEqual(len(os.listdir(self.store_dir)), 1)
+        open_shared_read_store(self.store_dir, [("readF", moved)],
+                               logger=logger)
+        self.assertEqual(len(os.listdir(self.store_dir)), 2)
+
+    def test_shared_store_restamped(self):
+        """ a shared store whose reads have the same key but a new
+        mtime is rebuilt alongside and renamed into place, leaving runs
+        that already opened it able to read it
+        """
+        fastqs = [("readF", self.fq1)]
+        store = open_shared_read_store(self.store_dir, fastqs, logger=logger)
+        stat = os.stat(self.fq1)
+        os.utime(self.fq1, (stat.st_atime, stat.st_mtime + 100))
+        self.assertFalse(store_is_current(store.path, fastqs,
+                                          key=read_store_key(fastqs)))
+        again = open_shared_read_store(self.store_dir, fastqs, logger=logger)
+        self.assertEqual(again.path, store.path)
+        self.assertEqual(again.meta["libraries"][0]["source"]["mtime"],
+                         stat.st_mtime + 100)
+        self.assertEqual(os.listdir(self.store_dir),
+                         [read_store_key(fastqs)])
+        self.assertEqual(store.get_seq(3), self.reads[3][1])
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import random
+import unittest
+
+import numpy as np
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import IUPAC
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboRefSelect import sequence_kmer_hashes, sketch_sequences, \
+    sketch_reads, SketchDB, write_ranking
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+def revcomp(seq):
+    return str(Seq(seq).reverse_complement())
+
+
+class riboRefSelectTestCase(unittest.TestCase):
+    """ tests for riboRefSelect.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboRefSelect_tests")
+        self.ref_gb = os.path.join(os.path.dirname(__file__),
+                                   "references", "scannedScaffolds.gb")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.ref_seq = str(next(SeqIO.parse(self.ref_gb, "genbank")).seq)
+        random.seed(27)
+        self.other_gb = os.path.join(self.test_dir, "random_genome.gb")
+        SeqIO.write(SeqRecord(
+            Seq("".join(random.choice("ACGT") for _ in range(50000)),
+                IUPAC.IUPACAmbiguousDNA()),
+            id="random", name="random"), self.other_gb, "genbank")
+
+    def test_canonical_hashes(self):
+        """ a sequence and its reverse complement give the same k-mers
+        """
+        seq = self.ref_seq[0:500]
+        fwd = sequence_kmer_hashes(seq, k=15)
+        rev = sequence_kmer_hashes(revcomp(seq), k=15)
+        self.assertEqual(len(fwd), 500 - 15 + 1)
+        self.assertTrue(np.array_equal(np.sort(fwd), np.sort(rev)))
+
+    def test_ambiguous_bases_break_kmers(self):
+        """ no window spanning an N is hashed
+        """
+        hashes = sequence_kmer_hashes("ACGTACGTAC" + "N" + "ACGTACGTAC", k=5)
+        self.assertEqual(len(hashes), 6 + 6)
+        self.assertEqual(len(sequence_kmer_hashes("ACG", k=5)), 0)
+
+    def test_db_roundtrip(self):
+        """ saving and loading keeps the sketches and settings
+        """
+        db = SketchDB(k=17, scaled=100)
+        db.add_genbank(self.ref_gb)
+        db.add_genbank(self.other_gb)
+        # adding the same file again replaces rather than duplicates
+        db.add_genbank(self.other_gb)
+        self.assertEqual(len(db.refs), 2)
+        dbpath = os.path.join(self.test_dir, "db.npz")
+        db.save(dbpath)
+        loaded = SketchDB.load(dbpath)
+        self.assertEqual((loaded.k, loaded.scaled), (17, 100))
+        self.assertEqual(loaded.refs, db.refs)
+        for a, b in zip(loaded.sketches, db.sketches):
+            self.assertTrue(np.array_equal(a, b))
+        self.assertTrue(np.array_equal(
+            db.sketches[0],
+            sketch_sequences([self.ref_seq], k=17, scaled=100)))
+
+    def test_rank_reads(self):
+        """ reads drawn from one reference rank it first
+        """
+        fastq = os.path.join(self.test_dir, "reads.fq")
+        with open(fastq, "w") as outf:
+            for idx, start in enumerate(
+                    range(0, len(self.ref_seq) - 100, 20)):
+                read = self.ref_seq[start: start + 100]
+                if idx % 2:
+                    read = revcomp(read)
+                outf.write("@r{0}\n{1}\n+\n{2}\n".format(
+                    idx, read, "I" * len(read)))
+        db = SketchDB(k=21, scaled=50)
+        db.add_genbank(self.other_gb)
+        db.add_genbank(self.ref_gb)
+        query, nreads = sketch_reads([fastq], k=21, scaled=50,
+                                     min_count=2, logger=logger)
+        self.assertEqual(nreads, len(range(0, len(self.ref_seq) - 100, 20)))
+        results = db.rank(query)
+        self.assertEqual(results[0]["name"], "scannedScaffolds")
+        self.assertGreater(results[0]["containment"], .95)
+        self.assertLess(results[1]["containment"], .05)
+        outfile = os.path.join(self.test_dir, "ranking.tsv")
+        write_ranking(results, outfile)
+        with open(outfile, "r") as inf:
+            lines = inf.readlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("1\tscannedScaffolds\t"))
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,10 +9,15 @@ import logging
 import shutil
 # import subprocess
 import os
+import time
+import random
+import tempfile
 import unittest
-# import multiprocessing
+import pysam
+import multiprocessing
 
 from Bio import SeqIO
+from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 from argparse import Namespace
 
@@ -36,13 +41,23 @@ from riboSeed.riboSeed import SeedGenome, NgsLib, LociMapping, Exes, \
     decide_proceed_to_target, get_rec_from_generator, \
     check_kmer_vs_reads, make_samtools_depth_cmds, \
     parse_samtools_depth_results, make_modest_spades_cmd, get_bam_AS, \
-    pysam_extract_reads
+    pysam_extract_reads, get_mapping_cache_key, fetch_cached_mapping, \
+    store_cached_mapping, split_cores_by_size, merge_filter_bams, \
+    wait_for_pool_results, get_flank_depths, \
+    MappingStats, dedup_bam, read_seed_library, match_seed_library, \
+    predict_flank_depths, get_spacer_length, keep_only_first_contig, \
+    seq_metadata, write_unmapped_reads
+from riboSeed.riboReadStore import build_read_store
+from riboSeed.riboWorker import shrink_spades_cmd, is_oom_failure, \
+    get_process_tree_rss, get_available_memory, \
+    subprocess_run_list_watched, get_straggler_timeout
 
 from riboSeed.riboSnag import parse_clustered_loci_file, \
     extract_coords_from_locus, stitch_together_target_regions, \
     prepare_prank_cmd, prepare_mafft_cmd, \
     calc_Shannon_entropy, plot_scatter_with_anno, \
-    profile_kmer_occurances, plot_pairwise_least_squares, make_msa
+    profile_kmer_occurances, plot_pairwise_least_squares, make_msa, \
+    LociCluster
 
 
 sys.dont_write_bytecode = True
@@ -286,6 +301,59 @@ class riboSeedShallow(unittest.TestCase):
                          "test_mappedreadS.fastq"), )
         self.assertEqual(cmd, cmd_ref)
 
+    def make_unmapped_test_lib(self):
+        """ a mapping whose singleton bam has one placed and one
+        unplaced read
+        """
+        testmapping = LociMapping(
+            name="test", iteration=0,
+            mapping_subdir=os.path.join(self.test_dir, "LociMapping"))
+        testlib = NgsLib(name="test", master=False,
+                         readS0=os.path.join(self.test_dir, "reads.fq"),
+                         ref_fasta=self.ref_fasta, logger=logger)
+        header = {"HD": {"VN": "1.0"},
+                  "SQ": [{"LN": 1000, "SN": "chr"}]}
+        with pysam.AlignmentFile(testmapping.s_map_bam, "wb",
+                                 header=header) as outbam:
+            for name, flag in [("placed", 0), ("unplaced", 4)]:
+                read = pysam.AlignedSegment()
+                read.query_name = name
+                read.query_sequence = "ACGTACGTAC"
+                read.flag = flag
+                read.reference_id = 0 if flag == 0 else -1
+                read.reference_start = 10 if flag == 0 else -1
+                read.cigartuples = [(0, 10)] if flag == 0 else None
+                read.query_qualities = pysam.qualitystring_to_array(
+                    "IIIIIIIIII")
+                outbam.write(read)
+        return testmapping, testlib
+
+    def test_write_unmapped_reads_cached(self):
+        """ without the mapper's bams (ie, a cached mapping), there are
+        no unmapped reads to write
+        """
+        testmapping, testlib = self.make_unmapped_test_lib()
+        os.unlink(testmapping.s_map_bam)
+        self.assertIsNone(write_unmapped_reads(
+            mapping_ob=testmapping, ngsLib=testlib,
+            samtools_exe=self.samtools_exe, logger=logger))
+
+    @unittest.skipIf(shutil.which("samtools") is None,
+                     "samtools executable not found, skipping." +
+                     "If this isnt an error from travis deployment, you " +
+                     "probably should install it")
+    def test_write_unmapped_reads(self):
+        """ only the reads that mapped nowhere are written
+        """
+        testmapping, testlib = self.make_unmapped_test_lib()
+        outfastq = write_unmapped_reads(
+            mapping_ob=testmapping, ngsLib=testlib,
+            samtools_exe=self.samtools_exe, logger=logger)
+        with open(outfastq, "r") as inf:
+            lines = inf.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0], "@unplaced")
+
     def test_generate_spades_cmds(self):
         """ can we make spades commands of various complexities
         """
@@ -705,7 +773,7 @@ class riboSeedShallow(unittest.TestCase):
         add_coords_to_clusters(seedGenome=gen, logger=logger)
 
         for clu in gen.loci_clusters:
-            clu.keep_contig = True
+            clu.keep_contigs = True
             clu.mappings.append(LociMapping(
                 name="test",
                 iteration=1,
@@ -883,6 +951,549 @@ class riboSeedShallow(unittest.TestCase):
             make_modest_spades_cmd(cmd=cmd, cores=3, memory=11,
                                    serialize=False, logger=logger))
 
+    def test_mapping_cache_key(self):
+        """ the mapping cache key should change with any input that
+        changes the iteration 0 mapping
+        """
+        cache_dir = os.path.join(self.test_dir, "map_cache_key")
+        os.makedirs(cache_dir, exist_ok=True)
+        reads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                                 "riboSeed", "integration_data")
+        testngs = NgsLib(
+            name="test", master=False,
+            readF=os.path.join(reads_dir, "test_reads1.fq"),
+            readR=os.path.join(reads_dir, "test_reads2.fq"),
+            ref_fasta=self.ref_fasta)
+        keys = [get_mapping_cache_key(
+            ngsLib=testngs, genome_fasta=self.ref_fasta, method="bwa",
+            mapper_args=margs, score_minimum=smin, cache_dir=cache_dir,
+            logger=logger) for margs, smin in
+            [("-L 0,0 -U 0 -a", None), ("-L 0,0 -U 0 -a", None),
+             ("-L 0,0 -U 0", None), ("-L 0,0 -U 0 -a", 60)]]
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(len(set(keys)), 3)
+        # file hashes are remembered between runs
+        self.assertTrue(os.path.exists(
+            os.path.join(cache_dir, "file_hashes.json")))
+        shutil.rmtree(cache_dir)
+
+    def test_mapping_cache_roundtrip(self):
+        """ store a mapping, and get back the same bam and stats
+        """
+        cache_dir = os.path.join(self.test_dir, "map_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        first = LociMapping(
+            name="first", iteration=0,
+            mapping_subdir=os.path.join(self.test_dir, "cache_first"))
+        second = LociMapping(
+            name="second", iteration=0,
+            mapping_subdir=os.path.join(self.test_dir, "cache_second"))
+        shutil.copyfile(os.path.join(self.ref_dir, "samtools_depth_test_files",
+                                     "newref_sorted.bam"),
+                        first.mapped_bam)
+        self.assertIsNone(fetch_cached_mapping(
+            cache_dir=cache_dir, key="abc", mapping_ob=second,
+            logger=logger))
+        stats = MappingStats()
+        stats.counts["total"], stats.counts["mapped"] = 200, 177
+        stats.as_counts.update([60, 50, 60, 33])
+        stats.write(first.mapping_stats_json)
+        store_cached_mapping(cache_dir=cache_dir, key="abc",
+                             mapping_ob=first, logger=logger)
+        percent, stats = fetch_cached_mapping(
+            cache_dir=cache_dir, key="abc", mapping_ob=second, logger=logger)
+        self.assertEqual(percent, 88.5)
+        self.assertEqual(stats.score_list(), [33, 50, 60, 60])
+        self.assertTrue(os.path.exists(second.mapping_stats_json))
+        self.assertEqual(md5(first.mapped_bam), md5(second.mapped_bam))
+        for d in [cache_dir, first.mapping_subdir, second.mapping_subdir]:
+            shutil.rmtree(d)
+
+    def test_split_cores_by_size(self):
+        """ cores are shared by library size, with at least one each
+        """
+        big = os.path.join(self.test_dir, "big.fq")
+        small = os.path.join(self.test_dir, "small.fq")
+        with open(big, "w") as outf:
+            outf.write("A" * 3000)
+        with open(small, "w") as outf:
+            outf.write("A" * 1000)
+        self.assertEqual(split_cores_by_size([[big], [small]], 8), [6, 2])
+        self.assertEqual(split_cores_by_size([[big, small], [small]], 5),
+                         [4, 1])
+        self.assertEqual(split_cores_by_size([[big], [small]], 2), [1, 1])
+        self.assertEqual(split_cores_by_size([[big], [small]], 1), [1, 1])
+        for f in [big, small]:
+            os.unlink(f)
+
+    def test_merge_filter_bams(self):
+        """ split a sorted bam in two and merge it back while filtering
+        """
+        inbam = os.path.join(self.ref_dir, "samtools_depth_test_files",
+                             "newref_sorted.bam")
+        parts = [os.path.join(self.test_dir, "part%i.bam" % i)
+                 for i in range(2)]
+        merged = os.path.join(self.test_dir, "merged.bam")
+        with pysam.AlignmentFile(inbam, "rb") as bam:
+            outs = [pysam.AlignmentFile(x, "wb", template=bam) for x in parts]
+            reads = list(bam.fetch(until_eof=True))
+            for idx, read in enumerate(reads):
+                outs[idx % 2].write(read)
+            for o in outs:
+                o.close()
+        stats = merge_filter_bams(inbams=parts, outbam=merged, score=None,
+                                  logger=logger)
+        self.assertEqual(stats.total, len(reads))
+        self.assertEqual(stats.mapped,
+                         len([x for x in reads if not x.is_unmapped]))
+        self.assertEqual(stats.libraries[0][0:2],
+                         [parts[0], (len(reads) + 1) // 2])
+        with pysam.AlignmentFile(merged, "rb") as bam:
+            merged_reads = list(bam.fetch(until_eof=True))
+        self.assertEqual(sorted([x.query_name for x in merged_reads]),
+                         sorted([x.query_name for x in reads]))
+        # still sorted, with the unplaced reads at the end
+        positions = [(x.reference_id % 1000, x.reference_start)
+                     for x in merged_reads]
+        self.assertEqual(positions, sorted(positions))
+        # now with a score minimum
+        scores = [x.get_tag("AS") for x in reads if x.reference_id >= 0]
+        stats = merge_filter_bams(inbams=parts, outbam=merged, score=30,
+                                  logger=logger)
+        self.assertEqual(stats.score_list(), sorted(scores))
+        self.assertEqual(stats.written, len([x for x in scores if x >= 30]))
+        for f in parts + [merged]:
+            os.unlink(f)
+
+    def test_spades_cmd_extra_singles(self):
+        """ additional single libraries get their own --s<#> option
+        """
+        testmapping = LociMapping(
+            name="test",
+            iteration=1,
+            assembly_subdir=self.test_dir,
+            ref_fasta=self.ref_fasta,
+            mapping_subdir=os.path.join(self.test_dir, "LociMapping"))
+        testngs = NgsLib(
+            name="test",
+            master=False,
+            readF=self.ref_Ffastq,
+            readR=self.ref_Rfastq,
+            readS0=self.ref_Rfastq,
+            readS1=[self.ref_Ffastq, self.ref_Rfastq],
+            ref_fasta=self.ref_fasta,
+            mapper_exe=self.smalt_exe)
+        self.assertEqual(testngs.liblist,
+                         [self.ref_Ffastq, self.ref_Rfastq, self.ref_Rfastq,
+                          self.ref_Ffastq, self.ref_Rfastq])
+        cmd = generate_spades_cmd(mapping_ob=testmapping, ngs_ob=testngs,
+                                  ref_as_contig=None,
+                                  as_paired=True, prelim=False,
+                                  spades_exe="spades.py",
+                                  logger=logger)
+        self.assertIn("--pe1-s {0} --s1 {1}  --s2 {0} ".format(
+            self.ref_Rfastq, self.ref_Ffastq), cmd)
+
+    def test_shrink_spades_cmd(self):
+        """ halve threads and memory, drop the biggest k-mer
+        """
+        cmd = "spades.py -t 4 -m 8 --careful -k 21,33,55 -o here"
+        self.assertEqual(shrink_spades_cmd(cmd),
+                         "spades.py -t 2 -m 4 --careful -k 21,33 -o here")
+        self.assertIsNone(shrink_spades_cmd(
+            "spades.py -t 1 -m 1 --careful -k 21 -o here"))
+        self.assertIsNone(shrink_spades_cmd("samtools fastq -t 4 x.bam"))
+        # only the SPAdes call is touched, even if paths mention spades
+        cmd = str("samtools sort -m 4G -o /spades_out/x.bam y.bam && " +
+                  "/opt/bin/spades.py -t 4 -m 8 -k 21,33 -o /spades_out")
+        self.assertEqual(
+            shrink_spades_cmd(cmd),
+            "samtools sort -m 4G -o /spades_out/x.bam y.bam && " +
+            "/opt/bin/spades.py -t 2 -m 4 -k 21 -o /spades_out")
+        self.assertIsNone(shrink_spades_cmd(
+            "samtools sort -m 4 -o spades_dir/x.bam y.bam"))
+        self.assertEqual(
+            shrink_spades_cmd("if [ -s a.fq ] ; then spades.py -t 4 " +
+                              "-o here ; else echo 'skipping' ; fi"),
+            "if [ -s a.fq ] ; then spades.py -t 2 " +
+            "-o here ; else echo 'skipping' ; fi")
+
+    def test_is_oom_failure(self):
+        self.assertTrue(is_oom_failure(137, ""))
+        self.assertTrue(is_oom_failure(-9, ""))
+        self.assertTrue(is_oom_failure(
+            1, "terminate called after throwing an instance of " +
+            "'std::bad_alloc'"))
+        self.assertFalse(is_oom_failure(1, "some other error"))
+        self.assertFalse(is_oom_failure(0, "out of memory"))
+
+    @unittest.skipIf(not os.path.isdir("/proc"), "needs /proc")
+    def test_process_tree_rss(self):
+        self.assertGreater(get_process_tree_rss(os.getpid()), 0)
+        self.assertIsNotNone(get_available_memory())
+
+    def test_watched_oom_retry(self):
+        """ a command that 'runs out of memory' until it is down to one
+        thread gets retried within the budget, and no further
+        """
+        fake_spades = os.path.join(self.test_dir, "spades.py")
+        with open(fake_spades, "w") as outf:
+            outf.write("#!/bin/sh\ncase \" $* \" in *' -t 1 '*) exit 0;; " +
+                       "*) exit 137;; esac\n")
+        os.chmod(fake_spades, 0o755)
+        self.to_be_removed.append(fake_spades)
+        cmd = "{0} -t 4 -m 8 -o here".format(fake_spades)
+        res = subprocess_run_list_watched(["true", cmd], oom_retries=2,
+                                          poll=.05)
+        self.assertEqual(res["returncode"], 0)
+        self.assertEqual(len(res["retries"]), 2)
+        self.assertIn("-t 1 -m 2", res["retries"][-1]["retry_cmd"])
+        res = subprocess_run_list_watched([cmd], oom_retries=1, poll=.05)
+        self.assertEqual(res["returncode"], 1)
+        self.assertEqual(len(res["retries"]), 1)
+        # non-memory failures are not retried
+        res = subprocess_run_list_watched(["exit 1 ; spades.py -t 4"],
+                                          oom_retries=2, poll=.05)
+        self.assertEqual((res["returncode"], res["retries"]), (1, []))
+
+    def test_parse_subassembly_return_code_4(self):
+        """ timed out clusters are dropped
+        """
+        clu = LociCluster(sequence_id="test", loci_list=[])
+        clu.assembly_success = 4
+        parse_subassembly_return_code(cluster=clu,
+                                      final_contigs_dir=self.test_dir,
+                                      logger=logger)
+        self.assertFalse(clu.continue_iterating)
+        self.assertFalse(clu.keep_contigs)
+
+    def test_get_straggler_timeout(self):
+        """ no limit until half the jobs are done, then factor * median
+        """
+        self.assertIsNone(get_straggler_timeout(
+            [10], njobs=4, factor=3, min_timeout=0))
+        self.assertEqual(get_straggler_timeout(
+            [10, 20], njobs=4, factor=3, min_timeout=0), 45)
+        self.assertEqual(get_straggler_timeout(
+            [10, 20, 30], njobs=4, factor=3, min_timeout=100), 100)
+        self.assertIsNone(get_straggler_timeout(
+            [10, 20], njobs=4, factor=0, min_timeout=0))
+
+    def test_kill_stragglers(self):
+        """ a job taking far longer than the others is killed, and gets
+        return code 4
+        """
+        pool = multiprocessing.Pool(processes=3)
+        manager = multiprocessing.Manager()
+        job_status = manager.dict()
+        cmd_lists = [["sleep 0.2"], ["sleep 0.3"], ["true", "sleep 60"]]
+        results = [pool.apply_async(subprocess_run_list_watched, (cmds,),
+                                    {"poll": .05, "job_status": job_status,
+                                     "job_key": i})
+                   for i, cmds in enumerate(cmd_lists)]
+        pool.close()
+        t0 = time.time()
+        results = wait_for_pool_results(
+            async_results=results, job_keys=[0, 1, 2], job_status=job_status,
+            straggler_factor=2, min_timeout=1, poll=.05, logger=logger)
+        pool.join()
+        manager.shutdown()
+        self.assertLess(time.time() - t0, 30)
+        self.assertEqual([x["returncode"] for x in results], [0, 0, 4])
+
+    def test_get_flank_depths(self):
+        """ mean depth over each end of a small reference
+        """
+        bam = os.path.join(self.test_dir, "flanks.bam")
+        header = {"HD": {"VN": "1.0", "SO": "coordinate"},
+                  "SQ": [{"LN": 1000, "SN": "contig"}]}
+        with pysam.AlignmentFile(bam, "wb", header=header) as outf:
+            # two reads over the first 100bp, one over the last 100
+            for idx, start in enumerate([0, 0, 900]):
+                read = pysam.AlignedSegment()
+                read.query_name = "read%i" % idx
+                read.query_sequence = "A" * 100
+                read.flag = 0
+                read.reference_id = 0
+                read.reference_start = start
+                read.mapping_quality = 60
+                read.cigar = [(0, 100)]
+                read.query_qualities = pysam.qualitystring_to_array("I" * 100)
+                outf.write(read)
+        pysam.index(bam)
+        self.assertEqual(get_flank_depths(bam, flank=100), (2.0, 1.0))
+        self.assertEqual(get_flank_depths(bam, flank=200), (1.0, 0.5))
+        for f in [bam, bam + ".bai"]:
+            os.unlink(f)
+
+    def test_mapping_stats(self):
+        """ one pass gives flagstat counts, and per-region tallies that
+        match what samtools view would extract
+        """
+        inbam = os.path.join(self.ref_dir, "samtools_depth_test_files",
+                             "newref_sorted.bam")
+        merged = os.path.join(self.test_dir, "stats_merged.bam")
+        with pysam.AlignmentFile(inbam, "rb") as bam:
+            reads = list(bam.fetch(until_eof=True))
+            ref = bam.get_reference_name(
+                [x for x in reads if x.reference_id >= 0][0].reference_id)
+            reflen = bam.get_reference_length(ref)
+        regions = [(1, ref, 1, reflen // 2), (2, ref, reflen // 2, reflen),
+                   (3, "not_a_contig", 1, 100)]
+        stats = merge_filter_bams(inbams=[inbam], outbam=merged, score=30,
+                                  labels=["pe"], regions=regions,
+                                  logger=logger)
+        flags = [x.flag for x in reads]
+        self.assertEqual(stats.counts["secondary"],
+                         len([x for x in flags if x & 0x100]))
+        self.assertEqual(stats.counts["paired"],
+                         len([x for x in flags if x & 0x1 and
+                              not x & 0x900]))
+        self.assertEqual(stats.libraries[0][0], "pe")
+        pysam.index(merged)
+        with pysam.AlignmentFile(merged, "rb") as bam:
+            for key, name, start, end in regions[0:2]:
+                in_region = [x for x in bam.fetch(ref, start - 1, end)]
+                self.assertEqual(stats.cluster_reads[str(key)],
+                                 len(in_region))
+                self.assertEqual(
+                    stats.score_list(cluster=key),
+                    sorted([x.get_tag("AS") for x in in_region]))
+        self.assertEqual(stats.cluster_reads["3"], 0)
+        outjson = os.path.join(self.test_dir, "stats.json")
+        stats.write(outjson)
+        loaded = MappingStats.load(outjson)
+        self.assertEqual(loaded.counts, stats.counts)
+        self.assertEqual(loaded.score_list(), stats.score_list())
+        self.assertEqual(loaded.score_list(cluster=2),
+                         stats.score_list(cluster=2))
+        self.assertEqual(loaded.insert_counts, stats.insert_counts)
+        for f in [merged, merged + ".bai", outjson]:
+            os.unlink(f)
+        # paired reads: a proper pair, and a read whose mate is unmapped
+        pairs = MappingStats(libraries=["pe"])
+        for flag, tlen in [(0x1 | 0x2 | 0x20 | 0x40, 300),
+                           (0x1 | 0x2 | 0x10 | 0x80, -300),
+                           (0x1 | 0x8 | 0x40, 0)]:
+            read = pysam.AlignedSegment()
+            read.flag = flag
+            read.reference_id = 0
+            read.next_reference_id = 0
+            read.template_length = tlen
+            pairs.add_read(read)
+        self.assertEqual(
+            [pairs.counts[x] for x in ["paired", "read1", "read2",
+                                       "properly_paired", "singletons",
+                                       "with_mate_mapped"]],
+            [3, 2, 1, 2, 1, 2])
+        self.assertEqual(pairs.mean_insert_size(), 300)
+
+    def test_dedup_bam(self):
+        """ position duplicates are collapsed to the best-quality copy
+        """
+        bam = os.path.join(self.test_dir, "dups.bam")
+        deduped = os.path.join(self.test_dir, "deduped.bam")
+        header = {"HD": {"VN": "1.0", "SO": "coordinate"},
+                  "SQ": [{"LN": 1000, "SN": "contig"}]}
+        # name, flag, start, cigar, mate start, quality
+        specs = [
+            # a pair and its duplicate, which has better quality
+            ("pairA", 0x1 | 0x2 | 0x20 | 0x40, 100, "50M", 300, "5"),
+            ("pairB", 0x1 | 0x2 | 0x20 | 0x40, 100, "50M", 300, "I"),
+            # same 5' end once the soft clipping is counted
+            ("single1", 0, 195, "5S45M", -1, "I"),
+            ("single2", 0, 190, "50M", -1, "5"),
+            # reverse strand, so not a duplicate of single2
+            ("single3", 0x10, 190, "50M", -1, "I"),
+            ("pairA", 0x1 | 0x2 | 0x10 | 0x80, 300, "50M", 100, "5"),
+            ("pairB", 0x1 | 0x2 | 0x10 | 0x80, 300, "50M", 100, "I"),
+            # unplaced and identical: only one is kept
+            ("unmapped1", 0x4, -1, None, -1, "I"),
+            ("unmapped2", 0x4, -1, None, -1, "I")]
+        with pysam.AlignmentFile(bam, "wb", header=header) as outf:
+            for name, flag, start, cigar, mstart, qual in specs:
+                read = pysam.AlignedSegment()
+                read.query_name = name
+                read.query_sequence = "ACGT" * 12 + "AC"
+                read.flag = flag
+                read.reference_id = 0 if start >= 0 else -1
+                read.reference_start = start
+                if cigar is not None:
+                    read.cigarstring = cigar
+                    read.mapping_quality = 60
+                if flag & 0x1:
+                    read.next_reference_id = 0
+                    read.next_reference_start = mstart
+                read.query_qualities = pysam.qualitystring_to_array(
+                    qual * 50)
+                outf.write(read)
+        self.assertEqual(dedup_bam(bam, deduped, logger=logger), (7, 4))
+        with pysam.AlignmentFile(deduped, "rb") as inf:
+            names = [x.query_name for x in inf.fetch(until_eof=True)]
+        self.assertEqual(names, ["pairB", "single1", "single3", "pairB",
+                                 "unmapped1"])
+        for f in [bam, deduped]:
+            os.unlink(f)
+
+    def test_check_fastqs_len_equal_read_store(self):
+        """ pairing is checked from the store's read counts
+        """
+        fqs = []
+        for name, nreads in [("r1.fq", 3), ("r2.fq", 2)]:
+            fqs.append(os.path.join(self.test_dir, name))
+            with open(fqs[-1], "w") as outf:
+                for i in range(nreads):
+                    outf.write("@r%i\nACGTN\n+\nIIIII\n" % i)
+        store_dir = os.path.join(self.test_dir, "read_store")
+        store = build_read_store(store_dir, [("readF", fqs[0]),
+                                             ("readR", fqs[0])])
+        check_fastqs_len_equal(None, None, read_store=store)
+        store = build_read_store(store_dir, [("readF", fqs[0]),
+                                             ("readR", fqs[1])])
+        with self.assertRaises(ValueError):
+            check_fastqs_len_equal(None, None, read_store=store)
+        shutil.rmtree(store_dir)
+        for f in fqs:
+            os.unlink(f)
+
+    def test_match_seed_library(self):
+        """ reads are matched on both flanks, one per cluster, in either
+        orientation
+        """
+        random.seed(37)
+        genome = "".join(random.choice("ACGT") for _ in range(12000))
+        rec = SeqRecord(Seq(genome), id="test")
+        clusters = []
+        for start, end in [(1000, 5000), (7000, 11000)]:
+            clusters.append(LociCluster(
+                sequence_id="test", loci_list=[], seq_record=rec,
+                global_start_coord=start, global_end_coord=end))
+        library = os.path.join(self.test_dir, "seed_library.fasta")
+        with open(library, "w") as outf:
+            # a read spanning only the 5' flank of the first cluster
+            outf.write(">partial\n%s\n" % genome[800:3000])
+            outf.write(">first\n%s\n" % genome[800:5200])
+            outf.write(">again\n%s\n" % genome[800:5200])
+            outf.write(">second\n%s\n" % str(
+                Seq(genome[6900:11100]).reverse_complement()))
+        records = read_seed_library(library)
+        self.assertEqual([x.id for x in records],
+                         ["partial", "first", "second"])
+        matches = match_seed_library(clusters, records, flank=500,
+                                     logger=logger)
+        self.assertEqual(matches[clusters[0].index][0].id, "first")
+        self.assertEqual(matches[clusters[1].index][0].id, "second")
+        self.assertAlmostEqual(matches[clusters[1].index][1], 1.0)
+        # without the second read, only the first cluster matches
+        matches = match_seed_library(clusters, records[0:2], flank=500,
+                                     logger=logger)
+        self.assertEqual(list(matches.keys()), [clusters[0].index])
+        os.unlink(library)
+
+    def test_predict_flank_depths(self):
+        """ depths estimated from k-mers track the real coverage
+        """
+        random.seed(38)
+        genome = "".join(random.choice("ACGT") for _ in range(12000))
+        rec = SeqRecord(Seq(genome), id="test")
+        clusters = []
+        for start, end in [(1000, 5000), (7000, 11000)]:
+            clusters.append(LociCluster(
+                sequence_id="test", loci_list=[], seq_record=rec,
+                global_start_coord=start, global_end_coord=end))
+        fastq = os.path.join(self.test_dir, "precheck.fq")
+        with open(fastq, "w") as outf:
+            # ~20x everywhere but the second cluster's 3' flank
+            for i in range(2400):
+                start = random.randint(0, len(genome) - 100)
+                if 10400 < start + 100 and start < 11000:
+                    continue
+                seq = genome[start: start + 100]
+                if i % 2:
+                    seq = str(Seq(seq).reverse_complement())
+                outf.write("@r%i\n%s\n+\n%s\n" % (i, seq, "I" * 100))
+        depths = predict_flank_depths(clusters, flank=500, fastqs=[fastq],
+                                      logger=logger)
+        self.assertEqual([x[0] for x in depths],
+                         [x.index for x in clusters])
+        for depth in [depths[0][1], depths[0][2], depths[1][1]]:
+            self.assertTrue(15 < depth < 25)
+        self.assertTrue(depths[1][2] < 1)
+        # a partial sample is scaled up to the whole file
+        sampled = predict_flank_depths(clusters, flank=500, fastqs=[fastq],
+                                       max_reads=1000, logger=logger)
+        self.assertTrue(10 < sampled[0][1] < 30)
+        os.unlink(fastq)
+
+    def test_keep_only_first_contig(self):
+        """ the first contig is kept and renamed, and its length is then
+        known without reading the file again
+        """
+        contigs = os.path.join(self.test_dir, "contigs.fasta")
+        with open(contigs, "w") as outf:
+            outf.write(">NODE_1_length_130_cov_5.2\n" + "ACGT" * 15 +
+                       "\n" + "ACGT" * 15 + "\nGGCCGGCCGG\n" +
+                       ">NODE_2_length_4\nTTTT\n")
+        meta = keep_only_first_contig(contigs, newname="seed")
+        rec = next(SeqIO.parse(contigs, "fasta"))
+        self.assertEqual(len(list(SeqIO.parse(contigs, "fasta"))), 1)
+        self.assertEqual((meta.id, meta.length),
+                         ("seed_length_130_cov_5.2", 130))
+        self.assertEqual((rec.id, len(rec)), (meta.id, meta.length))
+        parsed = seq_metadata.parsed
+        self.assertEqual(seq_metadata.get(contigs), meta)
+        self.assertEqual(seq_metadata.parsed, parsed)
+
+    def test_make_faux_genome_streamed(self):
+        """ contigs land at the coords given, and the .fai is usable
+        """
+        tmp_dir = tempfile.mkdtemp(dir=self.test_dir)
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        random.seed(45)
+        seqs = ["".join(random.choice("ACGT") for _ in range(x))
+                for x in [7023, 120, 6000]]
+        clusters = []
+        for idx, seq in enumerate(seqs):
+            clu = LociCluster(sequence_id="chrom", loci_list=[], mappings=[])
+            clu.keep_contigs = True
+            clu.continue_iterating = idx != 1
+            mapping = LociMapping(
+                name="test", iteration=1, assembly_subdir=tmp_dir,
+                mapping_subdir=os.path.join(tmp_dir, "faux_genome_%i" % idx))
+            mapping.assembled_contig = os.path.join(
+                mapping.mapping_subdir, "contigs.fasta")
+            with open(mapping.assembled_contig, "w") as outf:
+                outf.write(">NODE_1\n%s\n%s\n>NODE_2\nGGGG\n" %
+                           (seq[:2000], seq[2000:]))
+            clu.mappings.append(mapping)
+            clusters.append(clu)
+        path, length = make_faux_genome(
+            cluster_list=clusters, seedGenome=Namespace(name="faux"),
+            iteration=1, output_root=tmp_dir, nbuff=250,
+            logger=logger)
+        self.assertEqual(length, 7023 + 6000 + 3 * 250)
+        with pysam.FastaFile(path) as fasta:
+            self.assertEqual(fasta.get_reference_length("faux"), length)
+            for idx in [0, 2]:
+                clu = clusters[idx]
+                self.assertEqual(fasta.fetch("faux", clu.global_start_coord,
+                                             clu.global_end_coord),
+                                 seqs[idx])
+                self.assertEqual(clu.sequence_id, "faux")
+        self.assertEqual(clusters[1].sequence_id, "chrom")
+        # same wrapping as SeqIO, so biopython reads it the same
+        rec = next(SeqIO.parse(path, "fasta"))
+        self.assertEqual(str(rec.seq[250: 7273]), seqs[0])
+        with open(path + ".coords.tsv", "r") as inf:
+            self.assertEqual(inf.read().splitlines()[2].split("\t")[:3],
+                             [str(clusters[2].index), str(7023 + 500),
+                              str(length - 250)])
+        stats = MappingStats()
+        self.assertEqual(get_spacer_length(stats, readlen=100), 5000)
+        stats.insert_counts.update({300: 990, 350: 9, 2000: 1})
+        self.assertEqual(get_spacer_length(stats, readlen=100), 350)
+        self.assertEqual(get_spacer_length(stats, readlen=250), 500)
+
     def tearDown(self):
         """ delete temp files if no errors
         """
@@ -25,7 +25,7 @@ from riboSeed.riboSnag import parse_clustered_loci_file, \
     annotate_msa_conensus, plot_scatter_with_anno, get_all_kmers,\
     profile_kmer_occurances, plot_pairwise_least_squares, make_msa
 
-from riboSeed.riboSnag import LociCluster, Locus
+from riboSeed.riboSnag import LociCluster, Locus, ClusterRegistry
 
 
 sys.dont_write_bytecode = True
@@ -515,6 +515,38 @@ class riboSnag_TestCase(unittest.TestCase):
             self.assertEqual(df.as_matrix().tolist()[index],
                              sls_matrix[index])
 
+    def test_cluster_registry(self):
+        """ once registered, coords and flags live in the registry's arrays
+        """
+        clusters = [LociCluster(sequence_id="test", loci_list=[
+            Locus(index=i, sequence_id="test", locus_tag="tag%i_%i" % (c, i),
+                  start_coord=100 * c + i)
+            for i in range(c + 1)]) for c in range(3)]
+        clusters[1].global_start_coord = 40
+        registry = ClusterRegistry(clusters)
+        self.assertEqual(registry.global_start_coord.tolist(), [-1, 40, -1])
+        self.assertEqual(registry.start_coord.tolist(),
+                         [0, 100, 101, 200, 201, 202])
+        self.assertEqual(registry.locus_cluster.tolist(), [0, 1, 1, 2, 2, 2])
+        self.assertIsNone(clusters[0].global_start_coord)
+        self.assertIs(registry.loci_by_tag["tag2_1"], clusters[2].loci_list[1])
+        self.assertIs(registry.cluster(clusters[2].index), clusters[2])
+        # writes through the objects land in the arrays, and back
+        clusters[0].global_end_coord = 500
+        clusters[1].keep_contigs = False
+        clusters[2].loci_list[0].strand = -1
+        self.assertEqual(registry.global_end_coord[0], 500)
+        self.assertEqual(registry.strand[3], -1)
+        registry.continue_iterating[2] = False
+        self.assertFalse(clusters[2].continue_iterating)
+        self.assertEqual(registry.select(registry.active()), [clusters[0]])
+        self.assertIsNone(clusters[0].coverage_exclusion)
+        registry.record_depths(1, [(clusters[2].index, 3.0, 4.5)])
+        self.assertEqual(registry.depths.shape, (3, 2, 2))
+        self.assertEqual(registry.depths[2, 1].tolist(), [3.0, 4.5])
+        with self.assertRaises(AttributeError):
+            clusters[0].keep_contig = True
+
     def tearDown(self):
         """ delete temp files if no errors
         """
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import random
+import unittest
+
+import numpy as np
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboStats import get_contig_lengths, nx_stats, \
+    assembly_stats, write_stats_report
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboStatsTestCase(unittest.TestCase):
+    """ tests for riboStats.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboStats_tests")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        random.seed(34)
+        self.lens = [80403, 20106, 293, 1200, 600]
+        self.seqs = ["".join(random.choice("ACGT") for _ in range(x))
+                     for x in self.lens]
+        self.fasta = os.path.join(self.test_dir, "contigs.fasta")
+        with open(self.fasta, "w") as outf:
+            for idx, seq in enumerate(self.seqs):
+                outf.write(">NODE_%i\n" % idx)
+                # wrapped, with a short last line
+                for i in range(0, len(seq), 60):
+                    outf.write(seq[i: i + 60] + "\n")
+
+    def test_contig_lengths(self):
+        lengths, gc = get_contig_lengths(self.fasta)
+        self.assertEqual(lengths.tolist(), self.lens)
+        self.assertEqual(gc.tolist(), [x.count("G") + x.count("C")
+                                       for x in self.seqs])
+
+    def test_contig_lengths_crlf_unwrapped(self):
+        fasta = os.path.join(self.test_dir, "crlf.fasta")
+        with open(fasta, "w", newline="") as outf:
+            outf.write(">a\r\nACGTN\r\n>b\r\nGG")
+        lengths, gc = get_contig_lengths(fasta)
+        self.assertEqual(lengths.tolist(), [5, 2])
+        self.assertEqual(gc.tolist(), [2, 2])
+
+    def test_nx(self):
+        self.assertEqual(nx_stats(np.array([5, 3, 2]), 50), (5, 1))
+        self.assertEqual(nx_stats(np.array([2, 3, 5]), 75), (3, 2))
+        self.assertEqual(nx_stats(np.array([], dtype=int), 50), (0, 0))
+
+    def test_assembly_stats(self):
+        stats = dict(assembly_stats(self.fasta))
+        self.assertEqual(stats["# contigs (>= 0 bp)"], 5)
+        self.assertEqual(stats["# contigs (>= 1000 bp)"], 3)
+        self.assertEqual(stats["Total length (>= 0 bp)"], sum(self.lens))
+        self.assertEqual(stats["# contigs"], 4)
+        self.assertEqual(stats["Total length"], sum(self.lens) - 293)
+        self.assertEqual(stats["Largest contig"], 80403)
+        self.assertEqual((stats["N50"], stats["L50"]), (80403, 1))
+        self.assertEqual((stats["N75"], stats["L75"]), (80403, 1))
+
+    def test_write_report(self):
+        """ the report reads back like a QUAST report.tsv
+        """
+        outfile = os.path.join(self.test_dir, "stats.tsv")
+        lines = write_stats_report(
+            [assembly_stats(self.fasta), assembly_stats(self.fasta)],
+            names=["de_fere_novo", "de_novo"], outfile=outfile)
+        with open(outfile, "r") as inf:
+            self.assertEqual(inf.read().splitlines(), lines)
+        self.assertEqual(lines[0], "Assembly\tde_fere_novo\tde_novo")
+        self.assertIn("N50\t80403\t80403", lines)
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import unittest
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboToolchain import ToolchainManifest, cached_check, \
+    exe_stamp, open_toolchain_manifest
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+class riboToolchainTestCase(unittest.TestCase):
+    """ tests for riboToolchain.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboToolchain_tests")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.exe = os.path.join(self.test_dir, "fake_tool")
+        with open(self.exe, "w") as outf:
+            outf.write("#!/bin/sh\necho 'fake_tool 1.2'\n")
+        os.chmod(self.exe, 0o755)
+        self.manifest = os.path.join(self.test_dir, "cache", "manifest.json")
+        self.calls = 0
+
+    def check(self):
+        self.calls = self.calls + 1
+        return "1.2"
+
+    def test_check_cached_until_exe_changes(self):
+        for i in range(3):
+            self.assertEqual(cached_check(
+                ToolchainManifest(self.manifest, logger=logger), self.exe,
+                "version", self.check, logger=logger), "1.2")
+        self.assertEqual(self.calls, 1)
+        with open(self.exe, "a") as outf:
+            outf.write("# upgraded\n")
+        cached_check(ToolchainManifest(self.manifest), self.exe, "version",
+                     self.check)
+        self.assertEqual(self.calls, 2)
+        # a different check on the same exe is run separately
+        cached_check(ToolchainManifest(self.manifest), self.exe, "other",
+                     self.check)
+        self.assertEqual(self.calls, 3)
+        # failures are not recorded
+        with self.assertRaises(ValueError):
+            cached_check(ToolchainManifest(self.manifest), self.exe, "bad",
+                         lambda: int("x"))
+        self.assertIsNone(ToolchainManifest(self.manifest).get(
+            self.exe, "bad"))
+
+    def test_save_merges(self):
+        """ runs sharing a manifest dont lose each others' results
+        """
+        first = ToolchainManifest(self.manifest)
+        second = ToolchainManifest(self.manifest)
+        first.set(self.exe, "a", 1)
+        first.save()
+        second.set(self.exe, "b", 2)
+        second.save()
+        merged = ToolchainManifest(self.manifest)
+        self.assertEqual(merged.get(self.exe, "b"), 2)
+        self.assertEqual(
+            merged.entries[exe_stamp(self.exe)[0]]["checks"],
+            {"a": 1, "b": 2})
+        self.assertIsNone(merged.get(os.path.join(self.test_dir, "nope"),
+                                     "a"))
+
+    def test_manifest_opt_in(self):
+        """ without a path or $RIBOSEED_TOOLCHAIN_CACHE, nothing is
+        recorded and every check is run
+        """
+        saved = os.environ.pop("RIBOSEED_TOOLCHAIN_CACHE", None)
+        try:
+            self.assertIsNone(open_toolchain_manifest(logger=logger))
+            for i in range(2):
+                cached_check(open_toolchain_manifest(), self.exe,
+                             "version", self.check)
+            self.assertEqual(self.calls, 2)
+            os.environ["RIBOSEED_TOOLCHAIN_CACHE"] = self.manifest
+            self.assertEqual(open_toolchain_manifest().path, self.manifest)
+            self.assertEqual(open_toolchain_manifest("elsewhere").path,
+                             "elsewhere")
+        finally:
+            os.environ.pop("RIBOSEED_TOOLCHAIN_CACHE", None)
+            if saved is not None:
+                os.environ["RIBOSEED_TOOLCHAIN_CACHE"] = saved
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+@author: nicholas
+
+"""
+import sys
+import logging
+import shutil
+import os
+import unittest
+import multiprocessing
+import time
+
+# I hate this line but it works :(
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "riboSeed"))
+
+
+from riboSeed.riboWorker import make_queue_dirs, make_job_spec, submit_job, \
+    claim_job, run_job, worker_loop, wait_for_jobs, run_cmd_lists_on_queue, \
+    requeue_expired, complete_job
+
+
+sys.dont_write_bytecode = True
+
+logger = logging
+
+
+@unittest.skipIf(sys.platform == "win32",
+                 "job commands are run through the shell")
+class riboWorkerTestCase(unittest.TestCase):
+    """ tests for riboWorker.py
+    """
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "output_riboWorker_tests")
+        self.queue_dir = os.path.join(self.test_dir, "queue")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        make_queue_dirs(self.queue_dir)
+
+    def test_claim_only_once(self):
+        """ a pending job can only be claimed by one worker
+        """
+        submit_job(self.queue_dir, make_job_spec(
+            job_id="job_a", cmds=["true"]))
+        spec, running = claim_job(self.queue_dir)
+        self.assertEqual(spec["job_id"], "job_a")
+        self.assertTrue(os.path.exists(running))
+        self.assertEqual(claim_job(self.queue_dir), (None, None))
+
+    def test_no_resubmission(self):
+        """ job ids cannot be reused once a job is done
+        """
+        submit_job(self.queue_dir, make_job_spec(
+            job_id="job_b", cmds=["true"]))
+        worker_loop(self.queue_dir, worker_id="solo", poll=.05, max_jobs=1)
+        with self.assertRaises(ValueError):
+            submit_job(self.queue_dir, make_job_spec(
+                job_id="job_b", cmds=["true"]))
+
+    def test_run_job_missing_input(self):
+        """ jobs whose inputs are not visible fail without running
+        """
+        spec = make_job_spec(
+            job_id="job_c", cmds=["touch %s" % os.path.join(
+                self.test_dir, "should_not_exist")],
+            inputs=[os.path.join(self.test_dir, "not_a_file.bam")])
+        code, message = run_job(spec)
+        self.assertEqual(code, 1)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.test_dir, "should_not_exist")))
+
+    def test_several_local_workers(self):
+        """ several workers on one machine split the jobs between them,
+        and every job is run exactly once
+        """
+        cmd_lists = []
+        for i in range(8):
+            out = os.path.join(self.test_dir, "out_%i.txt" % i)
+            cmd_lists.append(["echo %i >> %s" % (i, out),
+                              "sleep 0.1"])
+        cmd_lists.append(["false"])
+        workers = [multiprocessing.Process(
+            target=worker_loop,
+            args=(self.queue_dir,),
+            kwargs={"worker_id": "w%i" % i, "poll": .05, "max_idle": 2})
+            for i in range(3)]
+        for w in workers:
+            w.start()
+        codes = run_cmd_lists_on_queue(
+            cmd_lists=cmd_lists, queue_dir=self.queue_dir,
+            job_prefix="test", poll=.05, timeout=60, logger=logger)
+        for w in workers:
+            w.join()
+        self.assertEqual(codes, [0] * 8 + [1])
+        for i in range(8):
+            with open(os.path.join(self.test_dir, "out_%i.txt" % i)) as inf:
+                self.assertEqual(inf.read(), "%i\n" % i)
+        self.assertEqual(
+            os.listdir(os.path.join(self.queue_dir, "pending")), [])
+        self.assertEqual(
+            os.listdir(os.path.join(self.queue_dir, "running")), [])
+
+    def test_wait_timeout(self):
+        """ unfinished jobs are left out when waiting times out
+        """
+        submit_job(self.queue_dir, make_job_spec(
+            job_id="job_d", cmds=["true"]))
+        finished = wait_for_jobs(self.queue_dir, ["job_d"], poll=.05,
+                                 timeout=.2, logger=logger)
+        self.assertEqual(finished, {})
+
+    def test_requeue_expired(self):
+        """ a claimed job whose worker stops touching it goes back to
+        pending once its lease runs out, and the dead worker cannot
+        complete it afterwards
+        """
+        submit_job(self.queue_dir, make_job_spec(
+            job_id="job_e", cmds=["true"], lease=.2))
+        spec, running = claim_job(self.queue_dir, worker_id="dead")
+        self.assertEqual(requeue_expired(self.queue_dir), [])
+        time.sleep(.3)
+        self.assertEqual(requeue_expired(self.queue_dir), ["job_e"])
+        self.assertFalse(complete_job(self.queue_dir, spec, running, 0, "",
+                                      "dead", 1))
+        self.assertEqual(worker_loop(self.queue_dir, worker_id="alive",
+                                     poll=.05, max_jobs=1), 1)
+        self.assertEqual(wait_for_jobs(self.queue_dir, ["job_e"], poll=.05,
+                                       timeout=5)["job_e"]["worker"],
+                         "alive")
+
+    def test_heartbeat_keeps_lease(self):
+        """ a job running for longer than its lease is not requeued
+        while its worker is alive
+        """
+        submit_job(self.queue_dir, make_job_spec(
+            job_id="job_f", cmds=["sleep 1"], lease=.2))
+        worker = multiprocessing.Process(
+            target=worker_loop, args=(self.queue_dir,),
+            kwargs={"worker_id": "slow", "poll": .05, "max_jobs": 1})
+        worker.start()
+        finished = wait_for_jobs(self.queue_dir, ["job_f"], poll=.05,
+                                 timeout=10)
+        worker.join()
+        self.assertEqual(finished["job_f"]["returncode"], 0)
+        self.assertEqual(finished["job_f"]["worker"], "slow")
+
+    def test_straggler_cancelled(self):
+        """ once half the jobs are done, a job running far longer than
+        the others is cancelled, and its worker kills it
+        """
+        marker = os.path.join(self.test_dir, "straggler_done")
+        workers = [multiprocessing.Process(
+            target=worker_loop, args=(self.queue_dir,),
+            kwargs={"worker_id": "w%i" % i, "poll": .05, "max_idle": 2})
+            for i in range(2)]
+        for w in workers:
+            w.start()
+        codes = run_cmd_lists_on_queue(
+            cmd_lists=[["true"], ["sleep 30 && touch %s" % marker]],
+            queue_dir=self.queue_dir, job_prefix="strag", poll=.05,
+            lease=.4, straggler_factor=2, min_timeout=.5, timeout=20,
+            logger=logger)
+        for w in workers:
+            w.join()
+        self.assertEqual(codes, [0, 4])
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(
+            os.listdir(os.path.join(self.queue_dir, "running")), [])
+
+    def test_run_job_oom_retry(self):
+        """ jobs get the memory watchdog's out-of-memory retries
+        """
+        fake = os.path.join(self.test_dir, "spades.py")
+        with open(fake, "w") as outf:
+            outf.write("#!/bin/sh\n" +
+                       "case \"$*\" in *'-t 4'*) exit 137;; esac\n")
+        os.chmod(fake, 0o755)
+        spec = make_job_spec(job_id="job_g", cmds=["%s -t 4" % fake],
+                             oom_retries=1)
+        self.assertEqual(run_job(spec), (0, ""))
+
+    def tearDown(self):
+        """
+        """
+        shutil.rmtree(self.test_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()